@@ -65,8 +65,10 @@ defaults= {
     'VISIONEGG_LOG_FILE':             'VisionEgg.log',
     'VISIONEGG_LOG_TO_STDERR':        1,
     'VISIONEGG_MAXPRIORITY':          0,
+    'VISIONEGG_MIPMAP_BUILDER':       'auto', # also 'opengl','box','lanczos'
     'VISIONEGG_MONITOR_REFRESH_HZ':   60.0,
     'VISIONEGG_MULTISAMPLE_SAMPLES':  0,
+    'VISIONEGG_OFFSCREEN_BACKEND':    'none', # also 'egl' or 'osmesa'
     'VISIONEGG_PREFERRED_BPP':        32,
     'VISIONEGG_REQUEST_ALPHA_BITS':   8,
     'VISIONEGG_REQUEST_BLUE_BITS':    8,
@@ -76,6 +78,9 @@ defaults= {
     'VISIONEGG_SCREEN_W':             640,
     'VISIONEGG_SCREEN_H':             480,
     'VISIONEGG_SYNC_SWAP':            1,
+    'VISIONEGG_TEXTURE_MEMORY_MB':    0.0, # 0 means no budget
+    'VISIONEGG_TEXTURE_UPLOAD_FORMAT':'auto', # also 'RGB','RGBA','BGRA','BGRA_REV'
+    'VISIONEGG_TIME_SOURCE':          'monotonic', # also 'wall'
     'VISIONEGG_TKINTER_OK':           1,
     'SYNCLYNC_PRESENT':               0,
     }
@@ -22,7 +22,9 @@ This module contains the architectural foundations of the Vision Egg.
 ####################################################################
 
 import sys, types, math, time, os               # standard Python modules
+import bisect
 import StringIO
+import threading, Queue, ctypes
 
 import logging                                  # available in Python 2.3
 
@@ -37,6 +39,11 @@ import pygame.locals
 import pygame.display
 
 import VisionEgg.GL as gl # get all OpenGL stuff in one namespace
+try:
+    # Does not convert or allocate, so can read into a pixel buffer object
+    from OpenGL.raw.GL.VERSION.GL_1_0 import glReadPixels as _raw_glReadPixels
+except ImportError:
+    _raw_glReadPixels = gl.glReadPixels
 
 import numpy
 import numpy as np
@@ -49,9 +56,13 @@ except NameError:
     def sum( values ):
         return reduce(operator.add, values )
 
+_swap_buffers_func = pygame.display.flip # replaced by OffscreenScreen
+
 def swap_buffers():
     VisionEgg.config._FRAMECOUNT_ABSOLUTE += 1
-    return pygame.display.flip()
+    result = _swap_buffers_func()
+    refresh_estimator.add_swap_time(VisionEgg.time_func())
+    return result
 
 class PygameKeeper(object):
     """global object that calls any cleanup functions when quitting pygame"""
@@ -460,12 +471,7 @@ class Screen(VisionEgg.ClassWithParameters):
         if size is None:
             size = self.size
         lowerleft = VisionEgg._get_lowerleft(position,anchor,size)
-        if buffer == 'front':
-            gl.glReadBuffer( gl.GL_FRONT )
-        elif buffer == 'back':
-            gl.glReadBuffer( gl.GL_BACK )
-        else:
-            raise ValueError('No support for "%s" framebuffer'%buffer)
+        gl.glReadBuffer( self._get_gl_read_buffer(buffer) )
 
         framebuffer_pixels = gl.glReadPixels(lowerleft[0],lowerleft[1],
                                              size[0],size[1],
@@ -494,6 +500,15 @@ class Screen(VisionEgg.ClassWithParameters):
             raise NotImplementedError("Only RGB and RGBA formats currently supported")
         return fb_array
 
+    def _get_gl_read_buffer(self,buffer):
+        """Return the OpenGL buffer to read for 'front' or 'back'."""
+        if buffer == 'front':
+            return gl.GL_FRONT
+        elif buffer == 'back':
+            return gl.GL_BACK
+        else:
+            raise ValueError('No support for "%s" framebuffer'%buffer)
+
     def put_pixels(self,
                    pixels=None,
                    position=(0,0),
@@ -503,6 +518,7 @@ class Screen(VisionEgg.ClassWithParameters):
                    texture_min_filter=gl.GL_NEAREST, # only used if scale < 1.0
                    texture_mag_filter=gl.GL_NEAREST, # only used if scale > 1.0
                    internal_format=gl.GL_RGB, # pixel data converted to this format in texture (gl.GL_RGBA also useful)
+                   num_pixel_buffers=0, # stream pixels through this many pixel buffer objects
                    ):
         """Put pixel values to screen.
 
@@ -510,46 +526,66 @@ class Screen(VisionEgg.ClassWithParameters):
         module.  Any source of texture data accepted by that module is
         accepted here.
 
-        This function could be sped up by allocating a fixed OpenGL texture object.
-
+        The first call allocates an OpenGL texture as large as the
+        screen (or the pixels, if larger), and later calls put the
+        pixels into it with put_sub_image(), so that showing a new
+        image every frame is fast.  A new texture is allocated only if
+        larger pixels or another internal_format or
+        num_pixel_buffers is given.  If num_pixel_buffers is not 0,
+        the pixels are streamed through that many pixel buffer objects
+        (see TextureObject.set_num_pixel_buffers()).
         """
 
         import VisionEgg.Textures # import here to avoid import loop
+        if pixels is None:
+            pixels = VisionEgg.Textures.Texture().texels # blank white
+        pixels = VisionEgg.Textures.convert_to_numpy_if_array(pixels)
+        width, height = VisionEgg.Textures.get_texels_size(pixels)
+
         make_new_texture_object = 0
         if not hasattr(self, "_put_pixels_texture_stimulus"):
             make_new_texture_object = 1
         else:
-            if internal_format != self._put_pixels_texture_stimulus.constant_parameters.internal_format:
+            t = self._put_pixels_texture_stimulus
+            texture_size = t.parameters.texture.size
+            if (internal_format != t.constant_parameters.internal_format or
+                num_pixel_buffers != t.constant_parameters.num_pixel_buffers or
+                width > texture_size[0] or height > texture_size[1]):
                 make_new_texture_object = 1
         if make_new_texture_object:
-            # For speed, don't do this on anything other than 1st run
-            texture = VisionEgg.Textures.Texture(pixels)
-            on_screen_size = (texture.size[0]*scale_x, texture.size[1]*scale_y)
+            # Allocate a texture to put all later pixels into.
+            if internal_format == gl.GL_RGBA:
+                num_components = 4
+            else:
+                num_components = 3
+            texture = VisionEgg.Textures.SubImageTexture(
+                (max(width,self.size[0]),max(height,self.size[1])),
+                num_components)
             t = VisionEgg.Textures.TextureStimulus(texture=texture,
-                                                   position=position,
-                                                   anchor=anchor,
-                                                   size=on_screen_size,
                                                    mipmaps_enabled=0,
-                                                   texture_min_filter=texture_min_filter,
-                                                   texture_mag_filter=texture_mag_filter,
                                                    internal_format = internal_format,
+                                                   num_pixel_buffers = num_pixel_buffers,
                                                    )
             self._put_pixels_texture_stimulus = t # rename
+        if not hasattr(self, "_pixel_coord_projection"):
             self._pixel_coord_projection = OrthographicProjection(left=0,
                                                                   right=self.size[0],
                                                                   bottom=0,
                                                                   top=self.size[1],
                                                                   z_clip_near=0.0,
                                                                   z_clip_far=1.0)
-        else:
-            # We've run once before and therefore already have a
-            # texture stimulus. (XXX In the future, make use of
-            # already assigned texture object and use put_sub_image
-            # for speed.)
-            self._put_pixels_texture_stimulus.parameters.texture = VisionEgg.Textures.Texture(pixels)
+
+        t = self._put_pixels_texture_stimulus
+        t.parameters.texture.set_sub_image(pixels) # put when drawn
+        p = t.parameters
+        p.position = position
+        p.anchor = anchor
+        p.size = (width*scale_x, height*scale_y)
+        p.texture_min_filter = texture_min_filter
+        p.texture_mag_filter = texture_mag_filter
 
         self._pixel_coord_projection.push_and_set_gl_projection() # Save projection
-        self._put_pixels_texture_stimulus.draw() # Draw pixels as texture
+        t.draw() # Draw pixels as texture
 
         gl.glMatrixMode(gl.GL_PROJECTION) # Restore projection
         gl.glPopMatrix()
@@ -558,7 +594,12 @@ class Screen(VisionEgg.ClassWithParameters):
         return VisionEgg.PlatformDependent.query_refresh_rate(self)
 
     def measure_refresh_rate(self,average_over_seconds=0.1):
-        """Measure the refresh rate. Assumes swap buffers synced."""
+        """Measure the refresh rate. Assumes swap buffers synced.
+
+        Swaps buffers for average_over_seconds.  The continuously
+        updated estimate of refresh_estimator, which this also feeds,
+        is returned when available, so that dropped frames do not bias
+        the result.  See also get_refresh_rate_estimate()."""
         start_time = VisionEgg.time_func()
         duration_sec = 0.0
         num_frames = 0
@@ -567,12 +608,22 @@ class Screen(VisionEgg.ClassWithParameters):
             now = VisionEgg.time_func()
             num_frames += 1
             duration_sec = now - start_time
+        estimate = refresh_estimator.get_refresh_rate_hz()
+        if estimate is not None:
+            return estimate
         if duration_sec > 0.0:
             fps = num_frames / duration_sec
         else:
             fps = 0.0
         return fps
 
+    def get_refresh_rate_estimate(self):
+        """Return refresh rate (Hz) estimated from buffer swaps so far.
+
+        Unlike measure_refresh_rate(), this does not draw anything.
+        Returns None until enough buffer swaps have been seen."""
+        return refresh_estimator.get_refresh_rate_hz()
+
     def clear(self):
         """Called by Presentation instance. Clear the screen."""
 
@@ -643,9 +694,16 @@ class Screen(VisionEgg.ClassWithParameters):
         default screen parameters should are determined.  If this
         value is 0, the values from VisionEgg.cfg are used.  If this
         value is 1, a GUI panel is opened and allows manual settings
-        of the screen parameters.  """
+        of the screen parameters.
+
+        If VisionEgg.config.VISIONEGG_OFFSCREEN_BACKEND is not 'none',
+        an instance of OffscreenScreen is returned instead.  """
 
         global VisionEgg # Allow "VisionEgg.config" instead of just "config"
+        if VisionEgg.config.VISIONEGG_OFFSCREEN_BACKEND.lower() != 'none':
+            return OffscreenScreen(size=(VisionEgg.config.VISIONEGG_SCREEN_W,
+                                         VisionEgg.config.VISIONEGG_SCREEN_H),
+                                   bgcolor=(0.5,0.5,0.5,0.0))
         if VisionEgg.config.VISIONEGG_GUI_INIT:
             import VisionEgg.GUI # Could import in beginning, but no need if not using GUI
             window = VisionEgg.GUI.GraphicsConfigurationWindow()
@@ -736,10 +794,496 @@ class Screen(VisionEgg.ClassWithParameters):
         red, green, blue = zip(*gamma_values)
         return red,green,blue
 
+class OffscreenScreen(Screen):
+    """An OpenGL context without a window, for rendering without a display.
+
+    Drawing happens in an offscreen framebuffer of the given size
+    which can be read with get_framebuffer_as_array() or
+    get_framebuffer_as_image().  Otherwise, an OffscreenScreen is used
+    just like a Screen: viewports, stimuli and
+    VisionEgg.FlowControl.Presentation work unchanged.  Buffer swaps
+    only flush the OpenGL command stream, so frames are drawn as fast
+    as possible and the framebuffer keeps the last frame drawn.
+
+    Two OpenGL implementations are supported: 'egl' (an EGL pbuffer,
+    using Mesa's surfaceless platform unless EGL_PLATFORM is set) and
+    'osmesa' (Mesa's off-screen rendering library).  PyOpenGL chooses
+    its platform when first imported, so set
+    VISIONEGG_OFFSCREEN_BACKEND (or PYOPENGL_PLATFORM) before
+    importing VisionEgg.Core.
+
+    pygame is initialized with SDL's dummy video driver (unless
+    SDL_VIDEODRIVER is set), so checking for events returns no events.
+
+    There is only one offscreen buffer, so reading the 'front' or
+    'back' buffer gives the same pixels.
+
+    Of the constant parameters of Screen, only size, double_buffer
+    (always false for 'osmesa'), the bit depths and
+    multisample_samples are used.
+
+    Parameters
+    ==========
+    bgcolor -- background color (AnyOf(Sequence3 of Real or Sequence4 of Real))
+               Default: (0.5, 0.5, 0.5, 0.0)
+
+    Constant Parameters
+    ===================
+    offscreen_backend -- 'egl' or 'osmesa'. Can be set with VISIONEGG_OFFSCREEN_BACKEND (String)
+                         Default: (determined at runtime)
+    (and the constant parameters of Screen)
+    """
+
+    constant_parameters_and_defaults = VisionEgg.ParameterDefinition({
+        'offscreen_backend':(None,
+                             ve_types.String,
+                             "'egl' or 'osmesa'. Can be set with VISIONEGG_OFFSCREEN_BACKEND"),
+        })
+
+    __slots__ = (
+        '_offscreen_context',
+        '_offscreen_read_buffer',
+        )
+
+    def __init__(self,**kw):
+        logger = logging.getLogger('VisionEgg.Core')
+
+        VisionEgg.ClassWithParameters.__init__(self,**kw)
+
+        cp = self.constant_parameters # shorthand
+        if cp.size is None:
+            cp.size = (VisionEgg.config.VISIONEGG_SCREEN_W,
+                       VisionEgg.config.VISIONEGG_SCREEN_H)
+        if cp.double_buffer is None:
+            cp.double_buffer = VisionEgg.config.VISIONEGG_DOUBLE_BUFFER
+        if cp.red_bits is None:
+            cp.red_bits = VisionEgg.config.VISIONEGG_REQUEST_RED_BITS
+        if cp.green_bits is None:
+            cp.green_bits = VisionEgg.config.VISIONEGG_REQUEST_GREEN_BITS
+        if cp.blue_bits is None:
+            cp.blue_bits = VisionEgg.config.VISIONEGG_REQUEST_BLUE_BITS
+        if cp.alpha_bits is None:
+            cp.alpha_bits = VisionEgg.config.VISIONEGG_REQUEST_ALPHA_BITS
+        if cp.multisample_samples is None:
+            cp.multisample_samples = VisionEgg.config.VISIONEGG_MULTISAMPLE_SAMPLES
+        cp.fullscreen = False
+        cp.frameless = True
+        cp.hide_mouse = False
+        cp.maxpriority = False
+        cp.sync_swap = False
+        cp.is_stereo = False
+
+        import OpenGL.platform
+        platform_name = OpenGL.platform.PLATFORM.__class__.__name__
+        if cp.offscreen_backend is None:
+            cp.offscreen_backend = VisionEgg.config.VISIONEGG_OFFSCREEN_BACKEND.lower()
+            if cp.offscreen_backend == 'none':
+                if platform_name == 'OSMesaPlatform':
+                    cp.offscreen_backend = 'osmesa'
+                else:
+                    cp.offscreen_backend = 'egl'
+        if cp.offscreen_backend not in ('egl','osmesa'):
+            raise ValueError("offscreen_backend must be 'egl' or 'osmesa', not %s"%
+                             repr(cp.offscreen_backend))
+        required_platform = {'egl':'EGLPlatform',
+                             'osmesa':'OSMesaPlatform'}[cp.offscreen_backend]
+        if platform_name != required_platform:
+            raise RuntimeError("PyOpenGL was imported for %s, but offscreen "
+                               "rendering with %s needs %s. Set "
+                               "VISIONEGG_OFFSCREEN_BACKEND=%s before "
+                               "importing VisionEgg.Core."%(
+                platform_name,cp.offscreen_backend,required_platform,
+                cp.offscreen_backend))
+
+        VisionEgg.config._SYNCLYNC_CONNECTION = None
+
+        width, height = int(cp.size[0]), int(cp.size[1])
+        logger.info("Requesting offscreen %s framebuffer %d x %d "
+                    "(%d %d %d %d RGBA)."%(cp.offscreen_backend,width,height,
+                                           cp.red_bits,cp.green_bits,
+                                           cp.blue_bits,cp.alpha_bits))
+        if cp.offscreen_backend == 'egl':
+            self._offscreen_context = self.__create_egl_context(width,height)
+        else:
+            cp.double_buffer = False
+            self._offscreen_context = self.__create_osmesa_context(width,height)
+        # A pbuffer has only a back buffer, OSMesa only a front buffer.
+        if cp.double_buffer:
+            self._offscreen_read_buffer = 'back'
+        else:
+            self._offscreen_read_buffer = 'front'
+
+        # Events and the mouse are read through pygame, even without a window.
+        # SDL's signal handlers would turn SIGINT and SIGTERM into
+        # pygame.QUIT events, so that batch jobs could not be stopped.
+        if not pygame.display.get_init():
+            os.environ.setdefault('SDL_VIDEODRIVER','dummy')
+            os.environ.setdefault('SDL_NO_SIGNAL_HANDLERS','1')
+            pygame.display.init()
+
+        global _swap_buffers_func
+        _swap_buffers_func = gl.glFlush
+
+        global gl_vendor, gl_renderer, gl_version
+        gl_vendor = gl.glGetString(gl.GL_VENDOR)
+        gl_renderer = gl.glGetString(gl.GL_RENDERER)
+        gl_version = gl.glGetString(gl.GL_VERSION)
+
+        logger.info("OpenGL %s, %s, %s (PyOpenGL %s)"%
+                    (gl_version, gl_renderer, gl_vendor, gl.__version__))
+
+        cp.red_bits = gl.glGetIntegerv(gl.GL_RED_BITS)
+        cp.green_bits = gl.glGetIntegerv(gl.GL_GREEN_BITS)
+        cp.blue_bits = gl.glGetIntegerv(gl.GL_BLUE_BITS)
+        cp.alpha_bits = gl.glGetIntegerv(gl.GL_ALPHA_BITS)
+        logger.info("Offscreen framebuffer has %d %d %d %d RGBA bits."%(
+            cp.red_bits,cp.green_bits,cp.blue_bits,cp.alpha_bits))
+
+        # Check previously made OpenGL assumptions now that we have OpenGL context
+        post_gl_init()
+
+        if hasattr(VisionEgg.config,'_open_screens'):
+            VisionEgg.config._open_screens.append(self)
+        else:
+            VisionEgg.config._open_screens = [self]
+
+    def __create_egl_context(self,width,height):
+        cp = self.constant_parameters # shorthand
+        # Without a display, use Mesa's surfaceless platform.
+        os.environ.setdefault('EGL_PLATFORM','surfaceless')
+        from OpenGL import EGL
+        import ctypes
+        display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(display,ctypes.pointer(major),ctypes.pointer(minor)):
+            raise RuntimeError("Could not initialize EGL display")
+        attribs = [EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                   EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                   EGL.EGL_RED_SIZE, cp.red_bits,
+                   EGL.EGL_GREEN_SIZE, cp.green_bits,
+                   EGL.EGL_BLUE_SIZE, cp.blue_bits,
+                   EGL.EGL_ALPHA_SIZE, cp.alpha_bits,
+                   EGL.EGL_DEPTH_SIZE, 24]
+        if cp.multisample_samples > 0:
+            attribs.extend([EGL.EGL_SAMPLE_BUFFERS, 1,
+                            EGL.EGL_SAMPLES, cp.multisample_samples])
+        attribs.append(EGL.EGL_NONE)
+        configs = (EGL.EGLConfig*64)()
+        num_configs = EGL.EGLint()
+        if not EGL.eglChooseConfig(display,(EGL.EGLint*len(attribs))(*attribs),
+                                   configs,len(configs),
+                                   ctypes.pointer(num_configs)) or num_configs.value < 1:
+            raise RuntimeError("No EGL configuration supports the requested "
+                               "offscreen framebuffer")
+        # EGL sorts deeper framebuffers first, prefer the requested depth.
+        config = configs[0]
+        requested = (cp.red_bits,cp.green_bits,cp.blue_bits,cp.alpha_bits)
+        for i in range(num_configs.value):
+            bits = []
+            for attrib in (EGL.EGL_RED_SIZE,EGL.EGL_GREEN_SIZE,
+                           EGL.EGL_BLUE_SIZE,EGL.EGL_ALPHA_SIZE):
+                value = EGL.EGLint()
+                EGL.eglGetConfigAttrib(display,configs[i],attrib,ctypes.pointer(value))
+                bits.append(value.value)
+            if tuple(bits) == requested:
+                config = configs[i]
+                break
+        surface_attribs = [EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE]
+        surface = EGL.eglCreatePbufferSurface(display,config,
+                                              (EGL.EGLint*len(surface_attribs))(*surface_attribs))
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        context = EGL.eglCreateContext(display,config,EGL.EGL_NO_CONTEXT,None)
+        if not EGL.eglMakeCurrent(display,surface,surface,context):
+            raise RuntimeError("Could not make EGL context current")
+        logger = logging.getLogger('VisionEgg.Core')
+        logger.info("EGL %d.%d, %s"%(major.value,minor.value,
+                                      EGL.eglQueryString(display,EGL.EGL_VENDOR)))
+        return (display,surface,context)
+
+    def __create_osmesa_context(self,width,height):
+        cp = self.constant_parameters # shorthand
+        from OpenGL import osmesa
+        context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA,24,0,0,None)
+        if not context:
+            raise RuntimeError("Could not create OSMesa context")
+        buffer = np.zeros((height,width,4),dtype=np.uint8)
+        if not osmesa.OSMesaMakeCurrent(context,buffer,gl.GL_UNSIGNED_BYTE,width,height):
+            raise RuntimeError("Could not make OSMesa context current")
+        # The default is to flip the image (y = 0 at the top).
+        osmesa.OSMesaPixelStore(osmesa.OSMESA_Y_UP,1)
+        return (context,buffer)
+
+    def _get_gl_read_buffer(self,buffer):
+        """There is only one offscreen buffer, used for 'front' and 'back'."""
+        if buffer not in ('front','back'):
+            raise ValueError('No support for "%s" framebuffer'%buffer)
+        return Screen._get_gl_read_buffer(self,self._offscreen_read_buffer)
+
+    def query_refresh_rate(self):
+        """There is no refresh rate, return VISIONEGG_MONITOR_REFRESH_HZ."""
+        return VisionEgg.config.VISIONEGG_MONITOR_REFRESH_HZ
+
+    def set_gamma_ramp(self,*args,**kw):
+        """Gamma ramps are not supported offscreen.  Returns False."""
+        logger = logging.getLogger('VisionEgg.Core')
+        logger.error("set_gamma_ramp not supported by OffscreenScreen")
+        return False
+
+    def close(self):
+        """Close the screen and destroy the OpenGL context."""
+        global _swap_buffers_func
+        if hasattr(VisionEgg.config,'_open_screens'):
+            if self in VisionEgg.config._open_screens:
+                VisionEgg.config._open_screens.remove(self)
+        if not hasattr(self,'_offscreen_context'):
+            return
+        if self.constant_parameters.offscreen_backend == 'egl':
+            from OpenGL import EGL
+            display, surface, context = self._offscreen_context
+            EGL.eglMakeCurrent(display,EGL.EGL_NO_SURFACE,EGL.EGL_NO_SURFACE,
+                               EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroySurface(display,surface)
+            EGL.eglDestroyContext(display,context)
+        else:
+            from OpenGL import osmesa
+            context, buffer = self._offscreen_context
+            osmesa.OSMesaDestroyContext(context)
+        del self._offscreen_context
+        _swap_buffers_func = pygame.display.flip
+        if len(getattr(VisionEgg.config,'_open_screens',[])) == 0:
+            pygame_keeper.quit()
+
+    def __del__(self):
+        if hasattr(self,'_offscreen_context'):
+            try:
+                self.close()
+            except Exception:
+                pass
+
 def get_default_screen():
     """Make an instance of Screen using a GUI window or from config file."""
     return Screen.create_default()
 
+def _get_gl_version_tuple():
+    """Return the OpenGL version as (major, minor). Requires OpenGL context.
+
+    The version string starts with "major.minor" and may be preceded
+    by other words, as in "OpenGL ES 3.2".  (0, 0) is returned if no
+    version number is found."""
+    version = gl.glGetString(gl.GL_VERSION)
+    if version is None:
+        return (0, 0)
+    for word in version.split():
+        numbers = word.split('.')
+        if len(numbers) >= 2 and numbers[0].isdigit():
+            minor = ''
+            for char in numbers[1]:
+                if not char.isdigit():
+                    break
+                minor = minor + char
+            if minor:
+                return (int(numbers[0]), int(minor))
+    return (0, 0)
+
+def _pixel_buffer_objects_supported():
+    """Can glReadPixels write to a buffer object? Requires OpenGL context."""
+    if _get_gl_version_tuple() >= (2, 1):
+        return True
+    extensions = gl.glGetString(gl.GL_EXTENSIONS)
+    return extensions is not None and 'GL_ARB_pixel_buffer_object' in extensions.split()
+
+class FramebufferCapture:
+    """Read frames from the framebuffer and encode them in the background.
+
+    Call capture() once per frame, after the viewports are drawn and
+    before swap_buffers().  capture() starts reading the framebuffer
+    into one of num_pixel_buffers OpenGL pixel buffer objects and
+    returns without waiting.  Once all pixel buffers are in use, the
+    oldest one, read num_pixel_buffers-1 frames earlier, is copied
+    into a preallocated array and queued for encoding.  If pixel
+    buffer objects are not supported (they need OpenGL 2.1 or
+    GL_ARB_pixel_buffer_object) or num_pixel_buffers is 0, the pixels
+    are read directly into the array, which waits for drawing to
+    finish.
+
+    num_workers threads call encode_func(frame_number, array) for
+    each frame, where array has shape (height,width,3) for GL_RGB or
+    (height,width,4) for GL_RGBA with the top row first.  If
+    capture() was given frame_info, encode_func(frame_number, array,
+    frame_info) is called instead.  Frames may be encoded out of
+    order.  The array is reused after encode_func
+    returns, so copy it to keep it.  At most max_queued_frames frames
+    wait to be encoded.  When the queue is full, capture() waits for
+    the workers, so frames are delayed rather than dropped.  The time
+    spent waiting is reported by close().
+
+    If encode_func raises an exception, no more frames are encoded
+    and the exception is raised again by the next call to capture()
+    or close().  Call close() when done to encode the remaining
+    frames.
+
+    Public variables
+    ================
+    num_frames -- number of frames captured
+    wait_sec   -- total time capture() waited for the encoding workers
+    use_pixel_buffers -- whether pixel buffer objects are used
+    """
+    def __init__(self,
+                 screen,
+                 encode_func,
+                 format=gl.GL_RGB,
+                 buffer='back',
+                 position=(0,0),
+                 anchor='lowerleft',
+                 size=None, # if None, use full screen
+                 num_pixel_buffers=3,
+                 num_workers=2,
+                 max_queued_frames=8):
+        if format == gl.GL_RGB:
+            num_components = 3
+        elif format == gl.GL_RGBA:
+            num_components = 4
+        else:
+            raise NotImplementedError("Only RGB and RGBA formats currently supported")
+        if size is None:
+            size = screen.size
+        self.size = (int(size[0]),int(size[1]))
+        self.lowerleft = VisionEgg._get_lowerleft(position,anchor,self.size)
+        self.format = format
+        self.read_buffer = screen._get_gl_read_buffer(buffer)
+        self.encode_func = encode_func
+        self.shape = (self.size[1],self.size[0],num_components)
+        self.num_bytes = self.size[0]*self.size[1]*num_components
+
+        self.use_pixel_buffers = num_pixel_buffers > 0 and _pixel_buffer_objects_supported()
+        self.pixel_buffers = []
+        if self.use_pixel_buffers:
+            self.pixel_buffers = list(np.atleast_1d(gl.glGenBuffers(num_pixel_buffers)))
+            for pixel_buffer in self.pixel_buffers:
+                gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER,pixel_buffer)
+                gl.glBufferData(gl.GL_PIXEL_PACK_BUFFER,self.num_bytes,None,gl.GL_STREAM_READ)
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER,0)
+        self.pending = [] # (frame_number, pixel_buffer), oldest first
+
+        self.free_arrays = Queue.Queue()
+        for i in range(max_queued_frames+num_workers+1):
+            self.free_arrays.put(np.empty(self.shape,dtype=np.uint8))
+        self.encode_queue = Queue.Queue(max_queued_frames)
+        self.error = None
+        self.num_frames = 0
+        self.wait_sec = 0.0
+        self.workers = []
+        for i in range(num_workers):
+            worker = threading.Thread(target=self.__encode_frames,
+                                      name='FramebufferCapture-%d'%i)
+            worker.setDaemon(True)
+            worker.start()
+            self.workers.append(worker)
+
+    def capture(self,frame_number=None,frame_info=None):
+        """Start reading the framebuffer. Call before swap_buffers().
+
+        frame_number is passed to encode_func and defaults to the
+        number of frames captured before.  frame_info, if not None, is
+        also passed to encode_func."""
+        if self.error is not None:
+            raise self.error
+        if frame_number is None:
+            frame_number = self.num_frames
+        gl.glReadBuffer(self.read_buffer)
+        gl.glPixelStorei(gl.GL_PACK_ALIGNMENT,1)
+        if not self.use_pixel_buffers:
+            array = self.__get_free_array()
+            self.__read_pixels(array.ctypes.data)
+            self.__queue_frame(frame_number,array,frame_info)
+        else:
+            if len(self.pending) == len(self.pixel_buffers):
+                self.__finish_oldest()
+            pixel_buffer = self.pixel_buffers[self.num_frames % len(self.pixel_buffers)]
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER,pixel_buffer)
+            self.__read_pixels(0) # offset into pixel buffer
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER,0)
+            self.pending.append((frame_number,pixel_buffer,frame_info))
+        self.num_frames += 1
+
+    def __read_pixels(self,address):
+        _raw_glReadPixels(self.lowerleft[0],self.lowerleft[1],
+                          self.size[0],self.size[1],
+                          self.format,gl.GL_UNSIGNED_BYTE,
+                          ctypes.c_void_p(address))
+
+    def __finish_oldest(self):
+        frame_number, pixel_buffer, frame_info = self.pending.pop(0)
+        array = self.__get_free_array()
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER,pixel_buffer)
+        address = gl.glMapBuffer(gl.GL_PIXEL_PACK_BUFFER,gl.GL_READ_ONLY)
+        try:
+            ctypes.memmove(array.ctypes.data,address,self.num_bytes)
+        finally:
+            gl.glUnmapBuffer(gl.GL_PIXEL_PACK_BUFFER)
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER,0)
+        self.__queue_frame(frame_number,array,frame_info)
+
+    def __get_free_array(self):
+        try:
+            return self.free_arrays.get_nowait()
+        except Queue.Empty:
+            start = VisionEgg.true_time_func()
+            array = self.free_arrays.get()
+            self.wait_sec += VisionEgg.true_time_func()-start
+            return array
+
+    def __queue_frame(self,frame_number,array,frame_info):
+        try:
+            self.encode_queue.put_nowait((frame_number,array,frame_info))
+        except Queue.Full:
+            start = VisionEgg.true_time_func()
+            self.encode_queue.put((frame_number,array,frame_info))
+            self.wait_sec += VisionEgg.true_time_func()-start
+
+    def __encode_frames(self):
+        while 1:
+            item = self.encode_queue.get()
+            if item is None:
+                break
+            frame_number, array, frame_info = item
+            if self.error is None:
+                try:
+                    if frame_info is None:
+                        self.encode_func(frame_number,array[::-1])
+                    else:
+                        self.encode_func(frame_number,array[::-1],frame_info)
+                except Exception, x:
+                    if self.error is None:
+                        self.error = x
+                    logger = logging.getLogger('VisionEgg.Core')
+                    logger.error("Error encoding frame %d: %s: %s"%(
+                        frame_number,str(x.__class__),str(x)))
+            self.free_arrays.put(array)
+
+    def flush(self):
+        """Queue all frames still in pixel buffers for encoding."""
+        while len(self.pending):
+            self.__finish_oldest()
+
+    def close(self):
+        """Encode all remaining frames and stop the workers."""
+        if self.workers:
+            self.flush()
+            for worker in self.workers:
+                self.encode_queue.put(None)
+            for worker in self.workers:
+                worker.join()
+            self.workers = []
+            if self.pixel_buffers:
+                gl.glDeleteBuffers(len(self.pixel_buffers),self.pixel_buffers)
+                self.pixel_buffers = []
+            logger = logging.getLogger('VisionEgg.Core')
+            logger.info("Captured %d frames, waited %.1f msec for encoding."%(
+                self.num_frames,self.wait_sec*1000.0))
+        if self.error is not None:
+            raise self.error
+
 ####################################################################
 #
 #        Projection and derived classes
@@ -1163,8 +1707,16 @@ class Stimulus(VisionEgg.ClassWithParameters):
     in the framebuffer, check the value of
     glGetIntegerv(GL_ALPHA_BITS) and raise an exception if it is not
     available.
+
+    A subclass whose draw() method depends on earlier calls to draw()
+    and not only on its parameters (for example, one that moves things
+    a bit every frame) should set the class attribute
+    draw_has_hidden_state to True.  Such stimuli cannot be rendered
+    out of order by VisionEgg.FlowControl.export_movie_parallel().
     """
 
+    draw_has_hidden_state = False
+
     def __init__(self,**kw):
         """Instantiate and get ready to draw.
 
@@ -1287,6 +1839,7 @@ class Viewport(VisionEgg.ClassWithParameters):
     __slots__ = (
         '_is_drawing',
         '_cached_size',
+        '_stimulus_profiler',
         )
 
     def __init__(self,**kw):
@@ -1332,6 +1885,7 @@ class Viewport(VisionEgg.ClassWithParameters):
         if p.stimuli is None:
             p.stimuli = []
         self._is_drawing = False
+        self._stimulus_profiler = None
 
     def make_new_pixel_coord_projection(self):
         """Create instance of Projection mapping eye coordinates 1:1 with pixel coordinates."""
@@ -1368,12 +1922,22 @@ class Viewport(VisionEgg.ClassWithParameters):
         p.projection.apply_to_gl()
         p.camera_matrix.apply_to_gl()
 
+    def set_stimulus_profiler(self,stimulus_profiler):
+        """Time stimuli with an instance of StimulusProfiler, or None to stop."""
+        self._stimulus_profiler = stimulus_profiler
+
+    def get_stimulus_profiler(self):
+        return self._stimulus_profiler
+
     def draw(self):
         """Set the viewport and draw stimuli."""
         self.make_current()
         self._is_drawing = True
-        for stimulus in self.parameters.stimuli:
-            stimulus.draw()
+        if self._stimulus_profiler is None:
+            for stimulus in self.parameters.stimuli:
+                stimulus.draw()
+        else:
+            self._stimulus_profiler.draw_stimuli(self.parameters.stimuli)
         self._is_drawing = False
 
     def norm_device_2_window(self,norm_device_vertex):
@@ -1597,42 +2161,511 @@ class FrameTimer:
         print >> buffer, 'Mean IFI was %.2f msec (%.2f fps), longest IFI was %.2f msec.'%(
             average_ifi_sec*1000.0,1.0/average_ifi_sec,self.longest_frame_draw_time_sec*1000.0)
 
-        h = hist = self.timing_histogram # shorthand
-        maxhist = float(max(h))
-        if maxhist == 0:
+        bin_labels = ["%4d "%(0,)]
+        for bin in self.bins[:-1]:
+            bin_labels.append("%4d "%(bin,))
+        if not _print_histogram(buffer,self.timing_histogram,bin_labels):
             print >> buffer, "No frames were drawn."
             return
-        lines = min(10,int(math.ceil(maxhist)))
-        hist = hist/maxhist*float(lines) # normalize to number of lines
-        print >> buffer, "histogram:"
-        for line in range(lines):
-            val = float(lines)-1.0-float(line)
-            timing_string = "%6d   "%(round(maxhist*val/lines),)
-            q = np.greater(hist,val)
-            for qi in q:
-                s = ' '
-                if qi:
-                    s = '*'
-                timing_string += "%4s "%(s,)
-            print >> buffer, timing_string
-        timing_string = " Time: "
-        timing_string += "%4d "%(0,)
-        for bin in self.bins[:-1]:
-            timing_string += "%4d "%(bin,)
-        timing_string += "+(msec)\n"
-        timing_string += "Total:    "
-        for hi in h:
-            if hi <= 999:
-                num_str = str(int(hi)).center(5)
-            else:
-                num_str = " +++ "
-            timing_string += num_str
-        print >> buffer, timing_string
 
         buffer.seek(0)
         logger = logging.getLogger('VisionEgg.Core')
         logger.info(buffer.read())
 
+def _print_histogram(buffer,h,bin_labels):
+    """Print text histogram of counts h to buffer.
+
+    bin_labels are the 5 character labels of the lower edge of each
+    bin.  Returns False (and prints nothing) if all counts are zero."""
+    hist = np.asarray(h,dtype=np.float64)
+    maxhist = float(max(hist))
+    if maxhist == 0:
+        return False
+    lines = min(10,int(math.ceil(maxhist)))
+    hist = hist/maxhist*float(lines) # normalize to number of lines
+    print >> buffer, "histogram:"
+    for line in range(lines):
+        val = float(lines)-1.0-float(line)
+        timing_string = "%6d   "%(round(maxhist*val/lines),)
+        q = np.greater(hist,val)
+        for qi in q:
+            s = ' '
+            if qi:
+                s = '*'
+            timing_string += "%4s "%(s,)
+        print >> buffer, timing_string
+    timing_string = " Time: "
+    timing_string += ''.join(bin_labels)
+    timing_string += "+(msec)\n"
+    timing_string += "Total:    "
+    for hi in h:
+        if hi <= 999:
+            num_str = str(int(hi)).center(5)
+        else:
+            num_str = " +++ "
+        timing_string += num_str
+    print >> buffer, timing_string
+    return True
+
+class StimulusProfiler:
+    """Time the draw() method of each stimulus drawn by viewports.
+
+    Give an instance to Viewport.set_stimulus_profiler() (several
+    viewports may share one), and each stimulus drawn by the viewport
+    is timed with VisionEgg.true_time_func.  Statistics are kept for
+    each stimulus class and each stimulus instance: the number of
+    draws, mean, 99th percentile and maximum.  (The 99th percentile is
+    estimated from a histogram with 20 bins per decade, so is only
+    accurate to about 12%.)
+
+    OpenGL calls usually return before the graphics card has done the
+    work, so by default this measures only the time taken to issue
+    the calls.  If gl_finish is true, glFinish() is called before and
+    after each stimulus, so that the time includes the time taken by
+    the graphics card.  This slows drawing considerably.
+
+    Viewports without a profiler (the default) draw their stimuli
+    without any additional overhead.
+    """
+    # Bins of the histograms used for percentiles: 20 per decade from 1 usec
+    bins_per_decade = 20
+    min_sec = 1e-6
+    num_bins = 140
+    # Lower bin edges of the histogram shown by log_histogram()
+    display_bins_msec = [0.01,0.02,0.05,0.1,0.2,0.5,1,2,5,10,20,50]
+
+    def __init__(self,gl_finish=False):
+        """Create instance of StimulusProfiler."""
+        self.gl_finish = gl_finish
+        self.reset()
+
+    def reset(self):
+        """Forget all draw times."""
+        self.class_stats = {} # key: class
+        self.instance_stats = {} # key: id(stimulus)
+        self.instance_labels = {} # key: id(stimulus)
+
+    def draw_stimuli(self,stimuli):
+        """Draw and time stimuli. Called by Viewport.draw()."""
+        time_func = VisionEgg.true_time_func
+        gl_finish = self.gl_finish
+        if gl_finish:
+            gl.glFinish() # don't count earlier work
+        for stimulus in stimuli:
+            start = time_func()
+            stimulus.draw()
+            if gl_finish:
+                gl.glFinish()
+            self.add_draw_time(stimulus,time_func()-start)
+
+    def add_draw_time(self,stimulus,draw_time_sec):
+        """Add the duration of one call to stimulus.draw()."""
+        if draw_time_sec < self.min_sec:
+            index = 0
+        else:
+            index = int(math.log10(draw_time_sec/self.min_sec)*self.bins_per_decade)
+            index = min(index,self.num_bins-1)
+        display_index = min(bisect.bisect_left(self.display_bins_msec,draw_time_sec*1000.0),
+                            len(self.display_bins_msec)-1)
+        key = stimulus.__class__
+        stats = self.class_stats.get(key)
+        if stats is None:
+            stats = self.class_stats[key] = self.__new_stats()
+        self.__add(stats,draw_time_sec,index,display_index)
+        key = id(stimulus)
+        stats = self.instance_stats.get(key)
+        if stats is None:
+            stats = self.instance_stats[key] = self.__new_stats()
+            self.instance_labels[key] = '%s at 0x%x'%(stimulus.__class__.__name__,key)
+        self.__add(stats,draw_time_sec,index,display_index)
+
+    def __new_stats(self):
+        # [count, total_sec, max_sec, histogram, display histogram]
+        return [0, 0.0, 0.0, [0]*self.num_bins, [0]*len(self.display_bins_msec)]
+
+    def __add(self,stats,draw_time_sec,index,display_index):
+        stats[0] += 1
+        stats[1] += draw_time_sec
+        if draw_time_sec > stats[2]:
+            stats[2] = draw_time_sec
+        stats[3][index] += 1
+        stats[4][display_index] += 1
+
+    def __get_summary(self,stats):
+        count, total_sec, max_sec, histogram, display_histogram = stats
+        # upper edge of the bin containing the 99th percentile
+        cumulative = np.cumsum(histogram)
+        index = int(np.searchsorted(cumulative,0.99*count))
+        p99_sec = min(self.min_sec*10.0**((index+1.0)/self.bins_per_decade),max_sec)
+        return {'count':count,
+                'mean_sec':total_sec/count,
+                'p99_sec':p99_sec,
+                'max_sec':max_sec}
+
+    def get_class_stats(self):
+        """Return dictionary of statistics for each stimulus class.
+
+        The statistics are a dictionary with keys 'count',
+        'mean_sec', 'p99_sec' and 'max_sec'."""
+        result = {}
+        for key, stats in self.class_stats.items():
+            result[key] = self.__get_summary(stats)
+        return result
+
+    def get_instance_stats(self):
+        """Return dictionary of statistics for each stimulus instance.
+
+        Keys are labels of the form 'ClassName at 0x...'."""
+        result = {}
+        for key, stats in self.instance_stats.items():
+            result[self.instance_labels[key]] = self.__get_summary(stats)
+        return result
+
+    def log_summary(self):
+        """Send table of statistics to logger."""
+        buffer = StringIO.StringIO()
+        if self.gl_finish:
+            print >> buffer, 'Stimulus draw times (including glFinish):'
+        else:
+            print >> buffer, 'Stimulus draw times:'
+        for title, all_stats in (('class',self.get_class_stats()),
+                                 ('instance',self.get_instance_stats())):
+            print >> buffer, '%-40s %8s %10s %10s %10s'%(
+                title,'draws','mean msec','p99 msec','max msec')
+            items = all_stats.items()
+            items.sort(lambda a,b: cmp(b[1]['mean_sec'],a[1]['mean_sec']))
+            for key, summary in items:
+                if isinstance(key,(type,types.ClassType)):
+                    key = key.__name__
+                print >> buffer, '%-40s %8d %10.3f %10.3f %10.3f'%(
+                    key,summary['count'],summary['mean_sec']*1000.0,
+                    summary['p99_sec']*1000.0,summary['max_sec']*1000.0)
+        buffer.seek(0)
+        logger = logging.getLogger('VisionEgg.Core')
+        logger.info(buffer.read())
+
+    def log_histogram(self):
+        """Send histogram of draw times of each stimulus class to logger."""
+        bin_labels = ["%4d "%(0,)]
+        for bin in self.display_bins_msec[:-1]:
+            bin_labels.append("%4s "%('%g'%bin,))
+        for key, stats in self.class_stats.items():
+            summary = self.__get_summary(stats)
+            buffer = StringIO.StringIO()
+            print >> buffer, '%s was drawn %d times.'%(key.__name__,summary['count'])
+            print >> buffer, 'Mean draw time was %.3f msec, 99th percentile %.3f msec, longest %.3f msec.'%(
+                summary['mean_sec']*1000.0,summary['p99_sec']*1000.0,summary['max_sec']*1000.0)
+            _print_histogram(buffer,stats[4],bin_labels)
+            buffer.seek(0)
+            logger = logging.getLogger('VisionEgg.Core')
+            logger.info(buffer.read())
+
+class FrameTelemetry:
+    """Record when each phase of each frame of a go loop finished.
+
+    Presentation.go() fills an instance of this class when its
+    record_frame_telemetry parameter is true.  The timestamps (from
+    VisionEgg.true_time_func) are kept in a Numeric record array
+    which is allocated once and used as a ring buffer, so that only
+    the most recent frames (up to capacity) are kept.  The fields of
+    each record are:
+
+    frame       -- frames since go
+    start       -- start of the frame
+    clear       -- screens cleared
+    controllers -- controllers called
+    viewports   -- each viewport drawn (one column per viewport,
+                   left out if there are no viewports)
+    swap        -- buffers swapped
+    events      -- events handled (end of the frame)
+
+    The arrays of each field are also available as attributes of the
+    same name.
+    """
+    phases = ('clear','controllers','viewports','swap','events')
+
+    def __init__(self, num_viewports, capacity=10000):
+        """Create instance of FrameTelemetry."""
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.num_viewports = num_viewports
+        self.capacity = capacity
+        fields = [('frame',np.int64),
+                  ('start',np.float64),
+                  ('clear',np.float64),
+                  ('controllers',np.float64)]
+        if num_viewports:
+            fields.append(('viewports',np.float64,(num_viewports,)))
+        fields.extend([('swap',np.float64),
+                       ('events',np.float64)])
+        self.dtype = np.dtype(fields)
+        self.records = np.empty((capacity,),dtype=self.dtype)
+        self.frame = self.records['frame']
+        self.start = self.records['start']
+        self.clear = self.records['clear']
+        self.controllers = self.records['controllers']
+        if num_viewports:
+            self.viewports = self.records['viewports']
+        else:
+            self.viewports = np.empty((capacity,0),dtype=np.float64)
+        self.swap = self.records['swap']
+        self.events = self.records['events']
+        self.reset()
+
+    def reset(self):
+        """Forget all frames."""
+        self.num_frames = 0 # frames recorded, including those overwritten
+        self.records['frame'] = -1
+        for name in self.dtype.names[1:]:
+            self.records[name] = np.nan
+
+    def __len__(self):
+        return min(self.num_frames,self.capacity)
+
+    def get_records(self):
+        """Return a copy of the frames kept, oldest first."""
+        if self.num_frames <= self.capacity:
+            return self.records[:self.num_frames].copy()
+        first = self.num_frames % self.capacity
+        return np.concatenate((self.records[first:],self.records[:first]))
+
+    def get_durations(self):
+        """Return the duration (sec) of each phase of the frames kept, oldest first.
+
+        The result is a record array with the fields of the records,
+        plus 'total', the duration of the whole frame."""
+        records = self.get_records()
+        names = ['frame'] + [name for name in self.dtype.names[1:] if name != 'start'] + ['total']
+        formats = [self.dtype.fields[name][0] for name in names[:-1]] + [np.float64]
+        durations = np.empty(records.shape,dtype=np.dtype({'names':names,'formats':formats}))
+        durations['frame'] = records['frame']
+        durations['clear'] = records['clear']-records['start']
+        durations['controllers'] = records['controllers']-records['clear']
+        if self.num_viewports:
+            viewports = records['viewports']
+            durations['viewports'][:,0] = viewports[:,0]-records['controllers']
+            durations['viewports'][:,1:] = viewports[:,1:]-viewports[:,:-1]
+            durations['swap'] = records['swap']-viewports[:,-1]
+        else:
+            durations['swap'] = records['swap']-records['controllers']
+        durations['events'] = records['events']-records['swap']
+        durations['total'] = records['events']-records['start']
+        return durations
+
+    def save(self,filename):
+        """Save the frames kept, oldest first, as a .npy file."""
+        np.save(filename,self.get_records())
+
+    def get_summary(self,long_frame_sec=None):
+        """Return text describing the duration of each phase.
+
+        Frames lasting longer than long_frame_sec (by default, 1.5
+        inter frame intervals at VISIONEGG_MONITOR_REFRESH_HZ) are
+        counted by their longest phase."""
+        if long_frame_sec is None:
+            long_frame_sec = 1.5/VisionEgg.config.VISIONEGG_MONITOR_REFRESH_HZ
+        buffer = StringIO.StringIO()
+        durations = self.get_durations()
+        if not len(durations):
+            print >> buffer, 'No frames were recorded.'
+            buffer.seek(0)
+            return buffer.read()
+        print >> buffer, '%d frames recorded, %d kept.'%(self.num_frames,len(durations))
+        columns = [('clear',durations['clear']),
+                   ('controllers',durations['controllers'])]
+        for i in range(self.num_viewports):
+            columns.append(('viewport %d'%i,durations['viewports'][:,i]))
+        columns.extend([('swap',durations['swap']),
+                        ('events',durations['events']),
+                        ('total',durations['total'])])
+        print >> buffer, '%-14s %12s %12s'%('phase','mean (msec)','max (msec)')
+        for name, values in columns:
+            print >> buffer, '%-14s %12.3f %12.3f'%(name,np.mean(values)*1000.0,np.max(values)*1000.0)
+        long_frames = durations['total'] > long_frame_sec
+        num_long = int(np.sum(long_frames))
+        print >> buffer, '%d frames took longer than %.1f msec.'%(num_long,long_frame_sec*1000.0)
+        if num_long:
+            phase_durations = np.array([values[long_frames] for name, values in columns[:-1]])
+            longest = np.argmax(phase_durations,axis=0)
+            for i in range(len(columns)-1):
+                count = int(np.sum(longest == i))
+                if count:
+                    print >> buffer, '  longest phase was %s in %d of them.'%(columns[i][0],count)
+        buffer.seek(0)
+        return buffer.read()
+
+    def log_summary(self):
+        """Send summary to logger."""
+        logger = logging.getLogger('VisionEgg.Core')
+        logger.info(self.get_summary())
+
+class RefreshEstimator:
+    """Estimate display refresh period and phase from buffer swaps.
+
+    swap_buffers() passes the time (from VisionEgg.time_func) at which
+    each swap returned to the module-level instance, refresh_estimator.
+    The estimate is continuously updated by a least squares fit of
+    the most recent swap times (up to window) against the number of
+    refreshes elapsed, so it follows drift of the display clock
+    relative to the computer's clock.  Intervals spanning several
+    refreshes (dropped frames) are counted as such.  A pause longer
+    than max_gap_periods refreshes, or a clock running backwards,
+    starts a new fit while keeping the period estimate.
+
+    The estimate is only as good as the swap times: it assumes
+    swap_buffers() blocks until the swap takes place, which is the
+    case when buffer swaps are synchronized to the vertical retrace.
+    Without synchronization, it measures the rate of buffer swaps.
+
+    Attributes (None until enough swaps have been seen):
+
+    period_sec  -- refresh period
+    phase_sec   -- fitted time of the most recent swap
+    num_missed_refreshes -- refreshes without a swap (dropped frames)
+    photon_latency_sec -- added by predict_photon_time() (default 0.0)
+    """
+    def __init__(self, window=120, num_bootstrap_swaps=8, max_gap_periods=60):
+        """Create instance of RefreshEstimator."""
+        if num_bootstrap_swaps < 2 or window < num_bootstrap_swaps:
+            raise ValueError("need window >= num_bootstrap_swaps >= 2")
+        self.window = window
+        self.num_bootstrap_swaps = num_bootstrap_swaps
+        self.max_gap_periods = max_gap_periods
+        self.photon_latency_sec = 0.0
+        self.reset()
+
+    def reset(self):
+        """Forget all swaps and the period estimate."""
+        self.period_sec = None
+        self.phase_sec = None
+        self.num_missed_refreshes = 0
+        self._last_time = None
+        self._bootstrap_times = []
+        self._start_fit(None)
+
+    def _start_fit(self,t):
+        self._counts = [] # refreshes since self._count_origin
+        self._times = [] # seconds since self._time_origin
+        self._first = 0 # index of oldest sample still in the fit
+        self._sums = [0.0,0.0,0.0,0.0] # n, t, n*n, n*t
+        self._count_origin = 0
+        self._time_origin = t
+        self._last_count = 0
+        if t is not None:
+            self._add_sample(0,t)
+
+    def _add_sample(self,count,t):
+        n = float(count - self._count_origin)
+        t_rel = t - self._time_origin
+        self._counts.append(n)
+        self._times.append(t_rel)
+        sums = self._sums
+        sums[0] += n
+        sums[1] += t_rel
+        sums[2] += n*n
+        sums[3] += n*t_rel
+        if len(self._counts) - self._first > self.window:
+            n_old = self._counts[self._first]
+            t_old = self._times[self._first]
+            sums[0] -= n_old
+            sums[1] -= t_old
+            sums[2] -= n_old*n_old
+            sums[3] -= n_old*t_old
+            self._first += 1
+            if self._first >= self.window:
+                # Re-anchor to the oldest sample and recompute the
+                # sums exactly, so rounding errors do not accumulate.
+                counts = self._counts[self._first:]
+                times = self._times[self._first:]
+                n0, t0 = counts[0], times[0]
+                self._count_origin += int(n0)
+                self._time_origin += t0
+                self._counts = [n-n0 for n in counts]
+                self._times = [t-t0 for t in times]
+                self._first = 0
+                self._sums = [sum(self._counts),
+                              sum(self._times),
+                              sum([n*n for n in self._counts]),
+                              sum([n*t for n,t in zip(self._counts,self._times)])]
+        self._last_count = count
+
+        num = len(self._counts) - self._first
+        if num >= self.num_bootstrap_swaps:
+            s_n, s_t, s_nn, s_nt = self._sums
+            denom = num*s_nn - s_n*s_n
+            if denom > 0.0:
+                slope = (num*s_nt - s_n*s_t)/denom
+                if slope > 0.0:
+                    intercept = (s_t - slope*s_n)/num
+                    self.period_sec = slope
+                    self.phase_sec = self._time_origin + intercept + slope*self._counts[-1]
+                    return
+        self.phase_sec = t
+
+    def add_swap_time(self,t):
+        """Declare a buffer swap completed at time t (seconds)."""
+        last = self._last_time
+        self._last_time = t
+        if last is None or t <= last:
+            self._bootstrap_times = [t]
+            self._start_fit(t)
+            return
+        period = self.period_sec
+        if period is None:
+            times = self._bootstrap_times
+            times.append(t)
+            if len(times) < self.num_bootstrap_swaps:
+                return
+            # The median interval is a good first guess even if a few
+            # frames were dropped.
+            self.period_sec = period = float(np.median(np.diff(times)))
+            self._bootstrap_times = []
+            self._start_fit(times[0])
+            for last, t in zip(times[:-1],times[1:]):
+                self._add_interval(last,t,period)
+            return
+        self._add_interval(last,t,period)
+
+    def _add_interval(self,last,t,period):
+        num_periods = int(round((t-last)/period))
+        if num_periods > self.max_gap_periods:
+            self._start_fit(t)
+            return
+        if num_periods < 1:
+            num_periods = 1
+        self.num_missed_refreshes += num_periods-1
+        self._add_sample(self._last_count+num_periods,t)
+
+    def get_refresh_rate_hz(self):
+        """Return the estimated refresh rate, or None if unknown."""
+        if self.period_sec is None:
+            return None
+        return 1.0/self.period_sec
+
+    def predict_swap_time(self,now=None):
+        """Predict when a buffer swap requested at time now will complete.
+
+        This is the first refresh after now.  If now is None, the
+        current VisionEgg.time_func() is used.  Until the period is
+        known, now is returned."""
+        if now is None:
+            now = VisionEgg.time_func()
+        if self.period_sec is None:
+            return now
+        num_periods = math.ceil((now - self.phase_sec)/self.period_sec)
+        if num_periods < 1:
+            num_periods = 1
+        return self.phase_sec + num_periods*self.period_sec
+
+    def predict_photon_time(self,now=None):
+        """Predict when a frame finished drawing at time now will be shown.
+
+        The predicted swap time plus photon_latency_sec, which may be
+        set to the input lag of the display."""
+        return self.predict_swap_time(now) + self.photon_latency_sec
+
+refresh_estimator = RefreshEstimator() # updated by swap_buffers()
+
 ####################################################################
 #
 #        Error handling and assumption checking
@@ -1781,6 +2814,17 @@ def post_gl_init():
                                "GL_CLAMP_TO_EDGE.")
                 gl.GL_CLAMP_TO_EDGE = gl.GL_CLAMP
 
+    # Choose the texel upload layout now, rather than when the first
+    # texture is loaded, which may be during a presentation.
+    _choose_texture_upload_format()
+
+def _choose_texture_upload_format():
+    try:
+        import VisionEgg.Textures # here to prevent circular import
+    except ImportError:
+        return # textures not available (e.g. no PIL)
+    VisionEgg.Textures.get_upload_format()
+
 #########################################################################
 #
 #       Moved to FlowControl.py -- here only for backwards compatibility
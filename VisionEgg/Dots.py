@@ -134,6 +134,8 @@ class DotArea2D(VisionEgg.Core.Stimulus):
         '_gave_alpha_warning',
         )
 
+    draw_has_hidden_state = True # dots move from their last positions
+
     def __init__(self, **kw):
         VisionEgg.Core.Stimulus.__init__(self,**kw)
         # store positions normalized between 0 and 1 so that re-sizing is ok
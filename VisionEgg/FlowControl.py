@@ -19,7 +19,9 @@ import logging.handlers
 import VisionEgg
 import VisionEgg.GL as gl # get all OpenGL stuff in one namespace
 import VisionEgg.ParameterTypes as ve_types
+import numpy
 import numpy.oldnumeric as Numeric, math, types
+import ast, bisect
 import pygame
 
 ####################################################################
@@ -64,14 +66,22 @@ class Presentation(VisionEgg.ClassWithParameters):
                                     Default: True
     enter_go_loop                -- test used by run_forever() to enter go loop (Boolean)
                                     Default: False
+    frame_telemetry_capacity     -- number of most recent frames kept by frame telemetry (UnsignedInteger)
+                                    Default: 36000
     go_duration                  -- Tuple to specify 'go' loop duration. Either (value,units) or ('forever',) (Sequence of AnyOf(Real or String))
                                     Default: (5.0, 'seconds')
     handle_event_callbacks       -- List of tuples to handle events. (event_type,event_callback_func) (Sequence of Sequence2 of AnyOf(Integer or Callable))
                                     Default: (determined at runtime)
     override_t_abs_sec           -- Override t_abs. Set only when reconstructing experiments. (units: seconds) (Real)
                                     Default: (determined at runtime)
+    precompute_timelines         -- sample time-deterministic controllers into arrays before go loop? (Boolean)
+                                    Default: False
+    predict_photon_time          -- during go loop, give controllers the predicted time the frame being drawn is shown? (Boolean)
+                                    Default: False
     quit                         -- quit the run_forever loop? (Boolean)
                                     Default: False
+    record_frame_telemetry       -- record when each phase of each frame finished during go loop? (Boolean)
+                                    Default: False
     trigger_armed                -- test trigger on go loop? (Boolean)
                                     Default: True
     trigger_go_if_armed          -- trigger go loop? (Boolean)
@@ -123,11 +133,29 @@ class Presentation(VisionEgg.ClassWithParameters):
         'override_t_abs_sec':(None, # override t_abs (in seconds) -- set only when reconstructing experiments
                               ve_types.Real,
                               "Override t_abs. Set only when reconstructing experiments. (units: seconds)"),
+        'precompute_timelines':(False,
+                                ve_types.Boolean,
+                                "sample time-deterministic controllers into arrays before go loop?"),
+        'predict_photon_time':(False,
+                               ve_types.Boolean,
+                               "during go loop, give controllers the predicted time the frame being drawn is shown?"),
+        'record_frame_telemetry':(False,
+                                  ve_types.Boolean,
+                                  "record when each phase of each frame finished during go loop?"),
+        'frame_telemetry_capacity':(36000, # 10 minutes at 60 Hz
+                                    ve_types.UnsignedInteger,
+                                    "number of most recent frames kept by frame telemetry"),
         }
 
     __slots__ = (
         'controllers',
         'num_frame_controllers',
+        '_controller_schedules',
+        '_controller_schedule_generation',
+        '_timelines',
+        '_frame_telemetry',
+        '_frame_capture',
+        '_frame_capture_info',
         'frame_draw_times',
         'time_sec_absolute',
         'frames_absolute',
@@ -149,6 +177,11 @@ class Presentation(VisionEgg.ClassWithParameters):
 
         self.controllers = []
         self.num_frame_controllers = 0 # reference counter for controllers that are called on frame by frame basis
+        self._timelines = {}
+        self._invalidate_controller_schedules()
+        self._frame_telemetry = None
+        self._frame_capture = None
+        self._frame_capture_info = False
 
         # A list that optionally records when frames were drawn by go() method.
         self.frame_draw_times = []
@@ -185,6 +218,7 @@ class Presentation(VisionEgg.ClassWithParameters):
             self.controllers.append( (None,None,controller) )
         if controller.temporal_variables & (FRAMES_SINCE_GO|FRAMES_ABSOLUTE):
             self.num_frame_controllers = self.num_frame_controllers + 1
+        self._invalidate_controller_schedules()
 
     def remove_controller( self, class_with_parameters, parameter_name, controller=None ):
         """Remove one (or more--see below) controller(s).
@@ -216,6 +250,7 @@ class Presentation(VisionEgg.ClassWithParameters):
                     del self.controllers[i]
                 else:
                     i = i + 1
+            self._invalidate_controller_schedules()
             return
         if controller is None:
             # The controller function is not specified:
@@ -243,54 +278,139 @@ class Presentation(VisionEgg.ClassWithParameters):
                     orig_controller == controller):
                     if controller.temporal_variables & (FRAMES_SINCE_GO|FRAMES_ABSOLUTE):
                         self.num_frame_controllers = self.num_frame_controllers - 1
+                    del self.controllers[i]
                 else:
                     i = i + 1
+        self._invalidate_controller_schedules()
+
+    def _invalidate_controller_schedules(self):
+        """Discard the compiled controller schedules.
+
+        Called whenever the set of controllers changes.  The schedules
+        are rebuilt on the next call to the controllers."""
+        self._controller_schedules = {}
+        self._controller_schedule_generation = None
+
+    def _get_controller_schedule(self,go_started,doing_transition):
+        """Return the ControllerSchedule for this kind of call.
+
+        Schedules are cached until a controller is added or removed,
+        or until the eval_frequency or temporal_variables of any
+        controller changes."""
+        if self._controller_schedule_generation != Controller._schedule_generation:
+            self._controller_schedules = {}
+            self._controller_schedule_generation = Controller._schedule_generation
+        key = (bool(go_started),bool(doing_transition))
+        schedule = self._controller_schedules.get(key)
+        if schedule is None:
+            schedule = ControllerSchedule(self.controllers,
+                                          go_started=key[0],
+                                          doing_transition=key[1],
+                                          timelines=self._timelines)
+            self._controller_schedules[key] = schedule
+        return schedule
 
     def __call_controllers(self,
                          go_started=None,
                          doing_transition=None):
-        done_once = [] # list of ONCE contollers to switch status of
-        for (parameters_instance, parameter_name, controller) in self.controllers:
-            evaluate = 0
-            if controller.eval_frequency & ONCE:
-                evaluate = 1
-                done_once.append(controller)
-            elif doing_transition and (controller.eval_frequency & TRANSITIONS):
-                evaluate = 1
-            elif controller.eval_frequency & EVERY_FRAME:
-                evaluate = 1
-
-            if evaluate:
-                if controller.temporal_variables & TIME_SEC_ABSOLUTE:
-                    controller.time_sec_absolute = self.time_sec_absolute
-                if controller.temporal_variables & FRAMES_ABSOLUTE:
-                    controller.frames_absolute = self.frames_absolute
-
-                if go_started:
-                    if not (controller.eval_frequency & NOT_DURING_GO):
-                        if controller.temporal_variables & TIME_SEC_SINCE_GO:
-                            controller.time_sec_since_go = self.time_sec_since_go
-                        if controller.temporal_variables & FRAMES_SINCE_GO:
-                            controller.frames_since_go = self.frames_since_go
-                        result = controller.during_go_eval()
-                        if parameter_name is not None:
-                            setattr(parameters_instance, parameter_name, result)
-                else:
-                    if not (controller.eval_frequency & NOT_BETWEEN_GO):
-                        if controller.temporal_variables & TIME_SEC_SINCE_GO:
-                            controller.time_sec_since_go = None
-                        if controller.temporal_variables & FRAMES_SINCE_GO:
-                            controller.frames_since_go = None
-                        result = controller.between_go_eval()
-                        if parameter_name is not None:
-                            setattr(parameters_instance, parameter_name, result)
-
-        for controller in done_once:
+        schedule = self._get_controller_schedule(go_started,doing_transition)
+
+        if schedule.time_sec_absolute:
+            time_sec_absolute = self.time_sec_absolute
+            for controller in schedule.time_sec_absolute:
+                controller.time_sec_absolute = time_sec_absolute
+        if schedule.frames_absolute:
+            frames_absolute = self.frames_absolute
+            for controller in schedule.frames_absolute:
+                controller.frames_absolute = frames_absolute
+        if go_started:
+            time_sec_since_go = self.time_sec_since_go
+            frames_since_go = self.frames_since_go
+        else:
+            time_sec_since_go = None
+            frames_since_go = None
+        for controller in schedule.time_sec_since_go:
+            controller.time_sec_since_go = time_sec_since_go
+        for controller in schedule.frames_since_go:
+            controller.frames_since_go = frames_since_go
+
+        if go_started:
+            frame = self.frames_since_go
+        else:
+            frame = self.frames_absolute
+        for (parameters_instance, parameter_name, eval_func) in schedule.get_evaluate(frame):
+            result = eval_func()
+            if parameter_name is not None:
+                setattr(parameters_instance, parameter_name, result)
+
+        for controller in schedule.done_once:
             #Unset ONCE flag
             controller.eval_frequency = controller.eval_frequency & ~ONCE
             if isinstance(controller,EncapsulatedController):
                 controller.contained_controller.eval_frequency = controller.contained_controller.eval_frequency & ~ONCE
 
+    def compute_timelines(self):
+        """Sample time-deterministic controllers for the next go loop.
+
+        Each EvalStringController and FunctionController evaluated
+        every frame during the go loop whose only temporal variables
+        are t and/or f (TIME_SEC_SINCE_GO and FRAMES_SINCE_GO) is
+        evaluated once for every frame of the go loop, assuming frames
+        arrive at VISIONEGG_MONITOR_REFRESH_HZ.  Where possible this
+        is done in a single evaluation with t and f as arrays.  During
+        the go loop, these controllers are then replaced by a lookup
+        into their ControllerTimeline.
+
+        This is done automatically at the start of go() if the
+        precompute_timelines parameter is true, but may also be called
+        beforehand to inspect the timelines.  Note that the controllers
+        are called before the go loop starts, so they should not have
+        side effects.
+
+        Returns a dictionary mapping each sampled controller to its
+        ControllerTimeline."""
+        p = self.parameters
+        logger = logging.getLogger('VisionEgg.FlowControl')
+        frame_rate_hz = VisionEgg.config.VISIONEGG_MONITOR_REFRESH_HZ
+        if p.go_duration[0] == 'forever':
+            logger.warning("Cannot precompute controller timelines for "
+                           "a go loop that lasts forever.")
+            self._set_timelines({})
+            return {}
+        elif p.go_duration[1] == 'seconds':
+            # one extra sample, because t is rounded to the nearest frame
+            num_frames = int(math.ceil(p.go_duration[0]*frame_rate_hz)) + 1
+        elif p.go_duration[1] == 'frames':
+            num_frames = int(math.ceil(p.go_duration[0]))
+        else:
+            raise RuntimeError("Unknown duration unit '%s'"%p.go_duration[1])
+
+        timelines = {}
+        for (parameters_instance, parameter_name, controller) in self.controllers:
+            if controller in timelines:
+                continue
+            try:
+                timelines[controller] = ControllerTimeline(controller,
+                                                           num_frames,
+                                                           frame_rate_hz)
+            except ValueError, x:
+                logger.debug("Not precomputing timeline of %s: %s"%(controller,x))
+        self._set_timelines(timelines)
+        logger.debug("Precomputed timelines of %d of %d controllers "
+                     "(%d frames at %.1f Hz)."%(len(timelines),
+                                                len(self.controllers),
+                                                num_frames,
+                                                frame_rate_hz))
+        return timelines
+
+    def get_timeline(self,controller):
+        """Return the ControllerTimeline of a controller, or None."""
+        return self._timelines.get(controller)
+
+    def _set_timelines(self,timelines):
+        self._timelines = timelines
+        self._invalidate_controller_schedules()
+
     def is_in_go_loop(self):
         """Queries if the presentation is in a go loop.
 
@@ -298,10 +418,56 @@ class Presentation(VisionEgg.ClassWithParameters):
         application from a remote client over Pyro."""
         return self.in_go_loop
 
+    def set_frame_capture(self, frame_capture, frame_info=False):
+        """Capture each frame drawn by go(), or stop if None.
+
+        frame_capture is an instance of VisionEgg.Core.FramebufferCapture
+        for the screen.  Its capture() method is called after the
+        viewports are drawn and before the buffers are swapped, with
+        frames_since_go as frame number.  If frame_info is true, it is
+        also given the dictionary returned by get_frame_info(), for
+        example to store it in a VisionEgg.FrameArchive.  The caller
+        closes frame_capture when done."""
+        self._frame_capture = frame_capture
+        self._frame_capture_info = frame_info
+
+    def get_frame_info(self):
+        """Return a dictionary describing the current frame.
+
+        The keys are 'time_sec' (time_sec_absolute),
+        'time_sec_since_go', 'frames_since_go' and 'parameters', a
+        dictionary of the values of all controlled parameters.  Its
+        keys are 'n.name', where n is the position of the controller
+        in the controllers list and name is the parameter name.
+        Arrays and lists are copied, so controllers that change them
+        in place don't change the returned values."""
+        parameters = {}
+        n = 0
+        for (parameters_instance, parameter_name, controller) in self.controllers:
+            if parameter_name is not None:
+                parameters['%d.%s'%(n,parameter_name)] = _copy_result(
+                    getattr(parameters_instance,parameter_name))
+            n += 1
+        return {'time_sec':self.time_sec_absolute,
+                'time_sec_since_go':self.time_sec_since_go,
+                'frames_since_go':self.frames_since_go,
+                'parameters':parameters}
+
+    def get_frame_capture(self):
+        return self._frame_capture
+
+    def get_frame_telemetry(self):
+        """Return the VisionEgg.Core.FrameTelemetry of the last go loop, or None.
+
+        Frame telemetry is only recorded if the record_frame_telemetry
+        parameter is true."""
+        return self._frame_telemetry
+
     def were_frames_dropped_in_last_go_loop(self):
         return self.frames_dropped_in_last_go_loop
 
     def get_last_go_loop_start_time_absolute_sec(self):
+        """Return the VisionEgg.time_func() time the last go loop started."""
         return self.last_go_loop_start_time_absolute_sec
 
     def go(self):
@@ -319,11 +485,18 @@ class Presentation(VisionEgg.ClassWithParameters):
         painting the front buffer on the display), and the buffers are
         swapped.
 
+        If the predict_photon_time parameter is true, the time given
+        to the controllers is when the frame being drawn is predicted
+        to reach the display (see VisionEgg.Core.RefreshEstimator),
+        instead of the time before drawing, which is up to one frame
+        earlier.
+
         """
         import VisionEgg.Core # here to prevent circular import
         self.in_go_loop = 1
 
         swap_buffers = VisionEgg.Core.swap_buffers # shorthand
+        frame_capture = self._frame_capture
 
         # Clear boolean indicator
         self.frames_dropped_in_last_go_loop = False
@@ -335,15 +508,58 @@ class Presentation(VisionEgg.ClassWithParameters):
         if p.collect_timing_info:
             frame_timer = VisionEgg.Core.FrameTimer()
 
+        if p.record_frame_telemetry:
+            telemetry = self._frame_telemetry
+            if (telemetry is None or
+                telemetry.num_viewports != len(p.viewports) or
+                telemetry.capacity != p.frame_telemetry_capacity):
+                telemetry = VisionEgg.Core.FrameTelemetry(len(p.viewports),
+                                                          p.frame_telemetry_capacity)
+                self._frame_telemetry = telemetry
+            else:
+                telemetry.reset()
+            # shorthand to the preallocated arrays
+            true_time_func = VisionEgg.true_time_func
+            tm_frame = telemetry.frame
+            tm_start = telemetry.start
+            tm_clear = telemetry.clear
+            tm_controllers = telemetry.controllers
+            tm_viewports = telemetry.viewports
+            tm_swap = telemetry.swap
+            tm_events = telemetry.events
+            tm_capacity = telemetry.capacity
+            tm_num_viewports = telemetry.num_viewports
+            tm_count = 0
+        else:
+            telemetry = None
+
         while (not p.trigger_armed) or (not p.trigger_go_if_armed):
             self.between_presentations()
 
+        if p.precompute_timelines:
+            self.compute_timelines()
+        elif self._timelines:
+            self._set_timelines({})
+
         # Go!
 
-        self.time_sec_absolute=VisionEgg.time_func()
+        if p.predict_photon_time:
+            # Time of the first refresh after the frame is drawn,
+            # rather than the time drawing starts.
+            time_func = VisionEgg.Core.refresh_estimator.predict_photon_time
+        else:
+            time_func = VisionEgg.time_func
+        self.time_sec_absolute=time_func()
 
         if p.override_t_abs_sec is not None:
-            raise NotImplementedError("Cannot override absolute time yet")
+            # Start at the given absolute time.  Durations are still
+            # measured in real time.  (See replay_go() to reconstruct
+            # a recorded go loop frame by frame.)
+            time_offset_sec = p.override_t_abs_sec - self.time_sec_absolute
+            unshifted_time_func = time_func
+            def time_func():
+                return unshifted_time_func() + time_offset_sec
+            self.time_sec_absolute = p.override_t_abs_sec
 
         self.last_go_loop_start_time_absolute_sec = self.time_sec_absolute
         self.time_sec_since_go = 0.0
@@ -374,6 +590,11 @@ class Presentation(VisionEgg.ClassWithParameters):
             raise RuntimeError("Unknown duration unit '%s'"%p.go_duration[1])
 
         while (current_duration_value < p.go_duration[0]):
+            if telemetry is not None:
+                tm_i = tm_count % tm_capacity
+                tm_frame[tm_i] = self.frames_since_go
+                tm_start[tm_i] = true_time_func()
+
             # Get list of screens
             screens = []
             for viewport in p.viewports:
@@ -385,14 +606,32 @@ class Presentation(VisionEgg.ClassWithParameters):
             for screen in screens:
                 screen.clear()
 
+            if telemetry is not None:
+                tm_clear[tm_i] = true_time_func()
+
             # Update all the realtime parameters
             self.__call_controllers(
                 go_started=1,
                 doing_transition=0)
 
             # Draw each viewport
-            for viewport in p.viewports:
-                viewport.draw()
+            if telemetry is None:
+                for viewport in p.viewports:
+                    viewport.draw()
+            else:
+                tm_controllers[tm_i] = true_time_func()
+                tm_j = 0
+                for viewport in p.viewports:
+                    viewport.draw()
+                    if tm_j < tm_num_viewports:
+                        tm_viewports[tm_i,tm_j] = true_time_func()
+                    tm_j += 1
+
+            if frame_capture is not None:
+                if self._frame_capture_info:
+                    frame_capture.capture(self.frames_since_go,self.get_frame_info())
+                else:
+                    frame_capture.capture(self.frames_since_go)
 
             # Swap the buffers
             if synclync_connection:
@@ -404,8 +643,11 @@ class Presentation(VisionEgg.ClassWithParameters):
                 data_packet = synclync_connection.get_latest_data_packet()
             swap_buffers()
 
+            if telemetry is not None:
+                tm_swap[tm_i] = true_time_func()
+
             # Set the time variables for the next frame
-            self.time_sec_absolute=VisionEgg.time_func()
+            self.time_sec_absolute=time_func()
             last_time_sec_since_go = self.time_sec_since_go
             self.time_sec_since_go = self.time_sec_absolute - start_time_absolute
             self.frames_absolute += 1
@@ -431,6 +673,11 @@ class Presentation(VisionEgg.ClassWithParameters):
                         if event.type is event_type:
                             event_callback(event)
 
+            if telemetry is not None:
+                tm_events[tm_i] = true_time_func()
+                tm_count += 1
+                telemetry.num_frames = tm_count
+
         # Tell transitional controllers a presentation has ended
         self.__call_controllers(
             go_started=0,
@@ -490,13 +737,21 @@ class Presentation(VisionEgg.ClassWithParameters):
                                  "%f msec."%(longest_frame_draw_time_sec*1000.0,
                                  inter_frame_inteval*1000.0))
             frame_timer.log_histogram()
+            if telemetry is not None:
+                telemetry.log_summary()
 
         self.in_go_loop = 0
 
-    def export_movie_go(self, frames_per_sec=12.0, filename_suffix=".tif", filename_base="visionegg_movie", path="."):
-        """Emulates method 'go' but saves a movie."""
+    def export_movie_go(self, frames_per_sec=12.0, filename_suffix=".tif", filename_base="visionegg_movie", path=".", archive_filename=None):
+        """Emulates method 'go' but saves a movie.
+
+        Each frame is saved as an image file, or, if archive_filename
+        is given, all frames are saved with their get_frame_info() in
+        one VisionEgg.FrameArchive file.
+
+        See also export_movie_parallel(), which renders in several
+        processes."""
         import VisionEgg.Core # here to prevent circular import
-        import Image # Could import this at the beginning of the file, but it breaks sometimes!
         import os # Could also import this, but this is the only place its needed
 
         # Create shorthand notation, which speeds the main loop
@@ -512,6 +767,11 @@ class Presentation(VisionEgg.ClassWithParameters):
 
         logger = logging.getLogger('VisionEgg.FlowControl')
 
+        # Timelines assume frames at the monitor refresh rate, not
+        # frames_per_sec, so evaluate all controllers.
+        if self._timelines:
+            self._set_timelines({})
+
         # Go!
 
         self.time_sec_absolute=VisionEgg.time_func()
@@ -523,70 +783,101 @@ class Presentation(VisionEgg.ClassWithParameters):
             go_started=1,
             doing_transition=1)
 
-        # Do the main loop
-        image_no = 1
-        if p.go_duration[0] == 'forever': # forever
-            current_duration_value = 0
-        elif p.go_duration[1] == 'seconds': # duration units
-            current_duration_value = self.time_sec_since_go
-        elif p.go_duration[1] == 'frames': # duration units
-            current_duration_value = self.frames_since_go
+        # Get list of screens
+        screens = []
+        for viewport in p.viewports:
+            s = viewport.parameters.screen
+            if s not in screens:
+                screens.append(s)
+        screen = screens[-1]
+
+        # Read back and save frames in the background
+        if archive_filename is not None:
+            import VisionEgg.FrameArchive
+            archive = VisionEgg.FrameArchive.FrameArchiveWriter(
+                os.path.join( path, archive_filename ), first_frame_number=1)
+            save_frame = archive.encode_frame
+            logger.info("Saving frames to '%s'"%archive_filename)
         else:
-            raise RuntimeError("Unknown duration unit '%s'"%p.go_duration[1])
-        while (current_duration_value < p.go_duration[0]):
-            # Get list of screens
-            screens = []
-            for viewport in p.viewports:
-                s = viewport.parameters.screen
-                if s not in screens:
-                    screens.append(s)
-
-            # Clear the screen(s)
-            for screen in screens:
-                screen.clear()
-
-            # Update all the realtime parameters
-            self.__call_controllers(
-                go_started=1,
-                doing_transition=0)
-
-            # Draw each viewport
-            for viewport in p.viewports:
-                viewport.draw()
-
-            # Swap the buffers
-            VisionEgg.Core.swap_buffers()
-
-            # Now save the contents of the framebuffer
-            fb_image = screen.get_framebuffer_as_image(buffer='front',format=gl.GL_RGB)
-            filename = "%s%04d%s"%(filename_base,image_no,filename_suffix)
-            savepath = os.path.join( path, filename )
-            logger.info("Saving '%s'"%filename)
-            fb_image.save( savepath )
-            image_no = image_no + 1
-
-            # Set the time variables for the next frame
-            self.time_sec_absolute += 1.0/frames_per_sec
-            self.time_sec_since_go += 1.0/frames_per_sec
-            self.frames_absolute += 1
-            self.frames_since_go += 1
+            import Image # Could import this at the beginning of the file, but it breaks sometimes!
+            archive = None
+            def save_frame(image_no, fb_array):
+                size = fb_array.shape[1], fb_array.shape[0]
+                fb_image = Image.fromstring('RGB',size,fb_array.tostring())
+                filename = "%s%04d%s"%(filename_base,image_no,filename_suffix)
+                logger.info("Saving '%s'"%filename)
+                fb_image.save( os.path.join( path, filename ) )
+        # Without a back buffer, frames are drawn to the front buffer
+        if screen.constant_parameters.double_buffer:
+            read_buffer = 'back'
+        else:
+            read_buffer = 'front'
+        frame_capture = VisionEgg.Core.FramebufferCapture(screen,save_frame,
+                                                          buffer=read_buffer)
 
-            # Make sure we use the right value to check if we're done
-            if p.go_duration[0] == 'forever':
-                pass # current_duration_value already set to 0
-            elif p.go_duration[1] == 'seconds':
+        try:
+            # Do the main loop
+            image_no = 1
+            if p.go_duration[0] == 'forever': # forever
+                current_duration_value = 0
+            elif p.go_duration[1] == 'seconds': # duration units
                 current_duration_value = self.time_sec_since_go
-            elif p.go_duration[1] == 'frames':
+            elif p.go_duration[1] == 'frames': # duration units
                 current_duration_value = self.frames_since_go
             else:
                 raise RuntimeError("Unknown duration unit '%s'"%p.go_duration[1])
+            while (current_duration_value < p.go_duration[0]):
+                # Clear the screen(s)
+                for screen in screens:
+                    screen.clear()
+
+                # Update all the realtime parameters
+                self.__call_controllers(
+                    go_started=1,
+                    doing_transition=0)
+
+                # Draw each viewport
+                for viewport in p.viewports:
+                    viewport.draw()
+
+                # Start reading the framebuffer
+                if archive is not None:
+                    frame_capture.capture(image_no,self.get_frame_info())
+                else:
+                    frame_capture.capture(image_no)
+                image_no = image_no + 1
+
+                # Swap the buffers
+                VisionEgg.Core.swap_buffers()
+
+                # Set the time variables for the next frame
+                self.time_sec_absolute += 1.0/frames_per_sec
+                self.time_sec_since_go += 1.0/frames_per_sec
+                self.frames_absolute += 1
+                self.frames_since_go += 1
+
+                # Make sure we use the right value to check if we're done
+                if p.go_duration[0] == 'forever':
+                    pass # current_duration_value already set to 0
+                elif p.go_duration[1] == 'seconds':
+                    current_duration_value = self.time_sec_since_go
+                elif p.go_duration[1] == 'frames':
+                    current_duration_value = self.frames_since_go
+                else:
+                    raise RuntimeError("Unknown duration unit '%s'"%p.go_duration[1])
 
-            # Check events if requested
-            if p.check_events:
-                for event in pygame.event.get():
-                    for event_type, event_callback in p.handle_event_callbacks:
-                        if event.type is event_type:
-                            event_callback(event)
+                # Check events if requested
+                if p.check_events:
+                    for event in pygame.event.get():
+                        for event_type, event_callback in p.handle_event_callbacks:
+                            if event.type is event_type:
+                                event_callback(event)
+
+        finally:
+            # Wait for the remaining frames to be saved
+            frame_capture.close()
+            if archive is not None:
+                archive.close()
 
         # Tell transitional controllers a presentation has ended
         self.__call_controllers(
@@ -611,6 +902,275 @@ class Presentation(VisionEgg.ClassWithParameters):
         # Restore VisionEgg.time_func
         VisionEgg.time_func = true_time_func
 
+    def replay_go(self, frame_times_sec, start_time_sec=None, frame_numbers=None):
+        """Reconstruct a recorded go loop as fast as possible.
+
+        frame_times_sec is the absolute time given to the controllers
+        for each frame of the recorded go loop, for example
+        VisionEgg.FrameArchive.FrameArchiveReader.get_timestamps() of
+        an archive recorded with set_frame_capture(...,frame_info=True).
+        start_time_sec is the absolute time at which the go loop
+        started (the transitional controllers are called with it).
+        It defaults to the override_t_abs_sec parameter, if set, and
+        otherwise to the first frame time.  frame_numbers gives the
+        frames_since_go of each frame, if not consecutive from 0.
+
+        Every controller is called with the recorded times, and
+        VisionEgg.time_func returns them too, but no time is spent
+        waiting: the buffers are not swapped, so nothing waits for the
+        vertical retrace.  The frames are usually captured with
+        set_frame_capture() on a VisionEgg.Core.OffscreenScreen.  As
+        in go(), timelines are used if the precompute_timelines
+        parameter is true.  The go_duration parameter is ignored."""
+        import VisionEgg.Core # here to prevent circular import
+        p = self.parameters
+        frame_capture = self._frame_capture
+
+        if frame_numbers is None:
+            frame_numbers = xrange(len(frame_times_sec))
+        elif len(frame_numbers) != len(frame_times_sec):
+            raise ValueError("frame_numbers and frame_times_sec differ in length")
+        if start_time_sec is None:
+            if p.override_t_abs_sec is not None:
+                start_time_sec = p.override_t_abs_sec
+            elif len(frame_times_sec):
+                start_time_sec = frame_times_sec[0]
+            else:
+                return # nothing to replay
+
+        if p.precompute_timelines:
+            self.compute_timelines()
+        elif self._timelines:
+            self._set_timelines({})
+
+        true_time_func = VisionEgg.time_func
+        def fake_time_func():
+            return self.time_sec_absolute
+        VisionEgg.time_func = fake_time_func
+        self.in_go_loop = 1
+        try:
+            screens = []
+            for viewport in p.viewports:
+                s = viewport.parameters.screen
+                if s not in screens:
+                    screens.append(s)
+
+            start_frames_absolute = self.frames_absolute
+            self.time_sec_absolute = start_time_sec
+            self.last_go_loop_start_time_absolute_sec = start_time_sec
+            self.time_sec_since_go = 0.0
+            self.frames_since_go = 0
+
+            # Tell transitional controllers a presentation is starting
+            self.__call_controllers(
+                go_started=1,
+                doing_transition=1)
+
+            for frame_time_sec, frame in zip(frame_times_sec, frame_numbers):
+                self.time_sec_absolute = float(frame_time_sec)
+                self.time_sec_since_go = self.time_sec_absolute - start_time_sec
+                self.frames_since_go = int(frame)
+                self.frames_absolute = start_frames_absolute + self.frames_since_go
+
+                for screen in screens:
+                    screen.clear()
+                self.__call_controllers(
+                    go_started=1,
+                    doing_transition=0)
+                for viewport in p.viewports:
+                    viewport.draw()
+                if frame_capture is not None:
+                    if self._frame_capture_info:
+                        frame_capture.capture(self.frames_since_go,self.get_frame_info())
+                    else:
+                        frame_capture.capture(self.frames_since_go)
+
+            # Tell transitional controllers a presentation has ended
+            self.__call_controllers(
+                go_started=0,
+                doing_transition=1)
+        finally:
+            VisionEgg.time_func = true_time_func
+            self.in_go_loop = 0
+
+    def get_export_num_frames(self, frames_per_sec):
+        """Return the number of frames export_movie_go() would save."""
+        p = self.parameters
+        if p.go_duration[0] == 'forever':
+            raise ValueError("Cannot export a movie of a 'forever' go loop")
+        elif p.go_duration[1] == 'frames':
+            return int(math.ceil(p.go_duration[0]))
+        elif p.go_duration[1] == 'seconds':
+            # Count the same way as export_movie_go()
+            num_frames = 0
+            time_sec_since_go = 0.0
+            while time_sec_since_go < p.go_duration[0]:
+                time_sec_since_go += 1.0/frames_per_sec
+                num_frames += 1
+            return num_frames
+        else:
+            raise RuntimeError("Unknown duration unit '%s'"%p.go_duration[1])
+
+    def __set_export_frame(self, frame, frames_per_sec,
+                           start_time_sec, start_frames_absolute):
+        self.time_sec_since_go = frame/float(frames_per_sec)
+        self.time_sec_absolute = start_time_sec + self.time_sec_since_go
+        self.frames_since_go = frame
+        self.frames_absolute = start_frames_absolute + frame
+
+    def __set_controller_time(self, controller):
+        """Give controller the temporal variables of the current frame."""
+        if controller.temporal_variables & TIME_SEC_ABSOLUTE:
+            controller.time_sec_absolute = self.time_sec_absolute
+        if controller.temporal_variables & FRAMES_ABSOLUTE:
+            controller.frames_absolute = self.frames_absolute
+        if controller.temporal_variables & TIME_SEC_SINCE_GO:
+            controller.time_sec_since_go = self.time_sec_since_go
+        if controller.temporal_variables & FRAMES_SINCE_GO:
+            controller.frames_since_go = self.frames_since_go
+
+    def __catch_up_divided_controllers(self, frame, frames_per_sec,
+                                       start_time_sec, start_frames_absolute):
+        """Evaluate controllers with eval_frame_divisor > 1 as in order.
+
+        Each is evaluated at the last frame up to frame on which it
+        would have been due when drawing the movie in order, unless
+        that is frame itself (where it is evaluated anyway) or it
+        would not have been due yet."""
+        for (parameters_instance, parameter_name, controller) in self.controllers:
+            eval_frequency = controller.eval_frequency
+            if not (eval_frequency & EVERY_FRAME) or (eval_frequency & (ONCE|NOT_DURING_GO)):
+                continue
+            divisor = controller.eval_frame_divisor
+            if divisor <= 1:
+                continue
+            due_frame = frame - (frame - controller.eval_frame_phase) % divisor
+            if due_frame < 0 or due_frame == frame:
+                continue
+            self.__set_export_frame(due_frame,frames_per_sec,
+                                    start_time_sec,start_frames_absolute)
+            self.__set_controller_time(controller)
+            result = controller.during_go_eval()
+            if parameter_name is not None:
+                setattr(parameters_instance, parameter_name, result)
+
+    def render_movie_frames(self, frame_numbers, frames_per_sec=12.0,
+                            start_time_sec=0.0, start_frames_absolute=0):
+        """Render frames of a movie in any order and return them.
+
+        Unlike export_movie_go(), the time of each frame is computed
+        from its frame number alone: frame n is drawn at
+        start_time_sec + n/frames_per_sec seconds.  The controllers are
+        called once with doing_transition set at frame 0 and then for
+        each frame number.  This gives the same frames as drawing the
+        movie in order only if neither the controllers nor the stimuli
+        have hidden state (see find_hidden_state()).  Controllers with
+        an eval_frame_divisor greater than one are also evaluated, at
+        the frame they were last due, before the first frame and
+        before any frame not following the one before it.
+
+        Returns a list of arrays with shape (height,width,3), top row
+        first, read from the screen of the last viewport."""
+        import VisionEgg.Core # here to prevent circular import
+        p = self.parameters
+
+        if self._timelines:
+            self._set_timelines({})
+
+        true_time_func = VisionEgg.time_func
+        def fake_time_func():
+            return self.time_sec_absolute
+        VisionEgg.time_func = fake_time_func
+        try:
+            screens = []
+            for viewport in p.viewports:
+                s = viewport.parameters.screen
+                if s not in screens:
+                    screens.append(s)
+
+            self.__set_export_frame(0,frames_per_sec,
+                                    start_time_sec,start_frames_absolute)
+            self.__call_controllers(
+                go_started=1,
+                doing_transition=1)
+
+            frames = []
+            previous_frame = None
+            for frame in frame_numbers:
+                if previous_frame is None or frame != previous_frame+1:
+                    self.__catch_up_divided_controllers(frame,frames_per_sec,
+                                                        start_time_sec,start_frames_absolute)
+                previous_frame = frame
+                self.__set_export_frame(frame,frames_per_sec,
+                                        start_time_sec,start_frames_absolute)
+                for screen in screens:
+                    screen.clear()
+                self.__call_controllers(
+                    go_started=1,
+                    doing_transition=0)
+                for viewport in p.viewports:
+                    viewport.draw()
+                VisionEgg.Core.swap_buffers()
+                fb_array = screen.get_framebuffer_as_array(buffer='front',format=gl.GL_RGB)
+                frames.append(fb_array[::-1])
+        finally:
+            VisionEgg.time_func = true_time_func
+        return frames
+
+    def find_hidden_state(self, frames_per_sec=12.0, num_frames=None):
+        """Return descriptions of controllers and stimuli with hidden state.
+
+        A movie can only be rendered out of order (for example, by
+        export_movie_parallel()) if each frame depends only on its
+        time.  Each controller evaluated during the go loop is called
+        at frame 0, at the last frame and at frame 0 again.  A
+        controller has hidden state if the two results at frame 0
+        differ, or if its result changes although it does not use any
+        temporal variable.  Stimuli with a true draw_has_hidden_state
+        attribute (such as VisionEgg.Dots.DotArea2D, which moves its
+        dots a little every frame) are also reported.
+
+        This calls the controllers, so it may change their state.
+        Returns an empty list if no hidden state was found."""
+        if num_frames is None:
+            num_frames = self.get_export_num_frames(frames_per_sec)
+        last_frame = max(num_frames-1,1)
+        problems = []
+        for (parameters_instance, parameter_name, controller) in self.controllers:
+            if isinstance(controller,ConstantController):
+                continue
+            if controller.eval_frequency & NOT_DURING_GO:
+                continue
+            if not (controller.eval_frequency & (EVERY_FRAME|TRANSITIONS|ONCE)):
+                continue
+            results = []
+            for frame in (0,last_frame,0):
+                self.__set_export_frame(frame,frames_per_sec,0.0,0)
+                self.__set_controller_time(controller)
+                result = controller.during_go_eval()
+                if isinstance(controller,BatchController):
+                    result = [getattr(c.parameters,n) for (c,n) in controller.targets]
+                results.append(_copy_result(result))
+            if not _results_equal(results[0],results[2]):
+                reason = 'gives a different result when called again at the same time'
+            elif (controller.temporal_variables == TIME_INDEPENDENT and
+                  not _results_equal(results[0],results[1])):
+                reason = 'changes without any temporal variable'
+            else:
+                continue
+            if parameter_name is None:
+                description = '%s %s'%(controller.__class__.__name__,reason)
+            else:
+                description = '%s controlling %s %s'%(
+                    controller.__class__.__name__,parameter_name,reason)
+            problems.append(description)
+        for viewport in self.parameters.viewports:
+            for stimulus in viewport.parameters.stimuli:
+                if getattr(stimulus,'draw_has_hidden_state',False):
+                    problems.append('%s changes every time it is drawn'%(
+                        stimulus.__class__.__name__,))
+        return problems
+
     def run_forever(self):
         """Main control loop between go loops."""
         p = self.parameters
@@ -666,6 +1226,396 @@ class Presentation(VisionEgg.ClassWithParameters):
         VisionEgg.Core.swap_buffers()
         self.frames_absolute += 1
 
+class ControllerSchedule:
+    """Controllers due in one kind of call from Presentation.
+
+    Presentation calls its controllers in four situations: during the
+    go loop, on entry to and exit from the go loop (transitions), and
+    between go loops, either regularly or as a transition.  Rather
+    than re-testing the eval_frequency and temporal_variables flags of
+    every controller on every frame, Presentation builds one instance
+    of this class per situation and re-uses it until its controllers
+    change.
+
+    Attributes:
+
+    time_sec_absolute -- controllers needing time_sec_absolute set
+    frames_absolute   -- controllers needing frames_absolute set
+    time_sec_since_go -- controllers needing time_sec_since_go set
+    frames_since_go   -- controllers needing frames_since_go set
+    evaluate          -- list of (parameters, parameter_name, eval_func)
+    done_once         -- controllers with the ONCE flag to clear
+    period            -- frames after which the evaluations due repeat
+
+    Controllers with an eval_frame_divisor greater than one are only
+    due on some frames, so call get_evaluate() with the current frame
+    number rather than using the evaluate attribute directly.  The
+    list of evaluations due on each frame of the period is built once.
+
+    If timelines (a dictionary mapping controllers to
+    ControllerTimeline instances) is given, the timelines are used in
+    place of the controllers during the go loop.
+    """
+    # Don't remember the lists for each frame of very long periods
+    # (e.g. of divisors that are large coprime numbers).
+    max_period_cached = 3600
+
+    def __init__(self, controllers, go_started, doing_transition, timelines=None):
+        self.time_sec_absolute = []
+        self.frames_absolute = []
+        self.time_sec_since_go = []
+        self.frames_since_go = []
+        self.evaluate = []
+        self.done_once = []
+        self.period = 1
+        self.__divided_evaluate = []
+        self.__evaluate_by_frame = {}
+
+        for (parameters_instance, parameter_name, controller) in controllers:
+            eval_frequency = controller.eval_frequency
+            temporal_variables = controller.temporal_variables
+            divisor, phase = 1, 0
+            if eval_frequency & ONCE:
+                self.done_once.append(controller)
+            elif doing_transition and (eval_frequency & TRANSITIONS):
+                pass
+            elif eval_frequency & EVERY_FRAME:
+                divisor = controller.eval_frame_divisor
+                phase = controller.eval_frame_phase
+            else:
+                continue # not due in this kind of call
+
+            if go_started:
+                if eval_frequency & NOT_DURING_GO:
+                    continue
+                if timelines and controller in timelines:
+                    eval_func = timelines[controller].during_go_eval
+                else:
+                    eval_func = controller.during_go_eval
+            else:
+                if eval_frequency & NOT_BETWEEN_GO:
+                    continue
+                eval_func = controller.between_go_eval
+
+            if temporal_variables & TIME_SEC_ABSOLUTE:
+                self.time_sec_absolute.append(controller)
+            if temporal_variables & FRAMES_ABSOLUTE:
+                self.frames_absolute.append(controller)
+            if temporal_variables & TIME_SEC_SINCE_GO:
+                self.time_sec_since_go.append(controller)
+            if temporal_variables & FRAMES_SINCE_GO:
+                self.frames_since_go.append(controller)
+            self.evaluate.append( (parameters_instance, parameter_name, eval_func) )
+            self.__divided_evaluate.append( (parameters_instance, parameter_name, eval_func, divisor, phase) )
+            if divisor > 1:
+                self.period = _lcm(self.period,divisor)
+
+    def get_evaluate(self, frame):
+        """Return list of (parameters, parameter_name, eval_func) due on frame."""
+        if self.period == 1:
+            return self.evaluate
+        frame = frame % self.period
+        evaluate = self.__evaluate_by_frame.get(frame)
+        if evaluate is None:
+            evaluate = [(parameters_instance, parameter_name, eval_func)
+                        for (parameters_instance, parameter_name, eval_func, divisor, phase) in self.__divided_evaluate
+                        if frame % divisor == phase]
+            if self.period <= self.max_period_cached:
+                self.__evaluate_by_frame[frame] = evaluate
+        return evaluate
+
+    def __len__(self):
+        return len(self.evaluate)
+
+def _lcm(a,b):
+    x, y = a, b
+    while y:
+        x, y = y, x % y
+    return a*b//x
+
+class ControllerTimeline:
+    """Values of a time-deterministic controller sampled before a go loop.
+
+    The controller must be an EvalStringController or
+    FunctionController evaluated every frame during the go loop, and
+    its only temporal variables may be t and f (TIME_SEC_SINCE_GO and
+    FRAMES_SINCE_GO).  It is sampled at t = f/frame_rate_hz for f = 0,
+    1, ..., num_frames-1, first by a single evaluation with t and f as
+    arrays and, if that fails or disagrees with ordinary evaluation at
+    a few frames, by one evaluation per frame.  ValueError is raised
+    if the controller cannot be sampled.
+
+    During the go loop, during_go_eval() is called in place of the
+    controller's.  If the controller uses f, the current sample is
+    the one at frames_since_go, otherwise it is the sample nearest to
+    time_sec_since_go.  Beyond the last sample the controller itself
+    is evaluated.
+
+    Attributes:
+
+    controller    -- the sampled controller
+    frame_rate_hz -- frame rate assumed when sampling
+    index_by      -- 'frames' or 'seconds' (see above)
+    values        -- array of samples, one row per frame
+    vectorized    -- true if sampled by a single evaluation
+    """
+    def __init__(self, controller, num_frames, frame_rate_hz):
+        if not isinstance(controller,(EvalStringController,FunctionController)):
+            raise ValueError("only EvalStringController and FunctionController can be sampled")
+        if (not (controller.eval_frequency & EVERY_FRAME) or
+            (controller.eval_frequency & NOT_DURING_GO)):
+            raise ValueError("not evaluated every frame during go loop")
+        temporal_variables = controller.temporal_variables
+        if (temporal_variables & (TIME_SEC_ABSOLUTE|FRAMES_ABSOLUTE) or
+            not temporal_variables & (TIME_SEC_SINCE_GO|FRAMES_SINCE_GO)):
+            raise ValueError("does not depend only on t and/or f")
+        if num_frames < 1:
+            raise ValueError("no frames to sample")
+
+        self.controller = controller
+        self.frame_rate_hz = float(frame_rate_hz)
+        self.num_frames = num_frames
+        if temporal_variables & FRAMES_SINCE_GO:
+            self.index_by = 'frames'
+        else:
+            self.index_by = 'seconds'
+
+        try:
+            first = self.__sample(0,0.0)
+            convert = _get_timeline_converter(first)
+            frames = numpy.arange(num_frames)
+            self.values = self.__sample_vectorized(frames, first)
+            self.vectorized = self.values is not None
+            if not self.vectorized:
+                samples = [first]
+                for frame in range(1,num_frames):
+                    samples.append(self.__sample(frame,frame/self.frame_rate_hz))
+                self.values = numpy.array(samples)
+                if self.values.dtype.kind not in 'biuf':
+                    raise ValueError("controller values are not numeric")
+        finally:
+            # leave the controller as between go loops
+            if temporal_variables & TIME_SEC_SINCE_GO:
+                controller.time_sec_since_go = None
+            if temporal_variables & FRAMES_SINCE_GO:
+                controller.frames_since_go = None
+        self.__lookup = [convert(row) for row in self.values]
+
+    def __sample(self, frames, times):
+        controller = self.controller
+        if controller.temporal_variables & TIME_SEC_SINCE_GO:
+            controller.time_sec_since_go = times
+        if controller.temporal_variables & FRAMES_SINCE_GO:
+            controller.frames_since_go = frames
+        return controller.during_go_eval()
+
+    def __sample_vectorized(self, frames, first):
+        """Sample all frames at once, or return None if that fails."""
+        shape = (len(frames),) + numpy.shape(first)
+        try:
+            result = self.__sample(frames, frames/self.frame_rate_hz)
+            if isinstance(first,(tuple,list)):
+                values = numpy.empty(shape,dtype=numpy.float64)
+                if len(result) != shape[1]:
+                    return None
+                for i in range(shape[1]):
+                    values[:,i] = result[i]
+            else:
+                values = numpy.empty(shape,dtype=numpy.asarray(first).dtype)
+                values[...] = result
+            # check against ordinary evaluation
+            for frame in (0, len(frames)//2, len(frames)-1):
+                sample = self.__sample(frame,frame/self.frame_rate_hz)
+                if not numpy.allclose(numpy.asarray(values[frame],dtype=numpy.float64),
+                                      numpy.asarray(sample,dtype=numpy.float64)):
+                    return None
+        except Exception:
+            return None
+        return values
+
+    def __len__(self):
+        return self.num_frames
+
+    def during_go_eval(self):
+        """Called by Presentation in place of the controller's method."""
+        if self.index_by == 'frames':
+            index = self.controller.frames_since_go
+        else:
+            index = int(self.controller.time_sec_since_go*self.frame_rate_hz + 0.5)
+        if index < self.num_frames:
+            return self.__lookup[index]
+        return self.controller.during_go_eval()
+
+def _get_scalar_converter(sample):
+    if isinstance(sample,numpy.generic):
+        sample = sample.item()
+    if isinstance(sample,bool):
+        return bool
+    elif isinstance(sample,(int,long)):
+        return int
+    elif isinstance(sample,float):
+        return float
+    raise ValueError("cannot store values of %s in a timeline"%(type(sample),))
+
+def _get_timeline_converter(sample):
+    """Return a function converting a row of samples to the type of sample."""
+    if isinstance(sample,tuple) or isinstance(sample,list):
+        converters = [_get_scalar_converter(x) for x in sample]
+        sequence_type = type(sample)
+        def convert(row):
+            return sequence_type([f(x) for f,x in zip(converters,row)])
+        return convert
+    elif isinstance(sample,numpy.ndarray):
+        if sample.dtype.kind not in 'biuf':
+            raise ValueError("cannot store arrays of %s in a timeline"%(sample.dtype,))
+        return numpy.array # copy, so the parameter can't alter the timeline
+    else:
+        return _get_scalar_converter(sample)
+
+def _copy_result(result):
+    if isinstance(result,numpy.ndarray):
+        return result.copy()
+    elif isinstance(result,list):
+        return map(_copy_result,result)
+    elif isinstance(result,tuple):
+        return tuple(map(_copy_result,result))
+    return result
+
+def _results_equal(a,b):
+    if isinstance(a,numpy.ndarray) or isinstance(b,numpy.ndarray):
+        return numpy.shape(a) == numpy.shape(b) and numpy.all(numpy.equal(a,b))
+    elif isinstance(a,(list,tuple)) and isinstance(b,(list,tuple)):
+        if len(a) != len(b):
+            return False
+        for ai, bi in zip(a,b):
+            if not _results_equal(ai,bi):
+                return False
+        return True
+    return a == b
+
+####################################################################
+#
+#        Parallel movie export
+#
+####################################################################
+
+# State of a worker process of export_movie_parallel().  The parent
+# sets 'make_presentation' before the worker processes are forked.
+_movie_worker = {}
+
+def _get_movie_worker_presentation():
+    import VisionEgg.Core # here to prevent circular import
+    if 'presentation' not in _movie_worker:
+        if 'screen' not in _movie_worker:
+            _movie_worker['screen'] = VisionEgg.Core.OffscreenScreen(
+                **_movie_worker['screen_kw'])
+        presentation = _movie_worker['make_presentation'](_movie_worker['screen'])
+        _movie_worker['presentation'] = presentation
+        _movie_worker['start_frames_absolute'] = presentation.frames_absolute
+    return _movie_worker['presentation']
+
+def _movie_worker_check(frames_per_sec):
+    presentation = _get_movie_worker_presentation()
+    num_frames = presentation.get_export_num_frames(frames_per_sec)
+    problems = presentation.find_hidden_state(frames_per_sec,num_frames)
+    # Checking called the controllers, so start again for rendering.
+    del _movie_worker['presentation']
+    return num_frames, problems
+
+def _movie_worker_render(args):
+    frame_numbers, frames_per_sec, start_time_sec = args
+    presentation = _get_movie_worker_presentation()
+    return presentation.render_movie_frames(
+        frame_numbers,
+        frames_per_sec=frames_per_sec,
+        start_time_sec=start_time_sec,
+        start_frames_absolute=_movie_worker['start_frames_absolute'])
+
+def iter_movie_frames_parallel(make_presentation, frames_per_sec=12.0,
+                               size=None, num_processes=None,
+                               chunk_frames=12, check_hidden_state=True):
+    """Render a movie in several processes and yield its frames in order.
+
+    make_presentation is called in each worker process with an
+    instance of VisionEgg.Core.OffscreenScreen of the given size and
+    must return an instance of Presentation whose viewports draw on
+    that screen.  (The worker processes are forked, so
+    make_presentation does not need to be picklable.)  The worker
+    processes render chunks of chunk_frames consecutive frames with
+    Presentation.render_movie_frames(), and the frames are yielded as
+    (frame_number, array) tuples, where array has shape
+    (height,width,3) with the top row first.
+
+    Each worker draws frames out of order, so rendering is only
+    correct if each frame depends only on its time.  Unless
+    check_hidden_state is false, one worker first calls
+    Presentation.find_hidden_state() and RuntimeError is raised if
+    anything is found.
+
+    The parent process does not need an OpenGL context, and should
+    not have one.  Set VISIONEGG_OFFSCREEN_BACKEND before importing
+    VisionEgg.Core so the workers can create an OffscreenScreen.
+    Requires an operating system with fork(), such as linux."""
+    import multiprocessing
+
+    logger = logging.getLogger('VisionEgg.FlowControl')
+    screen_kw = {}
+    if size is not None:
+        screen_kw['size'] = size
+    _movie_worker.clear()
+    _movie_worker['make_presentation'] = make_presentation
+    _movie_worker['screen_kw'] = screen_kw
+    pool = multiprocessing.Pool(num_processes)
+    finished = False
+    try:
+        num_frames, problems = pool.apply(_movie_worker_check,(frames_per_sec,))
+        if check_hidden_state and len(problems):
+            raise RuntimeError("Cannot render movie in parallel because "
+                               "of hidden state: %s"%('; '.join(problems),))
+        start_time_sec = VisionEgg.time_func()
+        chunks = []
+        for first in range(0,num_frames,chunk_frames):
+            frame_numbers = range(first,min(first+chunk_frames,num_frames))
+            chunks.append((frame_numbers,frames_per_sec,start_time_sec))
+        logger.info("Rendering %d frames in %d chunks"%(num_frames,len(chunks)))
+        frame = 0
+        for frames in pool.imap(_movie_worker_render,chunks):
+            for fb_array in frames:
+                yield frame, fb_array
+                frame += 1
+        finished = True
+    finally:
+        if finished:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+        _movie_worker.clear()
+
+def export_movie_parallel(make_presentation, frames_per_sec=12.0,
+                          filename_suffix=".tif",
+                          filename_base="visionegg_movie", path=".",
+                          size=None, num_processes=None, chunk_frames=12):
+    """Save a movie like Presentation.export_movie_go() using several processes.
+
+    See iter_movie_frames_parallel() for the meaning of
+    make_presentation and the requirements.  The image files are
+    numbered as by export_movie_go()."""
+    import Image # Could import this at the beginning of the file, but it breaks sometimes!
+    import os # Could also import this, but this is only needed here
+
+    logger = logging.getLogger('VisionEgg.FlowControl')
+    for frame, fb_array in iter_movie_frames_parallel(make_presentation,
+                                                      frames_per_sec=frames_per_sec,
+                                                      size=size,
+                                                      num_processes=num_processes,
+                                                      chunk_frames=chunk_frames):
+        size = fb_array.shape[1], fb_array.shape[0]
+        fb_image = Image.fromstring('RGB',size,fb_array.tostring())
+        filename = "%s%04d%s"%(filename_base,frame+1,filename_suffix)
+        logger.info("Saving '%s'"%filename)
+        fb_image.save( os.path.join( path, filename ) )
+
 ####################################################################
 #
 #        Controller
@@ -723,6 +1673,17 @@ class Controller(object):
 
     NEVER          -- this controller is never called
 
+    Expensive controllers need not be evaluated every frame. If the
+    attribute "eval_frame_divisor" is N, a controller with the
+    EVERY_FRAME flag is evaluated only on every Nth frame, namely
+    those for which the frame number modulo N equals the attribute
+    "eval_frame_phase". (The frame number is frames since go during
+    go loops and absolute frames otherwise.) On the other frames the
+    parameter keeps the last value set. Giving several controllers
+    the same divisor but different phases spreads their work across
+    frames. set_eval_rate() chooses the divisor for a target rate in
+    Hz. The ONCE and TRANSITIONS flags are not affected.
+
     A Controller instance's attribute "temporal_variables" controls
     what time variables are set for use. This variable is a bitwise
     "or" of the following flags:
@@ -786,10 +1747,21 @@ class Controller(object):
         'NOT_DURING_GO'     : NOT_DURING_GO,
         'NOT_BETWEEN_GO'    : NOT_BETWEEN_GO}
 
+    # Incremented whenever eval_frequency or temporal_variables of any
+    # controller changes, so that Presentation knows when its
+    # ControllerSchedule instances are stale.
+    _schedule_generation = 0
+
+    # Defaults for subclasses not calling Controller.__init__
+    _eval_frame_divisor = 1
+    _eval_frame_phase = 0
+
     def __init__(self,
                  eval_frequency = EVERY_FRAME,
                  temporal_variables = TIME_SEC_SINCE_GO,
-                 return_type = None):
+                 return_type = None,
+                 eval_frame_divisor = 1,
+                 eval_frame_phase = 0):
         """Create instance of Controller.
 
         Keyword arguments:
@@ -797,6 +1769,8 @@ class Controller(object):
         eval_frequency -- Int, bitwise "or" of flags
         temporal_variables -- Int, bitwise "or" of flags
         return_type -- a VisionEgg.ParameterTypes.ParameterTypeDef subclass
+        eval_frame_divisor -- Int, evaluate EVERY_FRAME only every Nth frame
+        eval_frame_phase -- Int, frame (modulo eval_frame_divisor) to evaluate
 
         If return_type is not set, it calls the function once to get a
         return value and then attempts to guess its type.
@@ -813,6 +1787,59 @@ class Controller(object):
 
         self.temporal_variables = temporal_variables
         self.eval_frequency = eval_frequency
+        self.set_eval_frame_divisor(eval_frame_divisor,eval_frame_phase)
+
+    def _get_eval_frequency(self):
+        return self._eval_frequency
+
+    def _set_eval_frequency(self,eval_frequency):
+        self._eval_frequency = eval_frequency
+        Controller._schedule_generation += 1
+
+    eval_frequency = property(_get_eval_frequency,_set_eval_frequency)
+
+    def _get_temporal_variables(self):
+        return self._temporal_variables
+
+    def _set_temporal_variables(self,temporal_variables):
+        self._temporal_variables = temporal_variables
+        Controller._schedule_generation += 1
+
+    temporal_variables = property(_get_temporal_variables,_set_temporal_variables)
+
+    def _get_eval_frame_divisor(self):
+        return self._eval_frame_divisor
+
+    def _get_eval_frame_phase(self):
+        return self._eval_frame_phase
+
+    eval_frame_divisor = property(_get_eval_frame_divisor)
+    eval_frame_phase = property(_get_eval_frame_phase)
+
+    def set_eval_frame_divisor(self,eval_frame_divisor,eval_frame_phase=0):
+        """Evaluate EVERY_FRAME only on frames where frame % divisor == phase."""
+        eval_frame_divisor = int(eval_frame_divisor)
+        eval_frame_phase = int(eval_frame_phase)
+        if eval_frame_divisor < 1:
+            raise ValueError("eval_frame_divisor must be at least 1")
+        if not (0 <= eval_frame_phase < eval_frame_divisor):
+            raise ValueError("eval_frame_phase must be at least 0 and less than eval_frame_divisor")
+        self._eval_frame_divisor = eval_frame_divisor
+        self._eval_frame_phase = eval_frame_phase
+        Controller._schedule_generation += 1
+
+    def set_eval_rate(self,rate_hz,eval_frame_phase=0):
+        """Evaluate EVERY_FRAME at approximately rate_hz.
+
+        The divisor is the nearest whole number of frames at
+        VISIONEGG_MONITOR_REFRESH_HZ, but at least one.  Returns the
+        divisor."""
+        if rate_hz <= 0:
+            raise ValueError("rate_hz must be positive")
+        refresh_hz = VisionEgg.config.VISIONEGG_MONITOR_REFRESH_HZ
+        eval_frame_divisor = max(1,int(round(refresh_hz/float(rate_hz))))
+        self.set_eval_frame_divisor(eval_frame_divisor,eval_frame_phase)
+        return eval_frame_divisor
 
     def evaluate_now(self):
         """Call this after updating the values of a controller if it's not evaluated EVERY_FRAME."""
@@ -1028,13 +2055,16 @@ class ExecStringController(Controller):
     variable x, so setting the string to "x=1.0" would set the
     parameter under control to 1.0.
 
-    To increase speed, the string is compiled to Python's
-    bytecode format.
+    To increase speed, the string is compiled once into the body of a
+    function with arguments t, t_abs, f and f_abs which returns x, so
+    evaluating the controller costs no more than calling a
+    FunctionController.
 
     The string can make use of temporal variables, which are made
     available depending on the controller's temporal_variables
     attribute. Note that only the absolute temporal variables are
-    available when the go loop is not running.
+    available when the go loop is not running.  (The remaining
+    variables are None.)
 
     flag(s) present    variable  description
     -----------------  --------  ----------------------------------
@@ -1043,6 +2073,10 @@ class ExecStringController(Controller):
     FRAMES_ABSOLUTE    f_abs     frames, continuously increasing
     FRAMES_SINCE_GO    f         frames, reset to 0 each go loop
 
+    If restricted_namespace is true, the string sees only the Numeric
+    and math modules and their contents.  Otherwise, it sees the
+    global namespace of the VisionEgg.FlowControl module.
+
     """
     def __init__(self,
                  during_go_exec_string = None,
@@ -1071,12 +2105,14 @@ class ExecStringController(Controller):
                 self.eval_globals[key] = getattr(math,key)
 
         self.during_go_exec_code = compile(during_go_exec_string,'<string>','exec')
+        self.during_go_exec_func = self.__compile_function(during_go_exec_string)
         self.during_go_exec_string = during_go_exec_string
         not_between_go = 0
         if between_go_exec_string is None:
             not_between_go = 1
         else:
             self.between_go_exec_code = compile(between_go_exec_string,'<string>','exec')
+            self.between_go_exec_func = self.__compile_function(between_go_exec_string)
             self.between_go_exec_string = between_go_exec_string
 
         # Check to make sure return_type is set
@@ -1098,8 +2134,32 @@ class ExecStringController(Controller):
                 logger.debug('Executing "%s" to test for return type.'%(between_go_exec_string,))
                 self.return_type = ve_types.get_type(self._test_self(go_started=0))
 
+    def __compile_function(self,exec_string):
+        """Compile exec_string into a function of t, t_abs, f and f_abs returning x."""
+        module = ast.parse(exec_string,'<string>','exec')
+        arg_names = ['t','t_abs','f','f_abs']
+        arguments = ast.arguments(args=[ast.Name(id=name,ctx=ast.Param()) for name in arg_names],
+                                  vararg=None,
+                                  kwarg=None,
+                                  defaults=[ast.Name(id='None',ctx=ast.Load()) for name in arg_names])
+        body = module.body + [ast.Return(value=ast.Name(id='x',ctx=ast.Load()))]
+        function_def = ast.FunctionDef(name='exec_string',
+                                       args=arguments,
+                                       body=body,
+                                       decorator_list=[])
+        module = ast.Module(body=[function_def])
+        ast.fix_missing_locations(module)
+        if self.restricted_namespace:
+            namespace = self.eval_globals
+        else:
+            namespace = globals()
+        function_locals = {}
+        exec compile(module,'<string>','exec') in namespace, function_locals
+        return function_locals['exec_string']
+
     def set_during_go_exec_string(self,during_go_exec_string):
         self.during_go_exec_code = compile(during_go_exec_string,'<string>','exec')
+        self.during_go_exec_func = self.__compile_function(during_go_exec_string)
         self.during_go_exec_string = during_go_exec_string
 
     def get_during_go_exec_string(self):
@@ -1107,6 +2167,7 @@ class ExecStringController(Controller):
 
     def set_between_go_exec_string(self,between_go_exec_string):
         self.between_go_exec_code = compile(between_go_exec_string,'<string>','exec')
+        self.between_go_exec_func = self.__compile_function(between_go_exec_string)
         self.between_go_exec_string = between_go_exec_string
         self.eval_frequency = self.eval_frequency & ~NOT_BETWEEN_GO
 
@@ -1118,43 +2179,25 @@ class ExecStringController(Controller):
 
     def during_go_eval(self):
         """Called by Presentation. Overrides method in Controller base class."""
-        eval_locals = {}
+        call_args = {}
         if self.temporal_variables & TIME_SEC_ABSOLUTE:
-            eval_locals['t_abs'] = self.time_sec_absolute
+            call_args['t_abs'] = self.time_sec_absolute
         if self.temporal_variables & TIME_SEC_SINCE_GO:
-            eval_locals['t'] = self.time_sec_since_go
+            call_args['t'] = self.time_sec_since_go
         if self.temporal_variables & FRAMES_ABSOLUTE:
-            eval_locals['f_abs'] = self.frames_absolute
+            call_args['f_abs'] = self.frames_absolute
         if self.temporal_variables & FRAMES_SINCE_GO:
-            eval_locals['f'] = self.frames_since_go
-        if self.restricted_namespace:
-            exec self.during_go_exec_code in self.eval_globals,eval_locals
-            return eval_locals['x']
-        else:
-            setup_locals_str = "\n"
-            for local_variable_name in eval_locals.keys():
-                setup_locals_str = setup_locals_str + local_variable_name + "=" + repr(eval_locals[local_variable_name]) + "\n"
-                exec setup_locals_str
-            exec self.during_go_exec_code
-            return x
+            call_args['f'] = self.frames_since_go
+        return self.during_go_exec_func(**call_args)
 
     def between_go_eval(self):
         """Called by Presentation. Overrides method in Controller base class."""
-        eval_locals = {}
+        call_args = {}
         if self.temporal_variables & TIME_SEC_ABSOLUTE:
-            eval_locals['t_abs'] = self.time_sec_absolute
+            call_args['t_abs'] = self.time_sec_absolute
         if self.temporal_variables & FRAMES_ABSOLUTE:
-            eval_locals['f_abs'] = self.frames_absolute
-        if self.restricted_namespace:
-            exec self.between_go_exec_code in self.eval_globals,eval_locals
-            return eval_locals['x']
-        else:
-            setup_locals_str = "\n"
-            for local_variable_name in eval_locals.keys():
-                setup_locals_str = setup_locals_str + local_variable_name + "=" + repr(eval_locals[local_variable_name]) + "\n"
-                exec setup_locals_str
-            exec self.between_go_exec_code
-            return x # x should be assigned by the exec string
+            call_args['f_abs'] = self.frames_absolute
+        return self.between_go_exec_func(**call_args) # x should be assigned by the exec string
 
 class FunctionController(Controller):
     """Set parameters using a Python function.
@@ -1255,6 +2298,344 @@ class FunctionController(Controller):
             call_args['f_abs'] = self.frames_absolute
         return self.between_go_func(**call_args)
 
+class BatchController(Controller):
+    """Set a parameter of many stimuli from one function evaluation.
+
+    Registering one controller per stimulus costs a function call per
+    stimulus per frame.  Instead, a BatchController calls a single
+    function, which returns a Numeric array with one row per target,
+    and sets row i as the value of the parameter of target i.  Rows
+    of two-dimensional arrays become tuples, so that, for example,
+    the position of many stimuli can be set from an array of shape
+    (len(targets),2).
+
+    Stimuli with parameters holding a whole array at once can be
+    given as columnar_targets; these are set to the array itself.
+
+    The function is called with temporal variables exactly like the
+    function of a FunctionController.  Add the controller to a
+    Presentation without a parameter to control:
+
+    p.add_controller(None,None,batch_controller)
+
+    """
+    def __init__(self,
+                 targets = None,
+                 during_go_func = None,
+                 between_go_func = None,
+                 columnar_targets = None,
+                 item_type = None,
+                 **kw
+                 ):
+        """Create an instance of BatchController.
+
+        Arguments:
+
+        targets -- sequence of (class_with_parameters, parameter_name)
+        during_go_func -- function evaluted during go loop
+        between_go_func -- function evaluted not during go loop
+        columnar_targets -- sequence of (class_with_parameters, parameter_name)
+        item_type -- a VisionEgg.ParameterTypes.ParameterTypeDef subclass
+
+        Keyword arguments:
+
+        temporal_variables -- a bitwise mask of constants
+
+        temporal_variables defaults to TIME_SEC_SINCE_GO.
+
+        If item_type, the type of each row, is not set, the function
+        is called once to check the shape and type of its return
+        value.
+
+        """
+        if during_go_func is None:
+            raise ValueError("Must specify during_go_func")
+        if targets is None:
+            targets = []
+        if columnar_targets is None:
+            columnar_targets = []
+        if not len(targets) and not len(columnar_targets):
+            raise ValueError("Must specify targets or columnar_targets")
+
+        kw.setdefault('temporal_variables',TIME_SEC_SINCE_GO) # default value
+        kw['return_type'] = ve_types.NoneType # parameters are set directly
+        Controller.__init__(self,**kw)
+        self.during_go_func = during_go_func
+        self.between_go_func = between_go_func
+        if between_go_func is None:
+            self.eval_frequency = self.eval_frequency|NOT_BETWEEN_GO
+
+        if item_type is None and len(targets):
+            logger = logging.getLogger('VisionEgg.FlowControl')
+            logger.debug('Evaluating %s to test for return type.'%(str(during_go_func),))
+            call_args = {}
+            if self.temporal_variables & TIME_SEC_ABSOLUTE:
+                call_args['t_abs'] = VisionEgg.time_func()
+            if self.temporal_variables & TIME_SEC_SINCE_GO:
+                call_args['t'] = 0.0
+            if self.temporal_variables & FRAMES_ABSOLUTE:
+                call_args['f_abs'] = 0
+            if self.temporal_variables & FRAMES_SINCE_GO:
+                call_args['f'] = 0
+            values = numpy.asarray(during_go_func(**call_args))
+            if values.ndim not in (1,2) or len(values) != len(targets):
+                raise ValueError("during_go_func must return an array with "
+                                 "one row per target (%d), not shape %s"%(len(targets),values.shape))
+            item_type = ve_types.get_type(self.__get_items(values)[0])
+
+        self.targets = []
+        for class_with_parameters, parameter_name in targets:
+            self.__check_target(class_with_parameters,parameter_name,item_type)
+            self.targets.append( (class_with_parameters,parameter_name) )
+        self.columnar_targets = []
+        for class_with_parameters, parameter_name in columnar_targets:
+            self.__check_target(class_with_parameters,parameter_name,None)
+            self.columnar_targets.append( (class_with_parameters,parameter_name) )
+
+        # Parallel lists for setting all parameters with map()
+        self.__target_parameters = [c.parameters for c,n in self.targets]
+        self.__target_names = [n for c,n in self.targets]
+        self.__columnar_parameters = [(c.parameters,n) for c,n in self.columnar_targets]
+
+    def __check_target(self,class_with_parameters,parameter_name,item_type):
+        if class_with_parameters.is_constant_parameter(parameter_name):
+            raise TypeError("Attempt to control constant parameter '%s' of class %s."%(parameter_name,class_with_parameters))
+        if not hasattr(class_with_parameters.parameters,parameter_name):
+            raise AttributeError("%s has no parameter '%s'"%(class_with_parameters,parameter_name))
+        if item_type is not None:
+            require_type = class_with_parameters.get_specified_type(parameter_name)
+            try:
+                ve_types.assert_type(item_type,require_type)
+            except TypeError:
+                raise TypeError("Attempting to control parameter '%s' of type %s with BatchController items of type %s"%(
+                    parameter_name,
+                    require_type,
+                    item_type))
+
+    def __get_items(self,values):
+        if values.ndim == 2:
+            return map(tuple,values.tolist())
+        return values.tolist()
+
+    def __set_parameters(self,values):
+        values = numpy.asarray(values)
+        for parameters, parameter_name in self.__columnar_parameters:
+            setattr(parameters,parameter_name,values)
+        if self.__target_parameters:
+            map(setattr,self.__target_parameters,self.__target_names,self.__get_items(values))
+
+    def during_go_eval(self):
+        """Called by Presentation. Overrides method in Controller base class."""
+        call_args = {}
+        if self.temporal_variables & TIME_SEC_ABSOLUTE:
+            call_args['t_abs'] = self.time_sec_absolute
+        if self.temporal_variables & TIME_SEC_SINCE_GO:
+            call_args['t'] = self.time_sec_since_go
+        if self.temporal_variables & FRAMES_ABSOLUTE:
+            call_args['f_abs'] = self.frames_absolute
+        if self.temporal_variables & FRAMES_SINCE_GO:
+            call_args['f'] = self.frames_since_go
+        self.__set_parameters(self.during_go_func(**call_args))
+        return None
+
+    def between_go_eval(self):
+        """Called by Presentation. Overrides method in Controller base class."""
+        call_args = {}
+        if self.temporal_variables & TIME_SEC_ABSOLUTE:
+            call_args['t_abs'] = self.time_sec_absolute
+        if self.temporal_variables & FRAMES_ABSOLUTE:
+            call_args['f_abs'] = self.frames_absolute
+        self.__set_parameters(self.between_go_func(**call_args))
+        return None
+
+class KeyframeController(Controller):
+    """Set parameters by interpolating between keyframes.
+
+    The keyframes are a sequence of (time, value) pairs with
+    increasing times.  Values may be numbers or sequences of numbers
+    of equal length, such as the position or color of a stimulus.
+    Before the first and after the last keyframe, the first and last
+    values are held.
+
+    Time is taken from the one temporal variable set in
+    temporal_variables (by default TIME_SEC_SINCE_GO), so keyframe
+    times may also be given in frames.  If this variable is only
+    available during the go loop, the controller is not evaluated
+    between go loops.
+
+    interpolation  description
+    -------------  ----------------------------------
+    'linear'       piecewise linear
+    'spline'       natural cubic spline
+    'step'         hold each value until the next keyframe
+
+    Interpolation coefficients are computed once, when the keyframes
+    are set, and the segment of the previous evaluation is remembered,
+    so each evaluation takes constant time when time advances
+    smoothly.  evaluate_times() evaluates many times at once, for
+    example to preview a trajectory or render offline.
+
+    """
+    interpolations = ('linear','spline','step')
+
+    __time_attributes = {Controller.TIME_SEC_ABSOLUTE : 'time_sec_absolute',
+                         Controller.TIME_SEC_SINCE_GO : 'time_sec_since_go',
+                         Controller.FRAMES_ABSOLUTE : 'frames_absolute',
+                         Controller.FRAMES_SINCE_GO : 'frames_since_go'}
+
+    def __init__(self,
+                 keyframes = None,
+                 interpolation = 'linear',
+                 **kw
+                 ):
+        """Create an instance of KeyframeController.
+
+        Arguments:
+
+        keyframes -- sequence of (time, value) pairs
+        interpolation -- 'linear', 'spline' or 'step'
+
+        Keyword arguments:
+
+        temporal_variables -- exactly one temporal variable flag
+        return_type -- a VisionEgg.ParameterTypes.ParameterTypeDef subclass
+
+        temporal_variables defaults to TIME_SEC_SINCE_GO.  If
+        return_type is not set, it is the type of the first value.
+
+        """
+        if keyframes is None:
+            raise ValueError("Must specify keyframes")
+        kw.setdefault('temporal_variables',TIME_SEC_SINCE_GO)
+        if kw['temporal_variables'] not in self.__time_attributes:
+            raise ValueError("KeyframeController requires exactly one temporal variable")
+        self.__set_keyframes(keyframes,interpolation)
+        if kw.get('return_type',None) is None:
+            kw['return_type'] = ve_types.get_type(self.__first_value)
+        Controller.__init__(self,**kw)
+        if self.temporal_variables & (TIME_SEC_SINCE_GO|FRAMES_SINCE_GO):
+            self.eval_frequency = self.eval_frequency|NOT_BETWEEN_GO
+
+    def set_keyframes(self,keyframes,interpolation=None):
+        """Replace the keyframes (and optionally the interpolation)."""
+        if interpolation is None:
+            interpolation = self.interpolation
+        self.__set_keyframes(keyframes,interpolation)
+        ve_types.assert_type(ve_types.get_type(self.__first_value),self.return_type)
+
+    def get_keyframes(self):
+        """Return the keyframes as a list of (time, value) pairs."""
+        return [(float(t),self.__to_value(v)) for t,v in zip(self.times,self.values)]
+
+    def __set_keyframes(self,keyframes,interpolation):
+        if interpolation not in self.interpolations:
+            raise ValueError("Unknown interpolation '%s'"%(interpolation,))
+        keyframes = list(keyframes)
+        if not len(keyframes):
+            raise ValueError("At least one keyframe is required")
+        times = numpy.array([t for t,v in keyframes],dtype=numpy.float64)
+        values = numpy.array([v for t,v in keyframes],dtype=numpy.float64)
+        if values.ndim not in (1,2):
+            raise ValueError("Keyframe values must be numbers or sequences of numbers")
+        if len(times) > 1 and not numpy.all(times[1:] > times[:-1]):
+            raise ValueError("Keyframe times must be increasing")
+
+        self.interpolation = interpolation
+        self.times = times
+        self.values = values
+        self.__is_vector = values.ndim == 2
+        values = values.reshape((len(times),-1))
+
+        # polynomial coefficients of each segment, value = a+b*dt+c*dt**2+d*dt**3
+        num_segments = len(times)-1
+        coefficients = numpy.zeros((num_segments,4,values.shape[1]),dtype=numpy.float64)
+        if num_segments:
+            h = (times[1:]-times[:-1])[:,numpy.newaxis]
+            coefficients[:,0] = values[:-1]
+            if interpolation == 'linear':
+                coefficients[:,1] = (values[1:]-values[:-1])/h
+            elif interpolation == 'spline':
+                # second derivatives, zero at the ends
+                n = len(times)
+                A = numpy.zeros((n,n),dtype=numpy.float64)
+                B = numpy.zeros(values.shape,dtype=numpy.float64)
+                A[0,0] = A[-1,-1] = 1.0
+                slopes = (values[1:]-values[:-1])/h
+                for i in range(1,n-1):
+                    A[i,i-1] = h[i-1,0]
+                    A[i,i] = 2.0*(h[i-1,0]+h[i,0])
+                    A[i,i+1] = h[i,0]
+                    B[i] = 6.0*(slopes[i]-slopes[i-1])
+                M = numpy.linalg.solve(A,B)
+                coefficients[:,1] = slopes - h*(2.0*M[:-1]+M[1:])/6.0
+                coefficients[:,2] = M[:-1]/2.0
+                coefficients[:,3] = (M[1:]-M[:-1])/(6.0*h)
+        self.__coefficients = coefficients
+
+        # Plain Python copies for evaluation of single times
+        self.__times = times.tolist()
+        self.__segment_coefficients = [zip(*segment.tolist()) for segment in coefficients]
+        self.__first_value = self.__to_value(self.values[0])
+        self.__last_value = self.__to_value(self.values[-1])
+        self.__segment = 0
+
+    def __to_value(self,row):
+        if self.__is_vector:
+            return tuple(row.tolist())
+        return float(row)
+
+    def __value_at(self,t):
+        times = self.__times
+        if t <= times[0]:
+            return self.__first_value
+        if t >= times[-1]:
+            return self.__last_value
+        segment = self.__segment
+        if not (times[segment] <= t < times[segment+1]):
+            if times[segment+1] <= t < times[segment+2]:
+                segment = segment+1 # the usual case when time advances
+            else:
+                segment = bisect.bisect_right(times,t)-1
+            self.__segment = segment
+        dt = t-times[segment]
+        result = [a+dt*(b+dt*(c+dt*d)) for (a,b,c,d) in self.__segment_coefficients[segment]]
+        if self.__is_vector:
+            return tuple(result)
+        return result[0]
+
+    def evaluate_times(self,times):
+        """Evaluate at each of a sequence of times.
+
+        Returns an array with one row per time."""
+        times = numpy.asarray(times,dtype=numpy.float64)
+        if len(self.times) == 1:
+            segments = numpy.zeros(times.shape,dtype=numpy.int_)
+            dt = numpy.zeros(times.shape+(1,),dtype=numpy.float64)
+            coefficients = numpy.zeros((1,4,self.__coefficients.shape[2]),dtype=numpy.float64)
+            coefficients[0,0] = self.values.reshape((1,-1))[0]
+        else:
+            clipped = numpy.clip(times,self.times[0],self.times[-1])
+            segments = numpy.searchsorted(self.times,clipped,side='right')-1
+            segments = numpy.clip(segments,0,len(self.times)-2)
+            dt = (clipped-self.times[segments])[...,numpy.newaxis]
+            coefficients = self.__coefficients
+        c = coefficients[segments]
+        result = c[...,0,:]+dt*(c[...,1,:]+dt*(c[...,2,:]+dt*c[...,3,:]))
+        result[times >= self.times[-1]] = self.values.reshape((len(self.times),-1))[-1]
+        if not self.__is_vector:
+            result = result[...,0]
+        return result
+
+    def during_go_eval(self):
+        """Called by Presentation. Overrides method in Controller base class."""
+        return self.__value_at(getattr(self,self.__time_attributes[self.temporal_variables]))
+
+    def between_go_eval(self):
+        """Called by Presentation. Overrides method in Controller base class."""
+        if self.temporal_variables & (TIME_SEC_SINCE_GO|FRAMES_SINCE_GO):
+            return self.__first_value
+        return self.__value_at(getattr(self,self.__time_attributes[self.temporal_variables]))
+
 class EncapsulatedController(Controller):
     """Set parameters by encapsulating another Controller.
 
@@ -1277,6 +2658,8 @@ class EncapsulatedController(Controller):
         self.return_type = self.contained_controller.return_type
         self.temporal_variables = self.contained_controller.temporal_variables
         self.eval_frequency = self.contained_controller.eval_frequency
+        self.set_eval_frame_divisor(self.contained_controller.eval_frame_divisor,
+                                    self.contained_controller.eval_frame_phase)
 
     def set_new_controller(self,new_controller):
         """Call this to encapsulate a (new) controller."""
@@ -0,0 +1,441 @@
+# The Vision Egg: FrameArchive
+#
+# URL: <http://www.visionegg.org/>
+#
+# Distributed under the terms of the GNU Lesser General Public License
+# (LGPL). See LICENSE.TXT that came with this file.
+
+"""
+Indexed archive of recorded frames.
+
+A frame archive stores many frames of the same shape in one file.
+Consecutive frames are compressed together in chunks, and each frame
+may have a dictionary of information, such as the time it was drawn
+and the values of the parameters set by controllers.  An index at
+the end of the file gives the position of each chunk and the time of
+each frame, so that any frame can be read without decompressing the
+others.
+
+FrameArchiveWriter.encode_frame() can be given to
+VisionEgg.Core.FramebufferCapture as its encode_func, and
+VisionEgg.FlowControl.Presentation.export_movie_go() can write an
+archive instead of image files.  FrameArchiveReader memory-maps the
+file and decompresses chunks only when a frame in them is read.
+
+File format
+===========
+All numbers are little-endian.
+
+header  -- 'VEFRAMES', uint32 version, uint32 length of the JSON
+           text that follows, JSON text with the keys 'shape',
+           'dtype' and 'compression'
+chunks  -- 'CHNK', uint32 number of frames, uint64 length of the
+           compressed frame data, uint64 length of the compressed
+           frame information, compressed frame data, compressed
+           frame information (JSON list with one dictionary per frame)
+index   -- 'INDX', uint64 number of chunks, uint64 number of frames,
+           int64 offset of each chunk, int64 index of the first frame
+           of each chunk, float64 time of each frame ('time_sec' of
+           its information, NaN if missing)
+trailer -- uint64 offset of the index, 'VEFAEND!'
+
+The index is rewritten when a writer is closed.  If a writer did not
+close the file, FrameArchiveReader and FrameArchiveWriter (in append
+mode) rebuild the index from the chunks.
+
+"""
+
+import logging
+import VisionEgg
+import numpy
+import os, struct, zlib, mmap, bisect, threading
+
+try:
+    import json
+except ImportError:
+    import simplejson as json # Python 2.5
+
+__version__ = VisionEgg.release_name
+
+_HEADER_MAGIC = 'VEFRAMES'
+_CHUNK_MAGIC = 'CHNK'
+_INDEX_MAGIC = 'INDX'
+_TRAILER_MAGIC = 'VEFAEND!'
+_FORMAT_VERSION = 1
+_CHUNK_HEADER = struct.Struct('<4sIQQ')
+_INDEX_HEADER = struct.Struct('<4sQQ')
+_TRAILER = struct.Struct('<Q8s')
+
+def _to_json(value):
+    """Convert parameter values to something JSON can store."""
+    if isinstance(value,numpy.ndarray):
+        return value.tolist()
+    elif isinstance(value,numpy.generic):
+        return value.item()
+    elif isinstance(value,(list,tuple)):
+        return map(_to_json,value)
+    elif isinstance(value,dict):
+        result = {}
+        for key, item in value.items():
+            result[str(key)] = _to_json(item)
+        return result
+    elif value is None or isinstance(value,(bool,int,long,float,basestring)):
+        return value
+    return repr(value)
+
+def _read_header(f):
+    magic, version, json_len = struct.unpack('<8sII',f.read(16))
+    if magic != _HEADER_MAGIC:
+        raise ValueError("Not a Vision Egg frame archive")
+    if version != _FORMAT_VERSION:
+        raise ValueError("Unsupported frame archive version %d"%version)
+    header = json.loads(f.read(json_len))
+    return header, 16+json_len
+
+def _scan_chunks(data, start, stop):
+    """Find chunks in data[start:stop]. Returns (offsets, frame counts, end)."""
+    offsets = []
+    num_frames = []
+    offset = start
+    while offset + _CHUNK_HEADER.size <= stop:
+        magic, n, data_len, info_len = _CHUNK_HEADER.unpack_from(data,offset)
+        end = offset + _CHUNK_HEADER.size + data_len + info_len
+        if magic != _CHUNK_MAGIC or end > stop:
+            break # incomplete chunk
+        offsets.append(offset)
+        num_frames.append(n)
+        offset = end
+    return offsets, num_frames, offset
+
+def _read_chunk_info(data, offset):
+    magic, n, data_len, info_len = _CHUNK_HEADER.unpack_from(data,offset)
+    start = offset + _CHUNK_HEADER.size + data_len
+    return json.loads(zlib.decompress(data[start:start+info_len]))
+
+def _get_time(frame_info):
+    if frame_info is None:
+        return numpy.nan
+    time_sec = frame_info.get('time_sec')
+    if time_sec is None:
+        return numpy.nan
+    return time_sec
+
+class FrameArchiveWriter:
+    """Write frames to a frame archive.
+
+    Frames are added with append(), in order, or with encode_frame(),
+    which may be called from several threads with frames out of
+    order.  Frames are compressed in chunks of about chunk_bytes
+    uncompressed bytes with zlib at compression_level.
+
+    In mode 'w', a new archive is created, and the shape and dtype of
+    the frames are taken from the first frame unless given.  In mode
+    'a', frames are added to an existing archive.
+    """
+    def __init__(self,
+                 filename,
+                 mode='w',
+                 shape=None,
+                 dtype=None,
+                 chunk_bytes=4*1024*1024,
+                 compression_level=1,
+                 first_frame_number=0):
+        """Open filename for writing.
+
+        first_frame_number is the frame number of the first frame
+        passed to encode_frame()."""
+        self.filename = filename
+        self.chunk_bytes = chunk_bytes
+        self.compression_level = compression_level
+        self.next_frame_number = first_frame_number
+        self.lock = threading.Lock()
+        self.waiting_frames = {} # frames given to encode_frame() out of order
+        self.chunk_frames = []
+        self.chunk_info = []
+        self.chunk_offsets = []
+        self.chunk_first_frames = []
+        self.times = []
+        self.num_frames = 0
+        self.frames_per_chunk = None
+        if mode == 'w':
+            self.file = open(filename,'w+b')
+            self.shape = shape
+            self.dtype = dtype
+            self.header_written = False
+            if shape is not None and dtype is not None:
+                self.__write_header()
+        elif mode == 'a':
+            self.file = open(filename,'r+b')
+            self.__open_for_append()
+        else:
+            raise ValueError("mode must be 'w' or 'a', not %s"%repr(mode))
+
+    def __write_header(self):
+        self.shape = tuple(map(int,self.shape))
+        self.dtype = numpy.dtype(self.dtype)
+        header = json.dumps({'shape':self.shape,
+                             'dtype':self.dtype.str,
+                             'compression':'zlib'})
+        self.file.write(struct.pack('<8sII',_HEADER_MAGIC,_FORMAT_VERSION,len(header)))
+        self.file.write(header)
+        self.header_written = True
+        self.__set_frames_per_chunk()
+
+    def __set_frames_per_chunk(self):
+        frame_bytes = int(numpy.prod(self.shape))*self.dtype.itemsize
+        self.frames_per_chunk = max(1,self.chunk_bytes//max(frame_bytes,1))
+
+    def __open_for_append(self):
+        reader = FrameArchiveReader(self.filename)
+        try:
+            self.shape = reader.shape
+            self.dtype = reader.dtype
+            self.chunk_offsets = list(reader.chunk_offsets)
+            self.chunk_first_frames = list(reader.chunk_first_frames)
+            self.times = list(reader.get_timestamps())
+            self.num_frames = len(reader)
+            end = reader.data_end
+        finally:
+            reader.close()
+        # Remove the index, it is written again by close()
+        self.file.seek(end)
+        self.file.truncate()
+        self.header_written = True
+        self.__set_frames_per_chunk()
+
+    def append(self, array, frame_info=None):
+        """Add a frame to the end of the archive.
+
+        frame_info is a dictionary stored with the frame.  Its value
+        for 'time_sec', if any, is stored in the index and returned
+        by FrameArchiveReader.get_timestamps()."""
+        self.lock.acquire()
+        try:
+            self.__append(array,frame_info)
+        finally:
+            self.lock.release()
+
+    def encode_frame(self, frame_number, array, frame_info=None):
+        """Add a frame with the given frame number. Thread-safe.
+
+        Frames are stored in order of frame number, without gaps, so
+        frames given early wait (as a copy) for the frames before them.
+        This can be used as encode_func of
+        VisionEgg.Core.FramebufferCapture."""
+        self.lock.acquire()
+        try:
+            if frame_number != self.next_frame_number:
+                self.waiting_frames[frame_number] = (numpy.array(array),frame_info)
+                return
+            self.__append(array,frame_info)
+            self.next_frame_number += 1
+            while self.next_frame_number in self.waiting_frames:
+                array, frame_info = self.waiting_frames.pop(self.next_frame_number)
+                self.__append(array,frame_info)
+                self.next_frame_number += 1
+        finally:
+            self.lock.release()
+
+    def __append(self, array, frame_info):
+        array = numpy.asarray(array)
+        if not self.header_written:
+            if self.shape is None:
+                self.shape = array.shape
+            if self.dtype is None:
+                self.dtype = array.dtype
+            self.__write_header()
+        if array.shape != self.shape:
+            raise ValueError("Frame has shape %s, archive has shape %s"%(
+                array.shape,self.shape))
+        self.chunk_frames.append(numpy.ascontiguousarray(array,dtype=self.dtype).tostring())
+        if frame_info is not None:
+            frame_info = _to_json(frame_info)
+        self.chunk_info.append(frame_info)
+        self.times.append(_get_time(frame_info))
+        self.num_frames += 1
+        if len(self.chunk_frames) >= self.frames_per_chunk:
+            self.__write_chunk()
+
+    def __write_chunk(self):
+        if not len(self.chunk_frames):
+            return
+        data = zlib.compress(''.join(self.chunk_frames),self.compression_level)
+        info = zlib.compress(json.dumps(self.chunk_info),self.compression_level)
+        self.file.seek(0,os.SEEK_END)
+        self.chunk_offsets.append(self.file.tell())
+        self.chunk_first_frames.append(self.num_frames-len(self.chunk_frames))
+        self.file.write(_CHUNK_HEADER.pack(_CHUNK_MAGIC,len(self.chunk_frames),
+                                           len(data),len(info)))
+        self.file.write(data)
+        self.file.write(info)
+        self.chunk_frames = []
+        self.chunk_info = []
+
+    def flush(self):
+        """Write buffered frames as a chunk and flush the file.
+
+        Frames given to encode_frame() that are still waiting for
+        earlier frames are not written."""
+        self.lock.acquire()
+        try:
+            self.__write_chunk()
+            self.file.flush()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """Write the remaining frames and the index and close the file."""
+        if self.file is None:
+            return
+        self.lock.acquire()
+        try:
+            if len(self.waiting_frames):
+                logger = logging.getLogger('VisionEgg.FrameArchive')
+                logger.warning("%d frames given to encode_frame() were "
+                               "not written because earlier frames are "
+                               "missing."%len(self.waiting_frames))
+                self.waiting_frames = {}
+            if not self.header_written:
+                raise RuntimeError("Cannot close frame archive without "
+                                   "frames unless shape and dtype are given")
+            self.__write_chunk()
+            self.file.seek(0,os.SEEK_END)
+            index_offset = self.file.tell()
+            self.file.write(_INDEX_HEADER.pack(_INDEX_MAGIC,len(self.chunk_offsets),
+                                               self.num_frames))
+            self.file.write(numpy.asarray(self.chunk_offsets,dtype='<i8').tostring())
+            self.file.write(numpy.asarray(self.chunk_first_frames,dtype='<i8').tostring())
+            self.file.write(numpy.asarray(self.times,dtype='<f8').tostring())
+            self.file.write(_TRAILER.pack(index_offset,_TRAILER_MAGIC))
+            self.file.close()
+            self.file = None
+        finally:
+            self.lock.release()
+
+class FrameArchiveReader:
+    """Read frames from a frame archive.
+
+    The file is memory-mapped.  Reading a frame decompresses only the
+    chunk containing it, and the most recently used chunks are kept.
+    Frames are returned as read-only arrays.
+
+    Public variables
+    ================
+    shape -- shape of each frame
+    dtype -- data type of each frame
+    """
+    def __init__(self, filename, num_cached_chunks=2):
+        self.filename = filename
+        self.num_cached_chunks = num_cached_chunks
+        self.cached_chunks = [] # (chunk number, frames), most recent last
+        self.file = open(filename,'rb')
+        try:
+            header, self.data_start = _read_header(self.file)
+            self.data = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+        except:
+            self.file.close()
+            raise
+        self.shape = tuple(header['shape'])
+        self.dtype = numpy.dtype(str(header['dtype']))
+        self.frame_bytes = int(numpy.prod(self.shape))*self.dtype.itemsize
+        if not self.__read_index():
+            self.__rebuild_index()
+
+    def __read_index(self):
+        data = self.data
+        if len(data) < self.data_start + _TRAILER.size:
+            return False
+        index_offset, magic = _TRAILER.unpack_from(data,len(data)-_TRAILER.size)
+        if magic != _TRAILER_MAGIC:
+            return False
+        magic, num_chunks, num_frames = _INDEX_HEADER.unpack_from(data,index_offset)
+        if magic != _INDEX_MAGIC:
+            return False
+        offset = index_offset + _INDEX_HEADER.size
+        # Copy the index, so it can be used after the file is closed.
+        self.chunk_offsets = numpy.frombuffer(data,dtype='<i8',count=num_chunks,offset=offset).copy()
+        offset += 8*num_chunks
+        self.chunk_first_frames = numpy.frombuffer(data,dtype='<i8',count=num_chunks,offset=offset).copy()
+        offset += 8*num_chunks
+        self.times = numpy.frombuffer(data,dtype='<f8',count=num_frames,offset=offset).copy()
+        self.num_frames = num_frames
+        self.data_end = index_offset
+        return True
+
+    def __rebuild_index(self):
+        logger = logging.getLogger('VisionEgg.FrameArchive')
+        logger.warning("Frame archive %s has no index (it was not closed), "
+                       "rebuilding it from the chunks."%self.filename)
+        offsets, num_frames, self.data_end = _scan_chunks(self.data,self.data_start,len(self.data))
+        first_frames = numpy.cumsum([0]+num_frames)
+        self.chunk_offsets = numpy.array(offsets,dtype=numpy.int64)
+        self.chunk_first_frames = numpy.array(first_frames[:-1],dtype=numpy.int64)
+        self.num_frames = int(first_frames[-1])
+        times = []
+        for offset in offsets:
+            times.extend(map(_get_time,_read_chunk_info(self.data,offset)))
+        self.times = numpy.array(times,dtype=numpy.float64)
+
+    def __len__(self):
+        return self.num_frames
+
+    def __getitem__(self, index):
+        return self.get_frame(index)
+
+    def __iter__(self):
+        return self.iter_frames()
+
+    def __find_chunk(self, index):
+        if index < 0:
+            index += self.num_frames
+        if not 0 <= index < self.num_frames:
+            raise IndexError("frame index out of range")
+        chunk = bisect.bisect_right(self.chunk_first_frames,index)-1
+        return chunk, index-self.chunk_first_frames[chunk]
+
+    def __get_chunk_frames(self, chunk):
+        for i in range(len(self.cached_chunks)):
+            if self.cached_chunks[i][0] == chunk:
+                item = self.cached_chunks.pop(i)
+                self.cached_chunks.append(item)
+                return item[1]
+        offset = int(self.chunk_offsets[chunk])
+        magic, n, data_len, info_len = _CHUNK_HEADER.unpack_from(self.data,offset)
+        start = offset + _CHUNK_HEADER.size
+        frames = numpy.fromstring(zlib.decompress(self.data[start:start+data_len]),
+                                  dtype=self.dtype)
+        frames = frames.reshape((n,)+self.shape)
+        frames.flags.writeable = False
+        self.cached_chunks.append((chunk,frames))
+        if len(self.cached_chunks) > self.num_cached_chunks:
+            del self.cached_chunks[0]
+        return frames
+
+    def get_frame(self, index):
+        """Return frame number index (counting from 0) as an array."""
+        chunk, i = self.__find_chunk(index)
+        return self.__get_chunk_frames(chunk)[i]
+
+    def get_frame_info(self, index):
+        """Return the dictionary stored with a frame, or None."""
+        chunk, i = self.__find_chunk(index)
+        return _read_chunk_info(self.data,int(self.chunk_offsets[chunk]))[i]
+
+    def get_timestamps(self):
+        """Return array of the 'time_sec' of each frame (NaN if missing)."""
+        return self.times
+
+    def iter_frames(self, start=0, stop=None, step=1):
+        """Yield frames from start to stop, decompressing as needed."""
+        if stop is None or stop > self.num_frames:
+            stop = self.num_frames
+        for index in xrange(start,stop,step):
+            yield self.get_frame(index)
+
+    def close(self):
+        """Close the file."""
+        self.cached_chunks = []
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
@@ -137,6 +137,41 @@ class PyroLocalDictController(VisionEgg.FlowControl.EncapsulatedController,Pyro.
     def add_controller(self,key,new_controller):
         self.dict[key] = new_controller
 
+class PyroFrameTelemetry(Pyro.core.ObjBase):
+    """Query the frame telemetry of a Presentation remotely.
+
+    Serve an instance with PyroServer.connect().  Each method reports
+    on the last go loop of the Presentation, or returns None if no
+    frame telemetry was recorded."""
+    def __init__(self,presentation):
+        Pyro.core.ObjBase.__init__(self)
+        self.presentation = presentation
+
+    def get_records(self):
+        telemetry = self.presentation.get_frame_telemetry()
+        if telemetry is None:
+            return None
+        return telemetry.get_records()
+
+    def get_durations(self):
+        telemetry = self.presentation.get_frame_telemetry()
+        if telemetry is None:
+            return None
+        return telemetry.get_durations()
+
+    def get_summary(self):
+        telemetry = self.presentation.get_frame_telemetry()
+        if telemetry is None:
+            return None
+        return telemetry.get_summary()
+
+    def save(self,filename):
+        """Save as a .npy file on the computer running the presentation."""
+        telemetry = self.presentation.get_frame_telemetry()
+        if telemetry is None:
+            return None
+        telemetry.save(filename)
+
 class PyroListenController(VisionEgg.FlowControl.Controller):
     """Handle connection from remote machine, control PyroControllers.
 
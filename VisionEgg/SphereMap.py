@@ -144,8 +144,11 @@ class AzElGrid(VisionEgg.Core.Stimulus):
 
     def __init__(self,**kw):
         VisionEgg.Core.Stimulus.__init__(self,**kw)
-        self.cached_minor_lines_display_list = gl.glGenLists(1) # Allocate a new display list
-        self.cached_major_lines_display_list = gl.glGenLists(1) # Allocate a new display list
+        self.cached_minor_lines_display_list = VisionEgg.Textures.texture_manager.gen_display_lists(1) # Allocate a new display list
+        self.cached_major_lines_display_list = VisionEgg.Textures.texture_manager.gen_display_lists(1) # Allocate a new display list
+        VisionEgg.Textures.texture_manager.delete_when_collected(
+            self, display_lists=(self.cached_minor_lines_display_list,
+                                 self.cached_major_lines_display_list))
         self.__rebuild_display_lists()
         self.text_viewport = None # not set yet
         self._gave_alpha_warning = False
@@ -429,7 +432,9 @@ class SphereMap(VisionEgg.Textures.TextureStimulusBaseClass):
 
     def __init__(self,**kw):
         VisionEgg.Textures.TextureStimulusBaseClass.__init__(self,**kw)
-        self.cached_display_list = gl.glGenLists(1) # Allocate a new display list
+        self.cached_display_list = VisionEgg.Textures.texture_manager.gen_display_lists(1) # Allocate a new display list
+        VisionEgg.Textures.texture_manager.delete_when_collected(
+            self, display_lists=(self.cached_display_list,))
         self.__rebuild_display_list()
 
     def __rebuild_display_list(self):
@@ -495,7 +500,9 @@ class SphereMap(VisionEgg.Textures.TextureStimulusBaseClass):
         """
         p = self.parameters
 
-        if self._cached_radius != p.radius or self._cached_slices != p.slices or self._cached_stacks != p.stacks:
+        if self._use_texture(): # from TextureStimulusBaseClass
+            self.__rebuild_display_list()
+        elif self._cached_radius != p.radius or self._cached_slices != p.slices or self._cached_stacks != p.stacks:
             self.__rebuild_display_list()
 
         if p.on:
@@ -646,9 +653,13 @@ class SphereGrating(VisionEgg.Gratings.LuminanceGratingCommon):
             self.parameters.t0_time_sec_absolute = VisionEgg.time_func()
 
         self.texture_object_id = gl.glGenTextures(1) # Allocate a new texture object
+        VisionEgg.Textures.texture_manager.delete_when_collected(
+            self, texture_ids=(self.texture_object_id,))
         self.__rebuild_texture_object()
 
-        self.cached_display_list_id = gl.glGenLists(1) # Allocate a new display list
+        self.cached_display_list_id = VisionEgg.Textures.texture_manager.gen_display_lists(1) # Allocate a new display list
+        VisionEgg.Textures.texture_manager.delete_when_collected(
+            self, display_lists=(self.cached_display_list_id,))
         self.__rebuild_display_list()
 
     def __rebuild_texture_object(self):
@@ -943,10 +954,15 @@ class SphereWindow(VisionEgg.Gratings.LuminanceGratingCommon):
             self._texture_s_is_azimuth = False
 
         self.texture_object_id = gl.glGenTextures(1)
+        VisionEgg.Textures.texture_manager.delete_when_collected(
+            self, texture_ids=(self.texture_object_id,))
         self.__rebuild_texture_object()
 
-        self.windowed_display_list_id = gl.glGenLists(1) # Allocate a new display list
-        self.opaque_display_list_id = gl.glGenLists(1) # Allocate a new display list
+        self.windowed_display_list_id = VisionEgg.Textures.texture_manager.gen_display_lists(1) # Allocate a new display list
+        self.opaque_display_list_id = VisionEgg.Textures.texture_manager.gen_display_lists(1) # Allocate a new display list
+        VisionEgg.Textures.texture_manager.delete_when_collected(
+            self, display_lists=(self.windowed_display_list_id,
+                                 self.opaque_display_list_id))
         self.__rebuild_display_lists()
 
     def __rebuild_texture_object(self):
@@ -214,6 +214,7 @@ class SocketListenController(VisionEgg.FlowControl.Controller):
     exit -- close the connection
     quit -- quit the server program
     help -- print help message
+    telemetry -- show frame telemetry of the last go loop (see set_presentation)
     <name> -- show the value of the controller of <name>
     <name>=const(<args>) -- assign a new ConstantController to <name>
     <name>=eval_str(<args>) -- assign a new EvalStringController to <name>
@@ -281,6 +282,7 @@ class SocketListenController(VisionEgg.FlowControl.Controller):
     exit -- close the connection
     quit -- quit the server program
     help -- print this message
+    telemetry -- show frame telemetry of the last go loop
     <name> -- show the value of the controller of <name>
     <name>=const(<args>) -- assign a new ConstantController to <name>
     <name>=eval_str(<args>) -- assign a new EvalStringController to <name>
@@ -336,6 +338,12 @@ class SocketListenController(VisionEgg.FlowControl.Controller):
 
         self.names = {} # ( controller, name_re, parser, require_type )
 
+        self.presentation = None # for the telemetry command
+
+    def set_presentation(self,presentation):
+        """Set the Presentation reported on by the telemetry command."""
+        self.presentation = presentation
+
     def send_raw_text(self,text):
         """Send text over the TCP socket."""
         self.socket.send(text)
@@ -422,6 +430,16 @@ class SocketListenController(VisionEgg.FlowControl.Controller):
         elif text=="help":
             self.socket.send(SocketListenController.help_string+"\n")
             return ""
+        elif text=="telemetry":
+            if self.presentation is None:
+                self.socket.send("Error: No Presentation set for telemetry.\n")
+            else:
+                telemetry = self.presentation.get_frame_telemetry()
+                if telemetry is None:
+                    self.socket.send("No frame telemetry recorded. (Set record_frame_telemetry.)\n")
+                else:
+                    self.socket.send(telemetry.get_summary())
+            return ""
         elif text in self.names.keys():
             (controller, name_re_str, parser, require_type) = self.names[text]
             self.socket.send(text+"="+str(controller)+"\n")
@@ -110,6 +110,9 @@ class PangoText(VisionEgg.Textures.TextureStimulus):
     mipmaps_enabled   -- Are mipmaps enabled? (Boolean)
                          Inherited from VisionEgg.Textures.TextureStimulus
                          Default: True
+    num_pixel_buffers -- number of pixel buffer objects to stream texture updates through (0: update directly) (UnsignedInteger)
+                         Inherited from VisionEgg.Textures.TextureStimulus
+                         Default: 0
     shrink_texture_ok -- Allow automatic shrinking of texture if too big? (Boolean)
                          Inherited from VisionEgg.Textures.TextureStimulus
                          Default: False
@@ -254,6 +257,9 @@ class PygameText(VisionEgg.Textures.TextureStimulus):
     mipmaps_enabled   -- Are mipmaps enabled? (Boolean)
                          Inherited from VisionEgg.Textures.TextureStimulus
                          Default: True
+    num_pixel_buffers -- number of pixel buffer objects to stream texture updates through (0: update directly) (UnsignedInteger)
+                         Inherited from VisionEgg.Textures.TextureStimulus
+                         Default: 0
     shrink_texture_ok -- Allow automatic shrinking of texture if too big? (Boolean)
                          Inherited from VisionEgg.Textures.TextureStimulus
                          Default: False
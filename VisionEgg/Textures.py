@@ -26,13 +26,21 @@ import VisionEgg.Core
 import VisionEgg.ParameterTypes as ve_types
 
 import Image, ImageDraw                         # Python Imaging Library packages
-import pygame.surface, pygame.image             # pygame
-import math, types, os
+import pygame.surface, pygame.image, pygame.transform # pygame
+import math, types, os, sys, ctypes, hashlib, threading, weakref
 import numpy
 import numpy.oldnumeric as numpyNumeric, numpy.oldnumeric.mlab as MLab
 
 import VisionEgg.GL as gl # get all OpenGL stuff in one namespace
 import OpenGL.GLU as glu
+try:
+    # Do not convert or copy the data, so can read from a pixel
+    # buffer object or directly from an array's memory
+    from OpenGL.raw.GL.VERSION.GL_1_0 import glTexImage2D as _raw_glTexImage2D
+    from OpenGL.raw.GL.VERSION.GL_1_1 import glTexSubImage2D as _raw_glTexSubImage2D
+except ImportError:
+    _raw_glTexImage2D = gl.glTexImage2D
+    _raw_glTexSubImage2D = gl.glTexSubImage2D
 
 # These modules are part of PIL and get loaded as needed by Image.
 # They are listed here so that Gordon McMillan's Installer properly
@@ -58,6 +66,10 @@ try:
     array_types.append( orig_Numeric.ArrayType )
 except ImportError:
     pass
+try:
+    array_types.append( memoryview ) # Python 2.7 and later
+except NameError:
+    pass
 
 def convert_to_numpy_if_array(A):
     if type(A) in array_types:
@@ -66,6 +78,177 @@ def convert_to_numpy_if_array(A):
     else:
         return A
 
+def get_texels_size(texels):
+    """Return (width, height) of a numpy array, PIL image or pygame surface."""
+    if isinstance(texels,numpy.ndarray):
+        return texels.shape[1], texels.shape[0]
+    elif isinstance(texels,Image.Image):
+        return texels.size
+    elif isinstance(texels,pygame.surface.Surface):
+        return texels.get_size()
+    raise TypeError("Expecting numpy array, PIL image, or pygame surface")
+
+def texels_from_buffer(buffer, size, num_components=3, offset=0,
+                       row_bytes=None, top_row_first=False):
+    """Return a numpy array of texels using the memory of a buffer.
+
+    The buffer argument can be any object supporting the buffer
+    protocol, such as a string, mmap, bytearray, memoryview or the
+    buffer of a pygame surface, containing unsigned byte texel data
+    starting at offset.  The size argument is (width, height).  Rows
+    are row_bytes apart (default: width*num_components).  The first
+    row is the bottom row, as for texel arrays, unless top_row_first
+    is True, as in most image files.
+
+    No data is copied, the array is a view of buffer.  With
+    top_row_first, the rows of the array are in reverse memory order
+    (a negative stride), and Texture.load() and the TextureObject
+    methods copy them once into bottom row first order."""
+    width, height = size
+    if row_bytes is None:
+        row_bytes = width*num_components
+    if row_bytes < width*num_components:
+        raise ValueError("row_bytes is smaller than a row of texels")
+    try:
+        memory = numpy.frombuffer(buffer,numpy.uint8)
+    except AttributeError:
+        # only the new buffer protocol (e.g. memoryview)
+        memory = numpy.asarray(memoryview(buffer)).view(numpy.uint8).reshape(-1)
+    if memory.size < offset + row_bytes*(height-1) + width*num_components:
+        raise ValueError("buffer too small for texel data of this size")
+    if num_components == 1:
+        shape = (height,width)
+        strides = (row_bytes,1)
+    else:
+        shape = (height,width,num_components)
+        strides = (row_bytes,num_components,1)
+    texels = numpy.lib.stride_tricks.as_strided(memory[offset:],shape,strides)
+    if top_row_first:
+        texels = texels[::-1]
+    return texels
+
+def _get_unpack_layout(texels):
+    """Row length and alignment for OpenGL to read an array in place.
+
+    Returns None if texels must be copied, because it is not uint8
+    data, its rows are not in increasing memory order, or its texels
+    are not packed."""
+    if texels.dtype != numpy.uint8 or len(texels.shape) not in (2,3):
+        return None
+    if len(texels.shape) == 3:
+        pixel_bytes = texels.shape[2]
+        if texels.strides[2] != 1 and pixel_bytes > 1:
+            return None
+    else:
+        pixel_bytes = 1
+    width = texels.shape[1]
+    if texels.strides[1] != pixel_bytes and width > 1:
+        return None
+    row_bytes = texels.strides[0]
+    if texels.shape[0] == 1 or row_bytes == width*pixel_bytes:
+        return 0, 1
+    if row_bytes < width*pixel_bytes:
+        return None
+    if row_bytes % pixel_bytes == 0:
+        return row_bytes//pixel_bytes, 1
+    for alignment in (2,4,8):
+        if row_bytes == -(-width*pixel_bytes//alignment)*alignment:
+            return 0, alignment
+    return None
+
+def _prepare_texels(texels):
+    """Return texels, copied only if OpenGL can't read it in place,
+    and its (row_length, alignment) unpack layout."""
+    layout = _get_unpack_layout(texels)
+    if layout is None:
+        texels = numpy.ascontiguousarray(texels,numpy.uint8)
+        layout = (0,1)
+    return texels, layout
+
+def _tex_image_2d(target, mipmap_level, internal_format, border, data_format, texels,
+                  data_type=gl.GL_UNSIGNED_BYTE):
+    """glTexImage2D from a uint8 array, read in place if possible."""
+    texels, (row_length, alignment) = _prepare_texels(texels)
+    gl.glPixelStorei(gl.GL_UNPACK_ROW_LENGTH,row_length)
+    gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT,alignment)
+    try:
+        _raw_glTexImage2D(target,
+                          mipmap_level,
+                          internal_format,
+                          texels.shape[1],
+                          texels.shape[0],
+                          border,
+                          data_format,
+                          data_type,
+                          ctypes.c_void_p(texels.ctypes.data))
+    finally:
+        gl.glPixelStorei(gl.GL_UNPACK_ROW_LENGTH,0)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT,4)
+
+def _tex_sub_image_2d(target, mipmap_level, x_offset, y_offset, data_format, texels,
+                      data_type=gl.GL_UNSIGNED_BYTE):
+    """glTexSubImage2D from a uint8 array, read in place if possible."""
+    texels, (row_length, alignment) = _prepare_texels(texels)
+    gl.glPixelStorei(gl.GL_UNPACK_ROW_LENGTH,row_length)
+    gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT,alignment)
+    try:
+        _raw_glTexSubImage2D(target,
+                             mipmap_level,
+                             x_offset,
+                             y_offset,
+                             texels.shape[1],
+                             texels.shape[0],
+                             data_format,
+                             data_type,
+                             ctypes.c_void_p(texels.ctypes.data))
+    finally:
+        gl.glPixelStorei(gl.GL_UNPACK_ROW_LENGTH,0)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT,4)
+
+def _is_packed_4_byte_texels(texel_data):
+    return (isinstance(texel_data,numpy.ndarray) and
+            texel_data.dtype == numpy.uint8 and
+            len(texel_data.shape) == 3 and texel_data.shape[2] == 4)
+
+def _view_pygame_surface(surface, with_alpha):
+    """Return (texels, data_format) viewing a surface's pixels.
+
+    The rows of texels are in reverse memory order, because pygame
+    stores the top row first.  Returns (None, None) if the pixel
+    format has no matching OpenGL data format."""
+    if with_alpha:
+        needed_bytesize = 4
+    else:
+        needed_bytesize = 3 # OpenGL would use a 4th byte as alpha
+    bytesize = surface.get_bytesize()
+    if bytesize != needed_bytesize:
+        return None, None
+    masks = surface.get_masks()
+    positions = []
+    for mask in masks[:bytesize]:
+        for i in range(bytesize):
+            if sys.byteorder == 'little':
+                shift = 8*i
+            else:
+                shift = 8*(bytesize-1-i)
+            if mask == 0xFF << shift:
+                positions.append(i)
+                break
+        else:
+            return None, None
+    if positions == range(bytesize):
+        data_format = [gl.GL_RGB, gl.GL_RGBA][bytesize-3]
+    elif positions == [2,1,0] + range(3,bytesize):
+        data_format = [gl.GL_BGR, gl.GL_BGRA][bytesize-3]
+    else:
+        return None, None
+    texels = texels_from_buffer(surface.get_buffer(),
+                                surface.get_size(),
+                                num_components = bytesize,
+                                row_bytes = surface.get_pitch(),
+                                top_row_first = True)
+    return texels, data_format
+
 ####################################################################
 #
 # XXX ToDo:
@@ -78,7 +261,9 @@ def convert_to_numpy_if_array(A):
 # OS X. (See http://crystal.sourceforge.net/phpwiki/index.php?MacXGL)
 
 # Here's a sample from Apple's TextureRange demo which is supposed
-# to speed up texture transfers.
+# to speed up texture transfers.  (The GL_BGRA,
+# GL_UNSIGNED_INT_8_8_8_8_REV layout is used by Texture.load() if
+# probe_upload_formats() finds it fastest, client storage is not.)
 # glBindTextures( target, &texID);
 # glPixelStorei(GL_UNPACK_CLIENT_STORAGE_APPLE, 1);
 # glTexImage2D(target, 0, GL_RGBA, width, height, 0, GL_BGRA, GL_UNSIGNED_INT_8_8_8_8_REV,image_ptr);
@@ -99,6 +284,36 @@ def next_power_of_2(f):
 def is_power_of_2(f):
     return f == next_power_of_2(f)
 
+non_power_of_2_supported = None # None means check when first needed
+
+def _check_non_power_of_2():
+    """Can texture images have any size?  Requires OpenGL context."""
+    global non_power_of_2_supported
+    if non_power_of_2_supported is None:
+        extensions = gl.glGetString(gl.GL_EXTENSIONS)
+        non_power_of_2_supported = bool(
+            VisionEgg.Core._get_gl_version_tuple() >= (2, 0) or
+            (extensions is not None and
+             'GL_ARB_texture_non_power_of_two' in extensions.split()))
+        logger = logging.getLogger('VisionEgg.Textures')
+        if non_power_of_2_supported:
+            logger.info("Non power of 2 texture sizes supported, "
+                        "textures are not padded.")
+        else:
+            logger.info("Non power of 2 texture sizes not supported, "
+                        "textures are padded to a power of 2 size.")
+    return non_power_of_2_supported
+
+def _get_texture_dimension(num_texels):
+    """Texture image size holding num_texels, a power of 2 if required."""
+    if _check_non_power_of_2():
+        return num_texels
+    return next_power_of_2(num_texels)
+
+def _check_texture_dimension(num_texels):
+    if not is_power_of_2(num_texels) and not _check_non_power_of_2():
+        raise ValueError("texel_data does not have all dimensions == n^2")
+
 class Texture(object):
     """A 2 dimensional texture.
 
@@ -119,7 +334,37 @@ class Texture(object):
     until the load() method is called.  The unload() method may be
     used to remove the data from OpenGL.
 
-    A reference to the original image data is maintained."""
+    A reference to the original image data is maintained.
+
+    Textures made from the same image file share one TextureObject
+    when used by texture stimuli with the same settings (see
+    TextureManager).  Changing it, for example with put_sub_image(),
+    changes what every stimulus using the file shows.  To change one
+    of them only, make its Texture from an image instead of the file
+    name, for example Texture(Image.open(filename)).
+
+    Arrays with packed texels, including views of other memory made
+    with texels_from_buffer(), and pygame surfaces with 24 bit RGB or
+    BGR pixels (or 32 bit RGBA or BGRA pixels, if they have alpha)
+    are loaded without padding them to a power of 2 size.  They are
+    not copied at all if they hold unsigned bytes in the texel layout
+    found fastest (see get_upload_format()), otherwise they are
+    copied once to convert them.  Their rows may be padded.  If their
+    rows are in reverse memory order (like a pygame surface, or an
+    array indexed with [::-1]), they are copied once into bottom row
+    first order, as TextureObject.put_sub_image() expects.  PIL images
+    and other pygame surfaces are copied, and also padded to a power
+    of 2 size if necessary.
+
+    Textures are stored at their own size where OpenGL supports non
+    power of 2 texture sizes (OpenGL 2.0 or the
+    GL_ARB_texture_non_power_of_two extension).  Otherwise, they are
+    padded to a power of 2 size, using only part of the texture
+    object.
+
+    Mipmaps of arrays and pygame surfaces are built as set by
+    get_mipmap_builder(), in OpenGL or with make_mipmap_levels().
+    Mipmaps of PIL images are built with PIL."""
 
     __slots__ = ('texels',
                  'texture_object',
@@ -200,14 +445,21 @@ class Texture(object):
         if self.texture_object is not None:
             raise RuntimeError("make_half_size() only available BEFORE texture loaded to OpenGL.")
 
+        w = max(1,self.size[0]/2)
+        h = max(1,self.size[1]/2)
         if isinstance(self.texels,Image.Image):
-            w = self.size[0]/2
-            h = self.size[1]/2
             small_texels = self.texels.resize((w,h),shrink_filter)
-            self.texels = small_texels
-            self.size = (w,h)
+        elif isinstance(self.texels,numpy.ndarray):
+            small_texels = resample_texels(self.texels,(w,h))
+        elif isinstance(self.texels,pygame.surface.Surface):
+            if self.texels.get_bitsize() in (24,32):
+                small_texels = pygame.transform.smoothscale(self.texels,(w,h))
+            else:
+                small_texels = pygame.transform.scale(self.texels,(w,h))
         else:
-            raise NotImplementedError("Texture too large, but rescaling only implemented for PIL images.")
+            raise NotImplementedError("Texture too large, but rescaling not implemented for this texel data type.")
+        self.texels = small_texels
+        self.size = (w,h)
 
     def unload(self):
         """Unload texture data from video texture memory.
@@ -317,8 +569,9 @@ class Texture(object):
 
         width, height = self.size
 
-        width_pow2  = next_power_of_2(width)
-        height_pow2  = next_power_of_2(height)
+        # texture image size (padded to a power of 2 if required)
+        tex_width = _get_texture_dimension(width)
+        tex_height = _get_texture_dimension(height)
 
         if rescale_original_to_fill_texture_object:
             if not isinstance(self.texels,Image.Image):
@@ -326,9 +579,9 @@ class Texture(object):
 
         # fractional coverage
         self.buf_lf = 0.0
-        self.buf_rf = float(width)/width_pow2
+        self.buf_rf = float(width)/tex_width
         self.buf_bf = 0.0
-        self.buf_tf = float(height)/height_pow2
+        self.buf_tf = float(height)/tex_height
 
         # absolute (texel units) coverage
         self._buf_l = 0
@@ -336,13 +589,35 @@ class Texture(object):
         self._buf_b = 0
         self._buf_t = height
 
-        if width != width_pow2 or height != height_pow2:
+        # Arrays and (most) pygame surfaces are read by OpenGL in
+        # place, without copying them to a padded buffer.
+        in_place = None
+        data_format = None
+        data_type = None
+        if isinstance(self.texels,numpy.ndarray):
+            in_place = self.texels
+        elif isinstance(self.texels, pygame.surface.Surface):
+            in_place, data_format = _view_pygame_surface(self.texels,
+                                                         self.texels.get_alpha())
+
+        if in_place is not None:
+            buffer = in_place
+            del in_place # don't keep a pygame surface locked
+            if (buffer.dtype == numpy.uint8 and len(buffer.shape) == 3 and
+                buffer.shape[2] in (3,4)):
+                buffer, data_format, data_type = convert_texels_to_upload_format(
+                    buffer, data_format)
+            if len(buffer.shape) > 1 and buffer.strides[0] < 0:
+                # Top row first in memory: copy once to bottom row
+                # first, so later put_sub_image() calls match.
+                buffer = numpy.ascontiguousarray(buffer)
+        elif width != tex_width or height != tex_height:
             if isinstance(self.texels,numpy.ndarray):
                 if len(self.texels.shape) == 2:
-                    buffer = numpy.zeros( (height_pow2,width_pow2), dtype=self.texels.dtype )
+                    buffer = numpy.zeros( (tex_height,tex_width), dtype=self.texels.dtype )
                     buffer[0:height,0:width] = self.texels
                 elif len(self.texels.shape) == 3:
-                    buffer = numpy.zeros( (height_pow2,width_pow2,self.texels.shape[2]), dtype=self.texels.dtype )
+                    buffer = numpy.zeros( (tex_height,tex_width,self.texels.shape[2]), dtype=self.texels.dtype )
                     buffer[0:height,0:width,:] = self.texels
                 else:
                     raise RuntimeError("Unexpected shape for self.texels")
@@ -356,41 +631,73 @@ class Texture(object):
                     self.buf_tf = 1.0
 
                     self._buf_l = 0
-                    self._buf_r = width_pow2
+                    self._buf_r = tex_width
                     self._buf_t = 0
-                    self._buf_b = height_pow2
+                    self._buf_b = tex_height
 
-                    buffer = self.texels.resize((width_pow2,height_pow2),shrink_filter)
+                    buffer = self.texels.resize((tex_width,tex_height),shrink_filter)
 
-                    self.size = (width_pow2, height_pow2)
+                    self.size = (tex_width, tex_height)
                 else:
-                    buffer = Image.new(self.texels.mode,(width_pow2, height_pow2))
-                    buffer.paste( self.texels, (0,height_pow2-height,width,height_pow2))
+                    buffer = Image.new(self.texels.mode,(tex_width, tex_height))
+                    buffer.paste( self.texels, (0,tex_height-height,width,tex_height))
             elif isinstance(self.texels, pygame.surface.Surface): # pygame surface
-                buffer = pygame.surface.Surface( (width_pow2, height_pow2),
+                buffer = pygame.surface.Surface( (tex_width, tex_height),
                                                  self.texels.get_flags(),
                                                  self.texels.get_bitsize() )
-                buffer.blit( self.texels, (0,height_pow2-height) )
+                buffer.blit( self.texels, (0,tex_height-height) )
             else:
                 raise RuntimeError("texel data not recognized - changed?")
         else:
             buffer = self.texels
 
+        if isinstance(buffer,numpy.ndarray):
+            size = (tex_width, tex_height)
+        else:
+            size = None # already padded
+
         # Put data in texture object
         if not build_mipmaps:
-            texture_object.put_new_image( buffer, internal_format=internal_format, mipmap_level=0 )
+            texture_object.put_new_image( buffer, internal_format=internal_format, mipmap_level=0,
+                                          data_format=data_format, data_type=data_type, size=size )
         else:
+            builder = get_mipmap_builder()
+            if builder == 'opengl' and (width != tex_width or height != tex_height):
+                builder = 'box' # don't blend the padding into the image
             if 0:
                 # Build mipmaps with GLU (faster, but currently broken)
                 texture_object.put_new_image_build_mipmaps( buffer, internal_format=internal_format )
+            elif builder == 'opengl' and not isinstance(self.texels, Image.Image):
+                # Generate mipmaps in OpenGL
+                texture_object.put_new_image( buffer, internal_format=internal_format, mipmap_level=0,
+                                              data_format=data_format, data_type=data_type, size=size )
+                gl.glBindTexture(gl.GL_TEXTURE_2D, texture_object.gl_id)
+                _get_generate_mipmap()(gl.GL_TEXTURE_2D)
+            elif not isinstance(self.texels, Image.Image):
+                # Build mipmaps with numpy
+                if not isinstance(buffer,numpy.ndarray):
+                    # pygame surface not read in place
+                    buffer = self.get_texels_as_array()
+                    if buffer.shape[2] == 4:
+                        data_format = gl.GL_RGBA
+                    else:
+                        data_format = gl.GL_RGB
+                    data_type = None
+                levels = make_mipmap_levels(buffer, filter=builder,
+                                            round_up=not _check_non_power_of_2())
+                for mipmap_level, level in enumerate(levels):
+                    level_size = (max(1,tex_width>>mipmap_level),
+                                  max(1,tex_height>>mipmap_level))
+                    texture_object.put_new_image( level, internal_format=internal_format,
+                                                  mipmap_level=mipmap_level,
+                                                  data_format=data_format, data_type=data_type,
+                                                  size=level_size,
+                                                  check_opengl_errors = (mipmap_level == 0) )
+                del levels, level
             else:
                 # Build mipmaps in PIL
-                texture_object.put_new_image( buffer, internal_format=internal_format, mipmap_level=0 )
-                if not isinstance(self.texels, Image.Image): # PIL Image
-                    raise NotImplementedError(
-                        "Building of mipmaps not implemented for this texel "+\
-                        "data type. (Use PIL Images or set parameter "+\
-                        "mipmaps_enabled = False.)")
+                texture_object.put_new_image( buffer, internal_format=internal_format, mipmap_level=0,
+                                              data_format=data_format, data_type=data_type, size=size )
                 this_width, this_height = self.size
                 biggest_dim = max(this_width,this_height)
                 mipmap_level = 1
@@ -398,15 +705,20 @@ class Texture(object):
                     this_width = this_width/2.0
                     this_height = this_height/2.0
 
-                    width_pix = int(math.ceil(this_width))
-                    height_pix = int(math.ceil(this_height))
+                    if _check_non_power_of_2():
+                        # OpenGL's size for this level, whole texture used
+                        width_pix = max(1,int(this_width))
+                        height_pix = max(1,int(this_height))
+                    else:
+                        width_pix = int(math.ceil(this_width))
+                        height_pix = int(math.ceil(this_height))
                     shrunk = self.texels.resize((width_pix,height_pix),shrink_filter)
 
-                    width_pow2  = next_power_of_2(width_pix)
-                    height_pow2  = next_power_of_2(height_pix)
+                    tex_width = _get_texture_dimension(width_pix)
+                    tex_height = _get_texture_dimension(height_pix)
 
-                    im = Image.new(shrunk.mode,(width_pow2,height_pow2))
-                    im.paste(shrunk,(0,height_pow2-height_pix,width_pix,height_pow2))
+                    im = Image.new(shrunk.mode,(tex_width,tex_height))
+                    im.paste(shrunk,(0,tex_height-height_pix,width_pix,tex_height))
 
                     texture_object.put_new_image( im,
                                                   mipmap_level=mipmap_level,
@@ -416,6 +728,7 @@ class Texture(object):
 
                     mipmap_level += 1
                     biggest_dim = max(this_width,this_height)
+        del buffer
 
         # Keep reference to texture_object
         self.texture_object = texture_object
@@ -431,6 +744,87 @@ class TextureFromFile( Texture ):
                        "Texture instead.")
         Texture.__init__(self, filename)
 
+class SubImageTexture(Texture):
+    """A Texture allocated once, whose texels are replaced in place.
+
+    An OpenGL texture of texture_size (width, height) is allocated
+    when loaded.  set_sub_image() puts texel data (a numpy array, PIL
+    image or pygame surface) no larger than that into its lower left
+    corner, with TextureObject.put_sub_image(), the next time a
+    stimulus using it is drawn, and sets the texture coordinates to
+    cover only this part.  If the stimulus has num_pixel_buffers set,
+    the data is streamed through pixel buffer objects.  Mipmaps are
+    not supported.  Screen.put_pixels() uses this.
+
+    The texel data is sent in its own layout, without converting it
+    to the layout found fastest (see get_upload_format()).  Texel
+    data shown again and again can be converted once with
+    convert_texels_to_upload_format(), passing the data_format and
+    data_type returned with it to set_sub_image()."""
+
+    __slots__ = ('_sub_image',
+                 '_sub_image_format',
+                 '_sub_image_size',
+                 '_sub_image_pending',
+                 '_full_coverage',
+                 )
+
+    def __init__(self, texture_size, num_components=3):
+        width, height = texture_size
+        Texture.__init__(self, numpy.zeros((height,width,num_components),
+                                           dtype=numpy.uint8))
+        self._sub_image = None
+        self._sub_image_format = None
+        self._sub_image_size = None
+        self._sub_image_pending = False
+        self._full_coverage = None
+
+    def set_sub_image(self, texels, data_format=None, data_type=None):
+        """Show texels, put into the texture when next drawn.
+
+        data_format and data_type are passed to
+        TextureObject.put_sub_image()."""
+        texels = convert_to_numpy_if_array(texels)
+        width, height = get_texels_size(texels)
+        if width > self.size[0] or height > self.size[1]:
+            raise ValueError("texels larger than texture_size %s"%(self.size,))
+        self._sub_image = texels
+        self._sub_image_format = (data_format, data_type)
+        self._sub_image_size = (width, height)
+        self._sub_image_pending = True
+
+    def get_sub_image_size(self):
+        """Return (width, height) of the texels last set, or None."""
+        return self._sub_image_size
+
+    def load(self, texture_object, build_mipmaps=True,
+             rescale_original_to_fill_texture_object=False,
+             internal_format=gl.GL_RGB):
+        if build_mipmaps:
+            raise ValueError("Mipmaps not supported by SubImageTexture")
+        Texture.load(self, texture_object, build_mipmaps=build_mipmaps,
+                     rescale_original_to_fill_texture_object=rescale_original_to_fill_texture_object,
+                     internal_format=internal_format)
+        self._full_coverage = (self.buf_rf, self.buf_tf)
+        if self._sub_image is not None:
+            self._sub_image_pending = True # put it again after (re)loading
+
+    def update(self):
+        """Put the texels last set into the texture, if not done yet."""
+        if not self._sub_image_pending or self.texture_object is None:
+            return
+        data_format, data_type = self._sub_image_format
+        self.texture_object.put_sub_image(self._sub_image,
+                                          data_format=data_format,
+                                          data_type=data_type)
+        width, height = self._sub_image_size
+        full_rf, full_tf = self._full_coverage
+        self.buf_rf = full_rf*width/float(self.size[0])
+        self.buf_tf = full_tf*height/float(self.size[1])
+        self._buf_r = width
+        self._buf_t = height
+        self._sub_image_pending = False
+
 class TextureObject(object):
     """Texture data in OpenGL. Potentially resident in video texture memory.
 
@@ -447,13 +841,25 @@ class TextureObject(object):
         'target',
         'dimensions',
         'gl_id',
+        '_pixel_buffers',
+        '_next_pixel_buffer',
+        '_mapped_sub_image',
         '__gl_module__',
+        '__weakref__', # for sharing mask texture objects
         )
 
     _cube_map_side_names = ['positive_x', 'negative_x',
                             'positive_y', 'negative_y',
                             'positive_z', 'negative_z']
 
+    _data_format_components = {gl.GL_LUMINANCE:1,
+                               gl.GL_ALPHA:1,
+                               gl.GL_LUMINANCE_ALPHA:2,
+                               gl.GL_RGB:3,
+                               gl.GL_BGR:3,
+                               gl.GL_RGBA:4,
+                               gl.GL_BGRA:4}
+
     def __init__(self,
                  dimensions = 2):
         if dimensions not in [1,2,3,'cube']:
@@ -479,10 +885,22 @@ class TextureObject(object):
 
         self.dimensions = dimensions
         self.gl_id = gl.glGenTextures(1)
+        self._pixel_buffers = []
+        self._next_pixel_buffer = 0
+        self._mapped_sub_image = None
         self.__gl_module__ = gl # keep so we there's no error in __del__
 
     def __del__(self):
-        self.__gl_module__.glDeleteTextures(self.gl_id)
+        gl_module = getattr(self,'__gl_module__',None) # None if __init__ failed
+        if gl_module is None:
+            return
+        try:
+            if self._pixel_buffers:
+                gl_module.glDeleteBuffers(len(self._pixel_buffers),
+                                          self._pixel_buffers)
+            gl_module.glDeleteTextures(self.gl_id)
+        except Exception:
+            pass # OpenGL context or module already gone
 
     def is_resident(self):
         return gl.glAreTexturesResident( self.gl_id )
@@ -524,6 +942,18 @@ class TextureObject(object):
         gl.glTexParameteriv( self.target, gl.GL_TEXTURE_BORDER_COLOR, border_color)
         self.border_color = border_color
 
+    def release_storage(self, num_mipmap_levels=1):
+        """Free the texel data of a 2D texture object.
+
+        The texture object itself (and gl_id) stays valid, empty
+        until new data is put into it."""
+        if self.dimensions != 2:
+            raise RuntimeError("release_storage only supported for 2D textures.")
+        gl.glBindTexture(self.target, self.gl_id)
+        for level in range(num_mipmap_levels):
+            gl.glTexImage2D(self.target, level, gl.GL_RGB, 0, 0, 0,
+                            gl.GL_RGB, gl.GL_UNSIGNED_BYTE, None)
+
     def put_new_image(self,
                       texel_data,
                       mipmap_level = 0,
@@ -533,6 +963,7 @@ class TextureObject(object):
                       data_format = None, # automatic guess unless set explicitly
                       data_type = None, # automatic guess unless set explicitly
                       cube_side = None,
+                      size = None,
                       ):
 
         """Put numpy array or PIL Image into OpenGL as texture data.
@@ -576,9 +1007,24 @@ class TextureObject(object):
         assumed to be in the range 0.0-1.0 and are scaled to the range
         0-255.  If the data_type parameter is not None, the texel_data
         is not rescaled or recast.  Currently only GL_UNSIGNED_BYTE is
-        supported. For PIL images: texel_data is used as unsigned
-        bytes.  This is the usual format for common computer graphics
-        files."""
+        supported, and GL_UNSIGNED_INT_8_8_8_8_REV for unsigned byte
+        arrays with 4 components (see get_upload_format()). For PIL
+        images: texel_data is used as unsigned bytes.  This is the
+        usual format for common computer graphics files.
+
+        The size parameter, (width, height), allows a 2D texture image
+        larger than texel_data to be allocated.  texel_data is put in
+        its lower left corner.  The texels next to its top and right
+        edges are set to zero, the rest is undefined.
+
+        Copying: a numpy array (or any object with the buffer
+        protocol that numpy.asarray() can view, such as a memoryview
+        or an array made by texels_from_buffer()) of unsigned bytes
+        whose rows are in increasing memory order and whose texels
+        are packed is read by OpenGL in place, without copying, even
+        if rows are padded.  Other numpy arrays are copied (and
+        converted) once.  PIL images and pygame surfaces are copied
+        once into a string, with the row order reversed."""
 
         texel_data = convert_to_numpy_if_array(texel_data)
         if isinstance(texel_data,numpy.ndarray):
@@ -637,16 +1083,19 @@ class TextureObject(object):
                     texel_data = texel_data*255.0
 
         if data_type == gl.GL_UNSIGNED_BYTE:
-            if isinstance(texel_data,numpy.ndarray):
+            if isinstance(texel_data,numpy.ndarray) and texel_data.dtype != numpy.uint8:
                 texel_data = texel_data.astype(numpy.uint8) # (re)cast if necessary
-        else:
-            raise NotImplementedError("Only data_type GL_UNSIGNED_BYTE currently supported")
+        elif not (data_type == gl.GL_UNSIGNED_INT_8_8_8_8_REV and
+                  _is_packed_4_byte_texels(texel_data)):
+            raise NotImplementedError("Only data_type GL_UNSIGNED_BYTE (and "
+                                      "GL_UNSIGNED_INT_8_8_8_8_REV for 4 byte "
+                                      "texel arrays) currently supported")
 
-        # determine size and make sure its power of 2
+        # determine size and make sure it is allowed
         if self.dimensions == 1:
             # must be numpy array
             width = texel_data.shape[0]
-            if not is_power_of_2(width): raise ValueError("texel_data does not have all dimensions == n^2")
+            _check_texture_dimension(width)
         else:
             if isinstance(texel_data,numpy.ndarray):
                 width = texel_data.shape[1]
@@ -655,16 +1104,23 @@ class TextureObject(object):
                 width, height = texel_data.size
             elif isinstance(texel_data,pygame.surface.Surface):
                 width, height = texel_data.get_size()
-            if not is_power_of_2(width): raise ValueError("texel_data does not have all dimensions == n^2")
-            if not is_power_of_2(height): raise ValueError("texel_data does not have all dimensions == n^2")
+            data_width, data_height = width, height
+            if size is not None:
+                if self.dimensions != 2:
+                    raise ValueError("size can only be given for 2D textures")
+                width, height = size
+                if width < data_width or height < data_height:
+                    raise ValueError("size is smaller than texel_data")
+            _check_texture_dimension(width)
+            _check_texture_dimension(height)
             if self.dimensions == 3:
                 # must be numpy array
                 depth = texel_data.shape[2]
-                if not is_power_of_2(depth): raise ValueError("texel_data does not have all dimensions == n^2")
+                _check_texture_dimension(depth)
 
         if self.dimensions in [2,'cube']:
             if isinstance(texel_data,numpy.ndarray):
-                raw_data = texel_data.tostring()
+                raw_data = None # read in place below
             elif isinstance(texel_data,Image.Image):
                 raw_data = texel_data.tostring('raw',texel_data.mode,0,-1)
             elif isinstance(texel_data,pygame.surface.Surface):
@@ -702,7 +1158,7 @@ class TextureObject(object):
                                 border,
                                 data_format,
                                 data_type,
-                                raw_data)
+                                None) # proxy: data is not read
                 if gl.glGetTexLevelParameteriv(target, # Need PyOpenGL >= 2.0
                                                mipmap_level,
                                                gl.GL_TEXTURE_WIDTH) == 0:
@@ -741,15 +1197,59 @@ class TextureObject(object):
             else:
                 target_name = 'GL_CUBE_MAP_'+cube_side.upper()
                 target = getattr(gl,target_name)
-            gl.glTexImage2D(target,
-                            mipmap_level,
-                            internal_format,
-                            width,
-                            height,
-                            border,
-                            data_format,
-                            data_type,
-                            raw_data)
+            if (width, height) != (data_width, data_height):
+                # allocate, then put texel_data in the lower left
+                _raw_glTexImage2D(target,
+                                  mipmap_level,
+                                  internal_format,
+                                  width,
+                                  height,
+                                  border,
+                                  data_format,
+                                  data_type,
+                                  None)
+                if raw_data is None:
+                    _tex_sub_image_2d(target,mipmap_level,0,0,
+                                      data_format,texel_data,data_type)
+                else:
+                    gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT,1)
+                    try:
+                        gl.glTexSubImage2D(target,mipmap_level,0,0,
+                                           data_width,data_height,
+                                           data_format,data_type,raw_data)
+                    finally:
+                        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT,4)
+                # zeros next to the edges, so linear filtering there
+                # doesn't mix in undefined texels
+                num_components = TextureObject._data_format_components[data_format]
+                if data_width < width:
+                    zeros = numpy.zeros((min(data_height+1,height),1,num_components),numpy.uint8)
+                    _tex_sub_image_2d(target,mipmap_level,data_width,0,data_format,zeros,data_type)
+                if data_height < height:
+                    zeros = numpy.zeros((1,data_width,num_components),numpy.uint8)
+                    _tex_sub_image_2d(target,mipmap_level,0,data_height,data_format,zeros,data_type)
+            elif raw_data is None:
+                _tex_image_2d(target,
+                              mipmap_level,
+                              internal_format,
+                              border,
+                              data_format,
+                              texel_data,
+                              data_type)
+            else:
+                gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT,1)
+                try:
+                    gl.glTexImage2D(target,
+                                    mipmap_level,
+                                    internal_format,
+                                    width,
+                                    height,
+                                    border,
+                                    data_format,
+                                    data_type,
+                                    raw_data)
+                finally:
+                    gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT,4)
         elif self.dimensions == 3:
             gl.glTexImage3Dub(gl.GL_TEXTURE_3D,
                               mipmap_level,
@@ -887,8 +1387,8 @@ class TextureObject(object):
         (0,0) would be no offset and thus the new data would be placed
         in the lower left of the texture.
 
-        For an explanation of most parameters, see the
-        put_new_image() method."""
+        For an explanation of most parameters, and which texel data
+        is copied, see the put_new_image() method."""
 
         texel_data = convert_to_numpy_if_array(texel_data)
         if isinstance(texel_data,numpy.ndarray):
@@ -948,10 +1448,13 @@ class TextureObject(object):
                     texel_data = texel_data*255.0
 
         if data_type == gl.GL_UNSIGNED_BYTE:
-            if isinstance(texel_data,numpy.ndarray):
+            if isinstance(texel_data,numpy.ndarray) and texel_data.dtype != numpy.uint8:
                 texel_data = texel_data.astype(numpy.uint8) # (re)cast if necessary
-        else:
-            raise NotImplementedError("Only data_type GL_UNSIGNED_BYTE currently supported")
+        elif not (data_type == gl.GL_UNSIGNED_INT_8_8_8_8_REV and
+                  _is_packed_4_byte_texels(texel_data)):
+            raise NotImplementedError("Only data_type GL_UNSIGNED_BYTE (and "
+                                      "GL_UNSIGNED_INT_8_8_8_8_REV for 4 byte "
+                                      "texel arrays) currently supported")
 
         if self.dimensions == 1:
             if offset_tuple is None:
@@ -980,7 +1483,7 @@ class TextureObject(object):
             if isinstance(texel_data,numpy.ndarray):
                 width = texel_data.shape[1]
                 height = texel_data.shape[0]
-                raw_data = texel_data.astype(numpy.uint8).tostring()
+                raw_data = texel_data # read in place below if possible
             elif isinstance(texel_data,Image.Image):
                 width = texel_data.size[0]
                 height = texel_data.size[1]
@@ -991,20 +1494,172 @@ class TextureObject(object):
                     raw_data = pygame.image.tostring(texel_data,'RGBA',1)
                 else:
                     raw_data = pygame.image.tostring(texel_data,'RGB',1)
-            gl.glTexSubImage2D(target,
-                               mipmap_level,
-                               x_offset,
-                               y_offset,
-                               width,
-                               height,
-                               data_format,
-                               data_type,
-                               raw_data)
+            if self.dimensions == 2 and self._pixel_buffers:
+                # copy into the next pixel buffer object and upload from there
+                if not isinstance(raw_data,numpy.ndarray):
+                    raw_data = numpy.frombuffer(raw_data,numpy.uint8)
+                if data_format not in TextureObject._data_format_components:
+                    raise ValueError("Unsupported data_format for pixel buffer objects.")
+                num_components = TextureObject._data_format_components[data_format]
+                if raw_data.size != width*height*num_components:
+                    raise ValueError("texel_data does not match data_format")
+                mapped = self.map_sub_image_buffer(width,height,data_format)
+                mapped[...] = raw_data.reshape(mapped.shape)
+                del mapped
+                self.put_mapped_sub_image(mipmap_level = mipmap_level,
+                                          offset_tuple = (x_offset,y_offset),
+                                          data_type = data_type)
+                return
+            if isinstance(raw_data,numpy.ndarray):
+                _tex_sub_image_2d(target,
+                                  mipmap_level,
+                                  x_offset,
+                                  y_offset,
+                                  data_format,
+                                  raw_data,
+                                  data_type)
+                return
+            gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT,1)
+            try:
+                gl.glTexSubImage2D(target,
+                                   mipmap_level,
+                                   x_offset,
+                                   y_offset,
+                                   width,
+                                   height,
+                                   data_format,
+                                   data_type,
+                                   raw_data)
+            finally:
+                gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT,4)
         elif self.dimensions == 3:
             raise RuntimeError("Cannot put_sub_image on 3D texture_object.")
         else:
             raise RuntimeError("Unknown number of dimensions.")
 
+    def set_num_pixel_buffers(self, num_pixel_buffers=2):
+        """Stream put_sub_image() data through pixel buffer objects.
+
+        With num_pixel_buffers > 0, put_sub_image() on a 2D texture
+        copies the texel data into the next of a ring of
+        num_pixel_buffers OpenGL pixel buffer objects and updates the
+        texture from that buffer.  The copy is a plain memory copy,
+        and the call returns without waiting for OpenGL to finish
+        reading the previous frame's data, which it can do while the
+        next frame is being prepared.  The same ring is used by
+        map_sub_image_buffer() and put_mapped_sub_image(), which let
+        you write texel data directly into the buffer.
+
+        If pixel buffer objects are not supported (they need OpenGL
+        2.1 or GL_ARB_pixel_buffer_object) or num_pixel_buffers is 0,
+        the texture is updated directly from the texel data as
+        before.  Requires OpenGL context."""
+        if self.dimensions != 2:
+            raise RuntimeError("Pixel buffer objects only supported for 2D textures.")
+        if self._mapped_sub_image is not None:
+            raise RuntimeError("Cannot change pixel buffers while one is mapped.")
+        if self._pixel_buffers:
+            gl.glDeleteBuffers(len(self._pixel_buffers),self._pixel_buffers)
+            self._pixel_buffers = []
+        if num_pixel_buffers > 0 and VisionEgg.Core._pixel_buffer_objects_supported():
+            self._pixel_buffers = list(numpy.atleast_1d(gl.glGenBuffers(num_pixel_buffers)))
+        self._next_pixel_buffer = 0
+
+    def get_num_pixel_buffers(self):
+        """Number of pixel buffer objects used to stream texel data."""
+        return len(self._pixel_buffers)
+
+    def map_sub_image_buffer(self, width, height, data_format=gl.GL_RGB):
+        """Return a writable array to fill with the next texel data.
+
+        The array has shape (height,width) for single-component
+        formats or (height,width,components) otherwise, dtype uint8,
+        and the first row is the bottom row, like texel_data for
+        put_sub_image().  When pixel buffer objects are used (see
+        set_num_pixel_buffers()), the array is the mapped memory of
+        the next pixel buffer object, so image data decoded into it is
+        never copied by Python.  Call put_mapped_sub_image() to update
+        the texture.  Do not use the array after that."""
+        if self.dimensions != 2:
+            raise RuntimeError("map_sub_image_buffer only supported for 2D textures.")
+        if self._mapped_sub_image is not None:
+            raise RuntimeError("Texel data already mapped, call put_mapped_sub_image() first.")
+        if data_format not in TextureObject._data_format_components:
+            raise ValueError("Unsupported data_format for map_sub_image_buffer.")
+        num_components = TextureObject._data_format_components[data_format]
+        if num_components == 1:
+            shape = (height,width)
+        else:
+            shape = (height,width,num_components)
+        num_bytes = width*height*num_components
+        if self._pixel_buffers:
+            pixel_buffer = self._pixel_buffers[self._next_pixel_buffer]
+            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER,pixel_buffer)
+            try:
+                # Give the buffer new storage, so that OpenGL doesn't
+                # have to wait until it has read the old contents.
+                gl.glBufferData(gl.GL_PIXEL_UNPACK_BUFFER,num_bytes,None,gl.GL_STREAM_DRAW)
+                address = gl.glMapBuffer(gl.GL_PIXEL_UNPACK_BUFFER,gl.GL_WRITE_ONLY)
+            finally:
+                gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER,0)
+            if not address:
+                raise RuntimeError("Could not map pixel buffer object.")
+            memory = (ctypes.c_ubyte*num_bytes).from_address(address)
+            array = numpy.frombuffer(memory,numpy.uint8).reshape(shape)
+        else:
+            array = numpy.empty(shape,numpy.uint8)
+        self._mapped_sub_image = (width,height,data_format,array)
+        return array
+
+    def put_mapped_sub_image(self,
+                             mipmap_level = 0,
+                             offset_tuple = None,
+                             data_type = gl.GL_UNSIGNED_BYTE):
+        """Replace all or part of a texture object with the mapped texel data.
+
+        Updates the texture with the array returned by the last call
+        to map_sub_image_buffer().  For an explanation of the
+        parameters, see the put_sub_image() method."""
+        if self._mapped_sub_image is None:
+            raise RuntimeError("No texel data mapped, call map_sub_image_buffer() first.")
+        width, height, data_format, array = self._mapped_sub_image
+        self._mapped_sub_image = None
+        if not self._pixel_buffers:
+            self.put_sub_image(array,
+                               mipmap_level = mipmap_level,
+                               offset_tuple = offset_tuple,
+                               data_format = data_format,
+                               data_type = data_type)
+            return
+        del array # memory is invalid once unmapped
+
+        if offset_tuple is None:
+            x_offset = y_offset = 0
+        else:
+            x_offset, y_offset = offset_tuple
+
+        pixel_buffer = self._pixel_buffers[self._next_pixel_buffer]
+        self._next_pixel_buffer = (self._next_pixel_buffer+1)%len(self._pixel_buffers)
+
+        gl.glBindTexture(self.target, self.gl_id)
+        gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER,pixel_buffer)
+        try:
+            gl.glUnmapBuffer(gl.GL_PIXEL_UNPACK_BUFFER)
+            gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT,1)
+            # Source is an offset into the bound pixel buffer object
+            _raw_glTexSubImage2D(gl.GL_TEXTURE_2D,
+                                 mipmap_level,
+                                 x_offset,
+                                 y_offset,
+                                 width,
+                                 height,
+                                 data_format,
+                                 data_type,
+                                 ctypes.c_void_p(0))
+        finally:
+            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER,0)
+            gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT,4)
+
     def put_new_framebuffer(self,
                             buffer='back',
                             mipmap_level = 0,
@@ -1046,10 +1701,10 @@ class TextureObject(object):
         if size is None:
             raise ValueError("Must specify size for put_new_framebuffer(): cannot guess")
 
-        # determine size and make sure its power of 2
+        # determine size and make sure it is allowed
         width, height = size
-        if not is_power_of_2(width): raise ValueError("texel_data does not have all dimensions == n^2")
-        if not is_power_of_2(height): raise ValueError("texel_data does not have all dimensions == n^2")
+        _check_texture_dimension(width)
+        _check_texture_dimension(height)
 
         target = gl.GL_TEXTURE_2D
         gl.glCopyTexImage2D(target,
@@ -1061,6 +1716,1034 @@ class TextureObject(object):
                             height,
                             border)
 
+####################################################################
+#
+#        Loading image files
+#
+####################################################################
+
+def _get_texel_mode(image):
+    """PIL mode for the texel array of an image: 'L', 'RGB' or 'RGBA'."""
+    if image.mode in ('RGBA','LA') or 'transparency' in image.info:
+        return 'RGBA'
+    elif image.mode in ('L','1'):
+        return 'L'
+    else:
+        return 'RGB'
+
+def _get_texel_cache_filename(filename, mode, cache_dir):
+    stat = os.stat(filename)
+    key = '%s\n%r\n%d\n%s'%(os.path.abspath(filename), stat.st_mtime,
+                            stat.st_size, mode)
+    return os.path.join(cache_dir, hashlib.md5(key).hexdigest()+'.npy')
+
+def _decode_image_file(args):
+    """Decode an image file to a texel array (in a worker).
+
+    If cache_filename is not None, the array is saved there and None
+    returned."""
+    filename, mode, cache_filename = args
+    image = Image.open(filename)
+    if mode is None:
+        mode = _get_texel_mode(image)
+    if image.mode != mode:
+        image = image.convert(mode)
+    width, height = image.size
+    texels = numpy.fromstring(image.tostring('raw',mode,0,-1), # bottom row first
+                              dtype=numpy.uint8)
+    if mode == 'L':
+        texels.shape = (height,width)
+    else:
+        texels.shape = (height,width,len(mode))
+    if cache_filename is None:
+        return texels
+    # Write to a temporary file first, so other sessions never see
+    # a partially written cache file.
+    temp_filename = '%s.%d.%d.tmp.npy'%(cache_filename[:-len('.npy')],
+                                         os.getpid(),id(texels))
+    numpy.save(temp_filename, texels)
+    try:
+        os.rename(temp_filename, cache_filename)
+    except OSError:
+        # Already cached by another process (on Windows).
+        os.remove(temp_filename)
+    return None
+
+def load_texture_files(filenames, mode=None, cache_dir=None, num_workers=None,
+                       use_processes=False):
+    """Decode many image files in parallel and return a list of Textures.
+
+    Each image file is decoded with PIL into an unsigned byte texel
+    array, in num_workers threads (or processes, if use_processes is
+    true), by default one per processor.  The Textures hold these
+    arrays, which Texture.load() sends to OpenGL in place.  mode is
+    the PIL mode of the arrays, 'L', 'RGB' or 'RGBA'.  If it is None,
+    'RGBA' is used for images with transparency, 'L' for grayscale
+    images and 'RGB' for the rest.
+
+    If cache_dir is not None, the decoded arrays are also saved in
+    that directory as .npy files, named after the path, modification
+    time and size of the image file and the mode.  Files found there
+    are memory mapped instead of decoding the image file again,
+    which is much faster.  Delete the directory to clear the
+    cache."""
+    import multiprocessing, multiprocessing.pool
+
+    logger = logging.getLogger('VisionEgg.Textures')
+    start = VisionEgg.true_time_func()
+    if mode not in (None,'L','RGB','RGBA'):
+        raise ValueError("mode must be None, 'L', 'RGB' or 'RGBA'")
+    if cache_dir is not None and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    texels_list = [None]*len(filenames)
+    jobs = []
+    for i, filename in enumerate(filenames):
+        cache_filename = None
+        if cache_dir is not None:
+            cache_filename = _get_texel_cache_filename(filename, mode, cache_dir)
+            if os.path.isfile(cache_filename):
+                try:
+                    texels_list[i] = numpy.load(cache_filename, mmap_mode='r')
+                except (IOError, ValueError), x:
+                    logger.warning("Decoding %s again, cannot read texel "
+                                   "cache file %s: %s"%(filename,cache_filename,x))
+                else:
+                    continue
+        jobs.append((i,(filename,mode,cache_filename)))
+
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    num_workers = max(1,min(num_workers,len(jobs)))
+    job_args = [args for i, args in jobs]
+    if num_workers == 1:
+        results = map(_decode_image_file, job_args)
+    else:
+        if use_processes:
+            pool = multiprocessing.Pool(num_workers)
+        else:
+            pool = multiprocessing.pool.ThreadPool(num_workers)
+        try:
+            results = pool.map(_decode_image_file, job_args)
+        finally:
+            pool.close()
+            pool.join()
+    for (i, (filename, job_mode, cache_filename)), texels in zip(jobs, results):
+        if texels is None:
+            texels = numpy.load(cache_filename, mmap_mode='r')
+        texels_list[i] = texels
+
+    textures = [Texture(texels) for texels in texels_list]
+    logger.info("Loaded %d image files (%d from cache) in %.2f seconds."%(
+        len(filenames), len(filenames)-len(jobs),
+        VisionEgg.true_time_func()-start))
+    return textures
+
+####################################################################
+#
+#        Texture datasets
+#
+####################################################################
+
+class TextureDataset(object):
+    """Images in a memory mapped array or directory of arrays, read when used.
+
+    source is an array of shape (num_images,height,width) or
+    (num_images,height,width,num_components), usually a numpy.memmap,
+    the filename of such an array saved with numpy.save(), or a
+    directory of .npy files holding one image each (used in sorted
+    order).  Arrays are memory mapped, so only the images used are
+    read from disk, and the operating system may drop them from
+    memory again.  All images must have the same shape, with the
+    bottom row first, like the arrays of a Texture.
+
+    Use get_texture() to get a DatasetTexture for a TextureStimulus.
+    Call prefetch() with the indices of the images that will be shown
+    next, so a background thread reads them from disk before they are
+    needed.  Call close() to stop the thread."""
+
+    prefetch_history = 64 # don't prefetch an image done this recently
+
+    def __init__(self, source):
+        self._filenames = None
+        self._texels = None
+        if type(source) in (types.StringType,types.UnicodeType):
+            if os.path.isdir(source):
+                filenames = [os.path.join(source,name)
+                             for name in os.listdir(source)
+                             if name.endswith('.npy')]
+                if not len(filenames):
+                    raise ValueError("No .npy files in directory %s"%source)
+                filenames.sort()
+                self._filenames = filenames
+                first = numpy.load(filenames[0], mmap_mode='r')
+                self.image_shape = first.shape
+                self.dtype = first.dtype
+            else:
+                source = numpy.load(source, mmap_mode='r')
+        if self._filenames is None:
+            source = convert_to_numpy_if_array(source)
+            if len(source.shape) not in (3,4):
+                raise ValueError("Array of shape (num_images,height,width) "
+                                 "or (num_images,height,width,num_components) "
+                                 "needed")
+            self._texels = source
+            self.image_shape = source.shape[1:]
+            self.dtype = source.dtype
+        if len(self.image_shape) == 3 and self.image_shape[2] not in (3,4):
+            raise ValueError("Only luminance, RGB and RGBA images allowed")
+
+        self.num_prefetched = 0
+        self._pending = [] # indices to prefetch, next first
+        self._recent = [] # indices prefetched, latest last
+        self._condition = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._prefetch_thread = None
+
+    def __len__(self):
+        if self._filenames is not None:
+            return len(self._filenames)
+        return len(self._texels)
+
+    def get_texels(self, index):
+        """Return the texel array of an image, read from disk when used."""
+        if self._filenames is None:
+            return self._texels[index]
+        texels = numpy.load(self._filenames[index], mmap_mode='r')
+        if texels.shape != self.image_shape or texels.dtype != self.dtype:
+            raise ValueError("%s holds a %s array of shape %s, not %s like "
+                             "the first one"%(self._filenames[index],
+                                              texels.dtype,texels.shape,
+                                              self.image_shape))
+        return texels
+
+    def get_texture(self, index=0):
+        """Return a DatasetTexture showing the image at index."""
+        return DatasetTexture(self, index)
+
+    def prefetch(self, indices):
+        """Read the images at indices from disk in a background thread.
+
+        This is a hint, replacing any earlier indices not prefetched
+        yet.  Give the indices of the images needed next, the first
+        needed first.  Indices out of range are ignored."""
+        num_images = len(self)
+        indices = [index for index in indices if 0 <= index < num_images]
+        self._condition.acquire()
+        try:
+            if self._closed:
+                raise RuntimeError("TextureDataset is closed")
+            self._pending = indices
+            if not indices:
+                return
+            if self._prefetch_thread is None:
+                self._prefetch_thread = threading.Thread(
+                    target=self.__prefetch_images,name='TextureDataset-prefetch')
+                self._prefetch_thread.setDaemon(True)
+                self._prefetch_thread.start()
+            self._condition.notify()
+        finally:
+            self._condition.release()
+
+    def wait_prefetched(self):
+        """Wait until all images given to prefetch() have been read."""
+        self._condition.acquire()
+        try:
+            while len(self._pending) or self._busy:
+                self._condition.wait()
+        finally:
+            self._condition.release()
+
+    def close(self):
+        """Stop the prefetch thread."""
+        self._condition.acquire()
+        try:
+            self._closed = True
+            self._pending = []
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        if self._prefetch_thread is not None:
+            self._prefetch_thread.join()
+            self._prefetch_thread = None
+
+    def __prefetch_images(self):
+        scratch = None
+        while 1:
+            self._condition.acquire()
+            try:
+                self._busy = False
+                self._condition.notifyAll()
+                while not len(self._pending) and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    break
+                index = self._pending.pop(0)
+                if index in self._recent:
+                    continue
+                self._busy = True
+            finally:
+                self._condition.release()
+            try:
+                texels = self.get_texels(index)
+                if scratch is None or len(scratch) < texels.nbytes:
+                    scratch = numpy.empty((texels.nbytes,),numpy.uint8)
+                self.__read_texels(texels, scratch)
+                del texels
+            except Exception, x:
+                logger = logging.getLogger('VisionEgg.Textures')
+                logger.warning("Cannot prefetch image %d: %s: %s"%(
+                    index,str(x.__class__),str(x)))
+            self._condition.acquire()
+            try:
+                self._recent.append(index)
+                del self._recent[:-self.prefetch_history]
+                self.num_prefetched += 1
+            finally:
+                self._condition.release()
+
+    def __read_texels(self, texels, scratch):
+        # Copying with ctypes.memmove() releases the global
+        # interpreter lock, so other threads keep running while
+        # pages are read from disk.
+        if texels.flags.c_contiguous:
+            ctypes.memmove(scratch.ctypes.data, texels.ctypes.data, texels.nbytes)
+        elif texels[0].flags.c_contiguous:
+            row_bytes = texels[0].nbytes
+            for row in range(texels.shape[0]):
+                ctypes.memmove(scratch.ctypes.data,
+                               texels.ctypes.data + row*texels.strides[0],
+                               row_bytes)
+        else:
+            numpy.ascontiguousarray(texels) # holds the interpreter lock
+
+class DatasetTexture(Texture):
+    """A Texture showing one image of a TextureDataset, switched by index.
+
+    Use it as the texture parameter of a TextureStimulus (or other
+    texture stimulus), and call set_index() to show another image.
+    The next time the stimulus is drawn, update() sends the new
+    image into the same texture object (with put_sub_image(), or by
+    loading it again if mipmaps are enabled), so switching images is
+    cheap.  Only the current image is held in memory.  It is sent in
+    the layout of the dataset, without converting it to the layout
+    found fastest (see get_upload_format())."""
+
+    __slots__ = ('dataset',
+                 'index',
+                 '_loaded_index',
+                 '_load_kw',
+                 )
+
+    def __init__(self, dataset, index=0):
+        self.dataset = dataset
+        self.index = index
+        self._loaded_index = None
+        self._load_kw = None
+        Texture.__init__(self, dataset.get_texels(index))
+
+    def set_index(self, index, num_prefetch=0):
+        """Show the image at index, prefetching the num_prefetch next ones."""
+        if index != self.index:
+            self.texels = self.dataset.get_texels(index)
+            self.index = index
+        if num_prefetch and index+1 < len(self.dataset):
+            # Near the end of the dataset, keep the earlier indices.
+            self.dataset.prefetch(range(index+1,index+1+num_prefetch))
+
+    def load(self, texture_object, build_mipmaps=True,
+             rescale_original_to_fill_texture_object=False,
+             internal_format=gl.GL_RGB):
+        Texture.load(self, texture_object, build_mipmaps=build_mipmaps,
+                     rescale_original_to_fill_texture_object=rescale_original_to_fill_texture_object,
+                     internal_format=internal_format)
+        self._loaded_index = self.index
+        self._load_kw = {'build_mipmaps':build_mipmaps,
+                         'internal_format':internal_format}
+
+    def update(self):
+        """Send the image at index to OpenGL, if not done yet."""
+        if self.texture_object is None or self.index == self._loaded_index:
+            return
+        if self._load_kw['build_mipmaps']:
+            self.load(self.texture_object, **self._load_kw)
+        else:
+            self.texture_object.put_sub_image(self.texels)
+            self._loaded_index = self.index
+
+####################################################################
+#
+#        Texel upload format
+#
+####################################################################
+
+# Candidate texel layouts: (data_format, data_type, bytes per texel)
+_upload_formats = {
+    'RGB':(gl.GL_RGB, gl.GL_UNSIGNED_BYTE, 3),
+    'RGBA':(gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, 4),
+    'BGRA':(gl.GL_BGRA, gl.GL_UNSIGNED_BYTE, 4),
+    'BGRA_REV':(gl.GL_BGRA, gl.GL_UNSIGNED_INT_8_8_8_8_REV, 4),
+    }
+
+# Order of the bytes of a texel in each layout
+_upload_format_byte_orders = {
+    'RGB':'RGB',
+    'RGBA':'RGBA',
+    'BGRA':'BGRA',
+    }
+if sys.byteorder == 'little':
+    _upload_format_byte_orders['BGRA_REV'] = 'BGRA'
+else:
+    _upload_format_byte_orders['BGRA_REV'] = 'ARGB'
+
+_data_format_byte_orders = {gl.GL_RGB:'RGB',
+                            gl.GL_RGBA:'RGBA',
+                            gl.GL_BGR:'BGR',
+                            gl.GL_BGRA:'BGRA'}
+
+upload_format = None # name of the layout used, see get_upload_format()
+
+def probe_upload_formats(size=(512,512), num_uploads=8, num_rounds=5):
+    """Find the fastest layout to send color texel data to OpenGL.
+
+    Times num_uploads texture updates of the given size in each of
+    the layouts 'RGB' and 'RGBA' (unsigned bytes), 'BGRA' (unsigned
+    bytes) and 'BGRA_REV' (GL_BGRA, GL_UNSIGNED_INT_8_8_8_8_REV)
+    into an RGBA texture, sets upload_format to the fastest and logs
+    the result.  This is repeated num_rounds times, taking turns
+    between the layouts, and the fastest round of each layout is
+    used, so that other activity on the computer affects the result
+    less.  Returns a list of (seconds per upload, layout name),
+    fastest first.  The texture bound before is bound again.
+    Requires OpenGL context."""
+    global upload_format
+    width, height = size
+    old_binding = gl.glGetIntegerv(gl.GL_TEXTURE_BINDING_2D)
+    texture_object = TextureObject(dimensions=2)
+    try:
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture_object.gl_id)
+        _raw_glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA8, width, height, 0,
+                          gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
+        candidates = []
+        for name, (data_format, data_type, num_bytes) in _upload_formats.iteritems():
+            texels = numpy.zeros((height,width,num_bytes),numpy.uint8)
+            try:
+                _tex_sub_image_2d(gl.GL_TEXTURE_2D,0,0,0,data_format,texels,data_type)
+            except gl.GLError:
+                continue # not supported
+            candidates.append((name, data_format, data_type, texels))
+        best = {}
+        for round_number in range(num_rounds):
+            for name, data_format, data_type, texels in candidates:
+                gl.glFinish()
+                start = VisionEgg.true_time_func()
+                for i in range(num_uploads):
+                    _tex_sub_image_2d(gl.GL_TEXTURE_2D,0,0,0,data_format,texels,data_type)
+                gl.glFinish()
+                stop = VisionEgg.true_time_func()
+                seconds = (stop-start)/num_uploads
+                best[name] = min(best.get(name,seconds),seconds)
+    finally:
+        gl.glBindTexture(gl.GL_TEXTURE_2D, int(old_binding))
+        del texture_object
+    results = [(seconds, name) for name, seconds in best.iteritems()]
+    results.sort()
+    upload_format = results[0][1]
+    logger = logging.getLogger('VisionEgg.Textures')
+    logger.info("Texture upload format %s is fastest (%s)."%(
+        upload_format,
+        ', '.join(["%s: %.2f msec"%(name,seconds*1e3) for seconds, name in results])))
+    return results
+
+def get_upload_format():
+    """Return (name, data_format, data_type) of the texel layout in use.
+
+    Texture.load() converts 3 and 4 component arrays to this layout
+    (adding opaque alpha if needed) before sending them to OpenGL,
+    unless it is 'RGB' or 'RGBA', which need no conversion.  The
+    layout is set by VISIONEGG_TEXTURE_UPLOAD_FORMAT, or if that is
+    'auto' (the default), by calling probe_upload_formats().  This is
+    done when the first screen is created, or else the first time it
+    is needed.  Requires OpenGL context."""
+    global upload_format
+    if upload_format is None:
+        name = VisionEgg.config.VISIONEGG_TEXTURE_UPLOAD_FORMAT
+        if name == 'auto':
+            probe_upload_formats()
+        elif name in _upload_formats:
+            upload_format = name
+            logger = logging.getLogger('VisionEgg.Textures')
+            logger.info("Texture upload format %s."%upload_format)
+        else:
+            raise ValueError("VISIONEGG_TEXTURE_UPLOAD_FORMAT must be "
+                             "'auto' or one of %s"%(_upload_formats.keys(),))
+    data_format, data_type, num_bytes = _upload_formats[upload_format]
+    return upload_format, data_format, data_type
+
+def convert_texels_to_upload_format(texels, data_format=None):
+    """Convert a color texel array to the layout in use, once.
+
+    Returns (texels, data_format, data_type) to pass to
+    TextureObject.put_new_image() or put_sub_image().  Do this once,
+    for example when loading an image sequence, not before every
+    update.  texels must be an unsigned byte array with 3 or 4
+    components.  Its data_format (default: GL_RGB or GL_RGBA,
+    depending on the number of components) may also be GL_BGR or
+    GL_BGRA.  texels is returned as it is if the layout in use is
+    'RGB' or 'RGBA', or if it already has the layout in use.
+    Otherwise a copy in the layout is returned.  Requires OpenGL
+    context."""
+    if data_format is None:
+        data_format = [gl.GL_RGB, gl.GL_RGBA][texels.shape[2]-3]
+    source_order = _data_format_byte_orders[data_format]
+    name, upload_data_format, upload_data_type = get_upload_format()
+    if name in ('RGB','RGBA'):
+        return texels, data_format, gl.GL_UNSIGNED_BYTE
+    order = _upload_format_byte_orders[name]
+    if source_order == order:
+        return texels, upload_data_format, upload_data_type
+    converted = numpy.empty((texels.shape[0],texels.shape[1],len(order)),numpy.uint8)
+    for i, component in enumerate(order):
+        if component in source_order:
+            converted[:,:,i] = texels[:,:,source_order.index(component)]
+        else:
+            converted[:,:,i] = 255 # opaque
+    return converted, upload_data_format, upload_data_type
+
+####################################################################
+#
+#        Mipmaps
+#
+####################################################################
+
+mipmap_filters = ('box','lanczos')
+
+def _get_resampling_taps(num_in, num_out, filter):
+    """Source indices and weights of each resampled texel, shape (num_out,taps)."""
+    scale = float(num_in)/num_out
+    centers = (numpy.arange(num_out)+0.5)*scale # in source texels
+    if filter == 'box':
+        support = 0.5*scale
+    elif filter == 'lanczos':
+        support = 3.0*max(scale,1.0)
+    else:
+        raise ValueError("filter must be one of %s"%(mipmap_filters,))
+    num_taps = int(math.ceil(2*support))+1
+    indices = (numpy.floor(centers-support).astype(numpy.int_)[:,numpy.newaxis] +
+               numpy.arange(num_taps))
+    if filter == 'box':
+        # area of each source texel covered
+        weights = (numpy.minimum(indices+1,(centers+support)[:,numpy.newaxis]) -
+                   numpy.maximum(indices,(centers-support)[:,numpy.newaxis]))
+        weights = numpy.maximum(weights,0.0)
+    else:
+        x = (indices+0.5-centers[:,numpy.newaxis])/max(scale,1.0)
+        weights = numpy.sinc(x)*numpy.sinc(x/3.0)
+        weights[abs(x) >= 3.0] = 0.0
+    weights /= numpy.sum(weights,axis=1)[:,numpy.newaxis]
+    indices = numpy.clip(indices,0,num_in-1) # repeat edge texels
+    return indices, weights.astype(numpy.float32)
+
+def _resample_axis(texels, axis, num_out, filter):
+    """Resample float32 texels to num_out texels along axis."""
+    num_in = texels.shape[axis]
+    if num_in == num_out:
+        return texels
+    indices, weights = _get_resampling_taps(num_in, num_out, filter)
+    weight_shape = [1]*len(texels.shape)
+    weight_shape[axis] = num_out
+    result = None
+    for i in range(indices.shape[1]):
+        if not numpy.any(weights[:,i]):
+            continue
+        term = numpy.take(texels,indices[:,i],axis=axis)
+        term *= weights[:,i].reshape(weight_shape)
+        if result is None:
+            result = term
+        else:
+            result += term
+    return result
+
+def _convert_resampled(texels, dtype):
+    if numpy.issubdtype(dtype, numpy.integer):
+        info = numpy.iinfo(dtype)
+        texels = numpy.clip(numpy.round(texels), info.min, info.max)
+    return texels.astype(dtype)
+
+def resample_texels(texels, size, filter='box'):
+    """Return a texel array resampled to size (width, height).
+
+    texels is an array of shape (height,width) or
+    (height,width,num_components) of any integer or float type, which
+    the result keeps.  filter is 'box' (the average of the covered
+    texels) or 'lanczos' (3 lobes, sharper)."""
+    texels = numpy.asarray(texels)
+    width, height = size
+    result = texels.astype(numpy.float32)
+    result = _resample_axis(result, 0, height, filter)
+    result = _resample_axis(result, 1, width, filter)
+    return _convert_resampled(result, texels.dtype)
+
+def make_mipmap_levels(texels, filter='box', round_up=False):
+    """Return the mipmap levels of a texel array, largest first.
+
+    Each level halves the size of the previous one, rounded down as
+    required by OpenGL (or rounded up, to put it into part of a power
+    of 2 size texture), until it is 1x1.  texels is an array of shape
+    (height,width) or (height,width,num_components) of any integer or
+    float type, which the levels keep.  Each level is made from the
+    previous one, with filter 'box' (2x2 average) or 'lanczos'.  The
+    first level is texels itself."""
+    texels = numpy.asarray(texels)
+    levels = [texels]
+    height, width = texels.shape[:2]
+    level = texels.astype(numpy.float32)
+    while width > 1 or height > 1:
+        if round_up:
+            width, height = (width+1)//2, (height+1)//2
+        else:
+            width, height = max(1,width//2), max(1,height//2)
+        level = _resample_axis(level, 0, height, filter)
+        level = _resample_axis(level, 1, width, filter)
+        levels.append(_convert_resampled(level, texels.dtype))
+    return levels
+
+mipmap_builder = None # name of the builder used, see get_mipmap_builder()
+
+def get_mipmap_builder():
+    """Return how Texture.load() builds mipmaps: 'opengl', 'box' or 'lanczos'.
+
+    'opengl' generates the levels of arrays and pygame surfaces in
+    OpenGL (OpenGL 3.0 or the GL_ARB_framebuffer_object or
+    GL_EXT_framebuffer_object extension) from the first level.
+    Otherwise, they are made with make_mipmap_levels() using the
+    given filter.  The levels of PIL images are always made with
+    PIL.  Set
+    by VISIONEGG_MIPMAP_BUILDER, where 'auto' (the default) uses
+    'opengl' if supported, 'box' otherwise.  Requires OpenGL
+    context."""
+    global mipmap_builder
+    if mipmap_builder is None:
+        name = VisionEgg.config.VISIONEGG_MIPMAP_BUILDER
+        if name not in ('auto','opengl')+mipmap_filters:
+            raise ValueError("VISIONEGG_MIPMAP_BUILDER must be 'auto', "
+                             "'opengl' or one of %s"%(mipmap_filters,))
+        if name in ('auto','opengl'):
+            if _get_generate_mipmap() is not None:
+                name = 'opengl'
+            else:
+                if name == 'opengl':
+                    logger = logging.getLogger('VisionEgg.Textures')
+                    logger.warning("OpenGL cannot generate mipmaps, "
+                                   "building them with a box filter.")
+                name = 'box'
+        mipmap_builder = name
+        logger = logging.getLogger('VisionEgg.Textures')
+        logger.info("Building mipmaps with %s."%mipmap_builder)
+    return mipmap_builder
+
+_generate_mipmap = None
+
+def _get_generate_mipmap():
+    """Return glGenerateMipmap() if supported, or None."""
+    global _generate_mipmap
+    if _generate_mipmap is None:
+        extensions = gl.glGetString(gl.GL_EXTENSIONS)
+        if extensions is None:
+            extensions = []
+        else:
+            extensions = extensions.split()
+        _generate_mipmap = False
+        if (VisionEgg.Core._get_gl_version_tuple() >= (3, 0) or
+            'GL_ARB_framebuffer_object' in extensions):
+            if bool(gl.glGenerateMipmap):
+                _generate_mipmap = gl.glGenerateMipmap
+        elif 'GL_EXT_framebuffer_object' in extensions:
+            from OpenGL.GL.EXT.framebuffer_object import glGenerateMipmapEXT
+            if bool(glGenerateMipmapEXT):
+                _generate_mipmap = glGenerateMipmapEXT
+    return _generate_mipmap or None
+
+####################################################################
+#
+#        Texture manager
+#
+####################################################################
+
+class _TextureEntry(object):
+    """A texture object managed by TextureManager (private)."""
+    __slots__ = ('key',
+                 'texture',
+                 'texture_object',
+                 'internal_format',
+                 'build_mipmaps',
+                 'shrink_texture_ok',
+                 'pinned',
+                 'refcount',
+                 'resident',
+                 'num_bytes',
+                 'saved_bytes',
+                 'num_levels',
+                 'last_used',
+                 'last_used_frame',
+                 )
+
+class TextureManager(object):
+    """Share, budget and evict the texture objects of texture stimuli.
+
+    Every TextureStimulusBaseClass instance gets its TextureObject
+    from the module-level instance, texture_manager.  Stimuli using
+    the same Texture instance (or Texture instances loaded from the
+    same image file) with the same internal format, mipmap setting
+    and number of pixel buffers share one TextureObject, which is
+    reference counted.
+
+    If budget_bytes is not None, the estimated video memory of all
+    resident textures is kept below it by evicting the least recently
+    drawn textures, first those no stimulus uses anymore.  An evicted
+    texture keeps its TextureObject (and gl_id), but its texel
+    storage is freed.  It is reloaded from its Texture the next time
+    it is drawn.  Changes made directly to the texture object (for
+    example with put_sub_image()) are lost by eviction, unless the
+    texture was acquired as pinned or its Texture.update() method
+    makes them again.  Textures drawn in the current frame are never
+    evicted, so the budget may be exceeded by a single frame's
+    textures (a warning is logged).
+
+    The display lists of SpinningDrum and of the stimuli in
+    VisionEgg.SphereMap are allocated and freed with
+    gen_display_lists() and delete_display_lists(), so that they
+    are counted too.
+
+    The initial budget is VISIONEGG_TEXTURE_MEMORY_MB (0 means no
+    budget)."""
+
+    def __init__(self, budget_bytes=None):
+        self.budget_bytes = budget_bytes
+        self._entries = {}
+        self._use_count = 0
+        self._gave_budget_warning = False
+        self.num_display_lists = 0
+        self._collect_refs = {}
+        self.__gl_module__ = gl # keep so there's no error after module teardown
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Reset hit, miss and eviction counts."""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def set_budget_bytes(self, budget_bytes):
+        """Set the budget (None for no budget) and evict as needed."""
+        self.budget_bytes = budget_bytes
+        self._evict_to_budget()
+
+    def get_resident_bytes(self):
+        """Return the estimated bytes of texture memory in use."""
+        total = 0
+        for entry in self._entries.itervalues():
+            if entry.resident:
+                total += entry.num_bytes
+        return total
+
+    def get_pinned_bytes(self):
+        """Return the estimated bytes of resident pinned textures."""
+        total = 0
+        for entry in self._entries.itervalues():
+            if entry.resident and entry.pinned:
+                total += entry.num_bytes
+        return total
+
+    def get_stats(self):
+        """Return a dictionary describing the managed textures.
+
+        saved_bytes is the estimated memory the resident textures
+        would additionally use if padded to a power of 2 size."""
+        num_resident = 0
+        num_in_use = 0
+        saved_bytes = 0
+        for entry in self._entries.itervalues():
+            if entry.resident:
+                num_resident += 1
+                saved_bytes += entry.saved_bytes
+            if entry.refcount > 0:
+                num_in_use += 1
+        return {'resident_bytes':self.get_resident_bytes(),
+                'saved_bytes':saved_bytes,
+                'budget_bytes':self.budget_bytes,
+                'num_textures':len(self._entries),
+                'num_resident':num_resident,
+                'num_in_use':num_in_use,
+                'hits':self.hits,
+                'misses':self.misses,
+                'evictions':self.evictions,
+                'num_display_lists':self.num_display_lists}
+
+    def gen_display_lists(self, num=1):
+        """Allocate num OpenGL display lists and return the first."""
+        base = self.__gl_module__.glGenLists(num)
+        if base:
+            self.num_display_lists += num
+        return base
+
+    def delete_display_lists(self, base, num=1):
+        """Free display lists allocated with gen_display_lists().
+
+        Does nothing if base is None or 0, or if the lists cannot be
+        deleted because OpenGL was already shut down."""
+        if not base:
+            return
+        try:
+            self.__gl_module__.glDeleteLists(base, num)
+        except Exception:
+            return # OpenGL context or module already gone
+        self.num_display_lists -= num
+
+    def _call_when_collected(self, owner, func):
+        """Call func() once owner has been garbage collected.
+
+        A weak reference is used rather than a __del__ method, which
+        would keep owner from ever being collected if it is part of a
+        reference cycle.  func must not refer to owner."""
+        def callback(ref):
+            del self._collect_refs[id(ref)]
+            try:
+                func()
+            except Exception:
+                pass # OpenGL or modules already gone at interpreter exit
+        ref = weakref.ref(owner,callback)
+        self._collect_refs[id(ref)] = ref
+
+    def hold(self, owner):
+        """Return a list whose handles are released when owner is collected.
+
+        Append the handles returned by acquire() for owner to the
+        list.  Handles removed from it must be released with
+        release()."""
+        handles = []
+        def release_handles():
+            for entry in handles:
+                self.release(entry)
+            del handles[:]
+        self._call_when_collected(owner,release_handles)
+        return handles
+
+    def delete_when_collected(self, owner, display_lists=(), texture_ids=()):
+        """Free OpenGL objects once owner has been garbage collected.
+
+        display_lists are bases returned by gen_display_lists() (of
+        one list each), texture_ids are from glGenTextures()."""
+        gl_module = self.__gl_module__
+        display_lists = tuple(display_lists)
+        texture_ids = tuple(texture_ids)
+        def delete():
+            for base in display_lists:
+                self.delete_display_lists(base)
+            if texture_ids:
+                gl_module.glDeleteTextures(list(texture_ids))
+        self._call_when_collected(owner,delete)
+
+    def _get_key(self, texture, internal_format, build_mipmaps, shrink_texture_ok,
+                 num_pixel_buffers):
+        filename = getattr(texture,'_filename',None)
+        if filename is not None and type(texture) is Texture:
+            try:
+                source = ('file',os.path.abspath(filename),os.path.getmtime(filename))
+            except OSError:
+                source = ('id',id(texture))
+        else:
+            source = ('id',id(texture))
+        return (source, internal_format, build_mipmaps, shrink_texture_ok,
+                num_pixel_buffers)
+
+    def acquire(self, texture, internal_format=gl.GL_RGB, build_mipmaps=True,
+                shrink_texture_ok=False, pinned=False, num_pixel_buffers=0):
+        """Get a loaded texture object for texture, sharing if possible.
+
+        Returns a handle, whose texture_object attribute is the
+        TextureObject.  Call use() with it before each time it is
+        drawn, and release() when done with it.  A new TextureObject
+        streams put_sub_image() data through num_pixel_buffers pixel
+        buffer objects (see TextureObject.set_num_pixel_buffers())."""
+        key = self._get_key(texture,internal_format,build_mipmaps,shrink_texture_ok,
+                            num_pixel_buffers)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _TextureEntry()
+            entry.key = key
+            entry.texture = texture
+            entry.texture_object = TextureObject(dimensions=2)
+            if num_pixel_buffers:
+                entry.texture_object.set_num_pixel_buffers(num_pixel_buffers)
+            entry.internal_format = internal_format
+            entry.build_mipmaps = build_mipmaps
+            entry.shrink_texture_ok = shrink_texture_ok
+            entry.pinned = pinned
+            entry.refcount = 0
+            entry.resident = False
+            entry.num_bytes = 0
+            entry.saved_bytes = 0
+            entry.num_levels = 0
+            entry.last_used = 0
+            entry.last_used_frame = None
+            self._entries[key] = entry
+        elif pinned:
+            entry.pinned = True
+        entry.refcount += 1
+        self.use(entry,drawing=False)
+        if entry.texture is not texture:
+            # Identical source: share what loading found.
+            source = entry.texture
+            for name in ('size','buf_lf','buf_rf','buf_bf','buf_tf',
+                         '_buf_l','_buf_r','_buf_b','_buf_t'):
+                setattr(texture,name,getattr(source,name))
+            texture.texture_object = entry.texture_object
+        return entry
+
+    def release(self, entry):
+        """Declare a handle returned by acquire() no longer used."""
+        entry.refcount -= 1
+        if entry.refcount <= 0:
+            entry.pinned = False # nobody needs it kept anymore
+        if entry.refcount <= 0 and not (self.budget_bytes is not None and entry.resident):
+            # Without a budget, free it now.  Otherwise keep it
+            # until evicted, in case it is used again.
+            self._remove(entry)
+
+    def use(self, entry, drawing=True):
+        """Make sure a texture is loaded, before drawing it."""
+        self._use_count += 1
+        entry.last_used = self._use_count
+        if drawing:
+            entry.last_used_frame = VisionEgg.config._FRAMECOUNT_ABSOLUTE
+        if entry.resident:
+            self.hits += 1
+            return
+        self.misses += 1
+        self._load(entry)
+        if self.budget_bytes is not None:
+            self._evict_to_budget(entry)
+
+    def _load(self, entry):
+        texture = entry.texture
+        texture_object = entry.texture_object
+        if not entry.shrink_texture_ok:
+            # send texture to OpenGL
+            texture.load( texture_object,
+                          internal_format = entry.internal_format,
+                          build_mipmaps = entry.build_mipmaps )
+        else:
+            max_dim = gl.glGetIntegerv( gl.GL_MAX_TEXTURE_SIZE )
+            resized = 0
+            while max(texture.size) > max_dim:
+                texture.make_half_size()
+                resized = 1
+            loaded_ok = 0
+            while not loaded_ok:
+                try:
+                    # send texture to OpenGL
+                    texture.load( texture_object,
+                                  internal_format = entry.internal_format,
+                                  build_mipmaps = entry.build_mipmaps )
+                except TextureTooLargeError:
+                    texture.make_half_size()
+                    resized = 1
+                else:
+                    loaded_ok = 1
+            if resized:
+                logger = logging.getLogger('VisionEgg.Textures')
+                logger.warning("Resized texture %s to %d x %d"%(
+                    str(texture),texture.size[0],texture.size[1]))
+
+        # Estimate the memory used from what OpenGL allocated.
+        target = texture_object.target
+        gl.glBindTexture(target, texture_object.gl_id)
+        width = gl.glGetTexLevelParameteriv(target, 0, gl.GL_TEXTURE_WIDTH)
+        height = gl.glGetTexLevelParameteriv(target, 0, gl.GL_TEXTURE_HEIGHT)
+        bits = 0
+        for component in (gl.GL_TEXTURE_RED_SIZE, gl.GL_TEXTURE_GREEN_SIZE,
+                          gl.GL_TEXTURE_BLUE_SIZE, gl.GL_TEXTURE_ALPHA_SIZE,
+                          gl.GL_TEXTURE_LUMINANCE_SIZE, gl.GL_TEXTURE_INTENSITY_SIZE):
+            bits += gl.glGetTexLevelParameteriv(target, 0, component)
+        bytes_per_texel = max(1,(bits+7)//8)
+        num_texels, num_levels = self._count_texels(width, height,
+                                                    entry.build_mipmaps)
+        entry.num_bytes = num_texels*bytes_per_texel
+        entry.num_levels = num_levels
+        # Compare with the storage of a power of 2 size texture.
+        padded_texels = self._count_texels(next_power_of_2(width),
+                                           next_power_of_2(height),
+                                           entry.build_mipmaps)[0]
+        entry.saved_bytes = (padded_texels-num_texels)*bytes_per_texel
+        if entry.saved_bytes:
+            logger = logging.getLogger('VisionEgg.Textures')
+            logger.debug("Texture %s stored at %d x %d, saving %d bytes "
+                         "of padding."%(str(texture),width,height,
+                                        entry.saved_bytes))
+        entry.resident = True
+
+    def _count_texels(self, width, height, build_mipmaps):
+        """Return the number of texels and levels of a texture."""
+        num_texels = 0
+        num_levels = 0
+        while 1:
+            num_texels += width*height
+            num_levels += 1
+            if not build_mipmaps or (width <= 1 and height <= 1):
+                break
+            width = max(1,width//2)
+            height = max(1,height//2)
+        return num_texels, num_levels
+
+    def _unload(self, entry):
+        if entry.resident:
+            entry.texture_object.release_storage(entry.num_levels)
+            entry.resident = False
+
+    def _remove(self, entry):
+        self._unload(entry)
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+        if entry.texture.texture_object is entry.texture_object:
+            entry.texture.unload()
+
+    def _evict_to_budget(self, keep=None):
+        if self.budget_bytes is None:
+            return
+        resident_bytes = self.get_resident_bytes()
+        if resident_bytes <= self.budget_bytes:
+            return
+        this_frame = VisionEgg.config._FRAMECOUNT_ABSOLUTE
+        candidates = []
+        for entry in self._entries.itervalues():
+            if (entry.resident and not entry.pinned and entry is not keep and
+                entry.last_used_frame != this_frame):
+                # unused textures first, then least recently used
+                candidates.append(((entry.refcount > 0, entry.last_used), entry))
+        candidates.sort()
+        for sort_key, entry in candidates:
+            if resident_bytes <= self.budget_bytes:
+                break
+            resident_bytes -= entry.num_bytes
+            self.evictions += 1
+            if entry.refcount > 0:
+                self._unload(entry)
+            else:
+                self._remove(entry)
+        if resident_bytes > self.budget_bytes and not self._gave_budget_warning:
+            logger = logging.getLogger('VisionEgg.Textures')
+            logger.warning("Textures in use need %d bytes, more than the "
+                           "texture memory budget of %d bytes."%(
+                resident_bytes,self.budget_bytes))
+            self._gave_budget_warning = True
+
+if VisionEgg.config.VISIONEGG_TEXTURE_MEMORY_MB > 0:
+    texture_manager = TextureManager(
+        int(VisionEgg.config.VISIONEGG_TEXTURE_MEMORY_MB*1024*1024))
+else:
+    texture_manager = TextureManager()
+
 ####################################################################
 #
 #        Stimulus - TextureStimulus
@@ -1133,6 +2816,8 @@ class TextureStimulusBaseClass(VisionEgg.Core.Stimulus):
     __slots__ = (
         'texture_object',
         '_using_texture',
+        '_texture_entry',
+        '_held_entries',
         )
 
     _mipmap_modes = [gl.GL_LINEAR_MIPMAP_LINEAR,gl.GL_LINEAR_MIPMAP_NEAREST,
@@ -1164,43 +2849,99 @@ class TextureStimulusBaseClass(VisionEgg.Core.Stimulus):
         if self.parameters.texture_wrap_t is None:
             self.parameters.texture_wrap_t = gl.GL_CLAMP_TO_EDGE
 
-        # Create an OpenGL texture object this instance "owns"
-        self.texture_object = TextureObject(dimensions=2)
-
+        # Get an OpenGL texture object (shared with other stimuli
+        # using the same texture) from the texture manager, released
+        # when this stimulus is garbage collected
+        self._texture_entry = None
+        self._held_entries = texture_manager.hold(self)
         self._reload_texture()
 
     def _reload_texture(self):
         """(Re)load texture to OpenGL"""
         p = self.parameters
+        cp = self.constant_parameters
+        old_entry = self._texture_entry
+        self._texture_entry = texture_manager.acquire(
+            p.texture,
+            internal_format = cp.internal_format,
+            build_mipmaps = cp.mipmaps_enabled,
+            shrink_texture_ok = cp.shrink_texture_ok,
+            num_pixel_buffers = getattr(cp,'num_pixel_buffers',0))
+        self._held_entries.append(self._texture_entry)
+        if old_entry is not None:
+            self._held_entries.remove(old_entry)
+            texture_manager.release(old_entry)
+        self.texture_object = self._texture_entry.texture_object
         self._using_texture = p.texture
 
-        if not self.constant_parameters.shrink_texture_ok:
-            # send texture to OpenGL
-            p.texture.load( self.texture_object,
-                            internal_format = self.constant_parameters.internal_format,
-                            build_mipmaps = self.constant_parameters.mipmaps_enabled )
+    def _use_texture(self):
+        """Make sure the texture is in OpenGL before drawing.
+
+        Returns True if the texture parameter was changed (and the
+        new texture loaded)."""
+        if self.parameters.texture != self._using_texture:
+            self._reload_texture()
+            return True
+        texture_manager.use(self._texture_entry)
+        return False
+
+mask_functions = ('gaussian','circle','raised_cosine','hann')
+
+def make_mask_texels(function, radius_parameter, num_samples, edge_fraction=0.2):
+    """Return the alpha values (0.0-1.0) of a Mask2D as an array.
+
+    See Mask2D for the meaning of the arguments.  The array has
+    shape (height,width), where (width,height) is num_samples.  All
+    functions but 'gaussian' are averaged over 4x4 samples per texel,
+    to anti-alias their edges.  The samples of a block of rows are
+    computed with one broadcasted numpy expression."""
+    if function not in mask_functions:
+        raise ValueError("Don't know about window function %s"%function)
+    width, height = int(num_samples[0]), int(num_samples[1])
+    radius = float(radius_parameter)
+    if function == 'gaussian':
+        oversamples = 1
+        offsets = numpy.zeros((1,)) # sampled at texel corners
+        center = 0.0
+    else:
+        oversamples = 4
+        offsets = (numpy.arange(oversamples)+0.5)/oversamples - 0.5
+        center = 0.5
+    # squared sample positions, oversamples per texel
+    x_squared = ((numpy.arange(width)-width//2+center)[:,numpy.newaxis] +
+                 offsets[numpy.newaxis,:]).ravel()**2
+    y_squared = ((numpy.arange(height)-height//2+center)[:,numpy.newaxis] +
+                 offsets[numpy.newaxis,:]).ravel()**2
+    data = numpy.empty((height,width),dtype=numpy.float64)
+    rows_per_block = max(1,(1<<20)//(width*oversamples**2))
+    for first_row in range(0,height,rows_per_block):
+        last_row = min(first_row+rows_per_block,height)
+        dist_squared = (y_squared[first_row*oversamples:last_row*oversamples,numpy.newaxis] +
+                        x_squared[numpy.newaxis,:])
+        if function == 'gaussian':
+            values = numpy.exp( -dist_squared / (2.0*radius**2) )
+        elif function == 'circle':
+            values = dist_squared <= radius**2
         else:
-            max_dim = gl.glGetIntegerv( gl.GL_MAX_TEXTURE_SIZE )
-            resized = 0
-            while max(p.texture.size) > max_dim:
-                p.texture.make_half_size()
-                resized = 1
-            loaded_ok = 0
-            while not loaded_ok:
-                try:
-                    # send texture to OpenGL
-                    p.texture.load( self.texture_object,
-                                    internal_format = self.constant_parameters.internal_format,
-                                    build_mipmaps = self.constant_parameters.mipmaps_enabled )
-                except TextureTooLargeError:
-                    p.texture.make_half_size()
-                    resized = 1
-                else:
-                    loaded_ok = 1
-            if resized:
-                logger = logging.getLogger('VisionEgg.Textures')
-                logger.warning("Resized texture in %s to %d x %d"%(
-                    str(self),p.texture.size[0],p.texture.size[1]))
+            if function == 'hann':
+                flat_radius = 0.0
+            else:
+                flat_radius = radius*(1.0-edge_fraction)
+            edge = numpy.clip((numpy.sqrt(dist_squared)-flat_radius)/
+                              max(radius-flat_radius,1e-10),0.0,1.0)
+            values = 0.5 + 0.5*numpy.cos(numpy.pi*edge)
+        if oversamples > 1:
+            # average the oversamples x oversamples samples of each texel
+            num_rows = last_row-first_row
+            values = numpy.sum(values.reshape(num_rows,oversamples,width*oversamples),
+                               axis=1,dtype=numpy.float64)
+            values = numpy.sum(values.reshape(num_rows,width,oversamples),axis=2)
+            values /= oversamples**2
+        data[first_row:last_row] = values
+    return data
+
+# Mask texture objects, shared by the Mask2D instances using them
+_mask_texture_objects = weakref.WeakValueDictionary()
 
 class Mask2D(VisionEgg.ClassWithParameters):
     """A mask for windowing a portion of a texture.
@@ -1208,27 +2949,40 @@ class Mask2D(VisionEgg.ClassWithParameters):
     Thanks to the author, Jon Peirce, of the AlphaStim class from the
     PsychoPy package from which the idea to do this came.
 
+    The window functions are 'gaussian' (with sigma
+    radius_parameter), 'circle' (with radius radius_parameter),
+    'hann' (a cosine falling from 1 at the center to 0 at
+    radius_parameter) and 'raised_cosine' (1 up to
+    (1-edge_fraction)*radius_parameter, then a cosine falling to 0 at
+    radius_parameter).  Masks with the same function and parameters
+    share one texture object, which is made only once.
+
     Constant Parameters
     ===================
-    function         -- 'gaussian' or 'circle' (String)
+    edge_fraction    -- fraction of radius over which raised_cosine falls to 0 (Real)
+                        Default: 0.2
+    function         -- 'gaussian', 'circle', 'raised_cosine' or 'hann' (String)
                         Default: gaussian
     num_samples      -- size of mask texture data (units: number of texels) (Sequence2 of Real)
                         Default: (256, 256)
-    radius_parameter -- radius for circle, sigma for gaussian (Real)
+    radius_parameter -- radius for circle, hann and raised_cosine, sigma for gaussian (Real)
                         Default: 25.0
     """
 
     # All of these parameters are constant -- if you need a new mask, create a new instance
     constant_parameters_and_defaults = {
-        'function':('gaussian', # can be 'gaussian' or 'circle'
+        'function':('gaussian', # can be 'gaussian', 'circle', 'raised_cosine' or 'hann'
                     ve_types.String,
-                    "'gaussian' or 'circle'"),
+                    "'gaussian', 'circle', 'raised_cosine' or 'hann'"),
         'radius_parameter':(25.0, # radius for circle, sigma for gaussian, same units as num_samples
                             ve_types.Real,
-                            "radius for circle, sigma for gaussian"),
+                            "radius for circle, hann and raised_cosine, sigma for gaussian"),
         'num_samples':((256,256), # size of mask data in texels
                        ve_types.Sequence2(ve_types.Real),
                        "size of mask texture data (units: number of texels)"),
+        'edge_fraction':(0.2,
+                         ve_types.Real,
+                         "fraction of radius over which raised_cosine falls to 0"),
         }
     def __init__(self,**kw):
         VisionEgg.ClassWithParameters.__init__(self,**kw)
@@ -1239,44 +2993,29 @@ class Mask2D(VisionEgg.ClassWithParameters):
             raise RuntimeError("Mask must have width num_samples power of 2")
         if height != next_power_of_2(height):
             raise RuntimeError("Mask must have height num_samples power of 2")
+        if cp.function not in mask_functions:
+            raise RuntimeError("Don't know about window function %s"%self.constant_parameters.function)
 
-        gl.glActiveTextureARB(gl.GL_TEXTURE1_ARB) # Need PyOpenGL >= 2.0
-        self.texture_object = TextureObject(dimensions=2)
-
-        if cp.function == "gaussian":
-            xx = numpyNumeric.outerproduct(numpyNumeric.ones((1,cp.num_samples[1])),
-                                      numpyNumeric.arange(0,cp.num_samples[0],1.0)-cp.num_samples[0]/2)
-            yy = numpyNumeric.outerproduct(numpyNumeric.arange(0,cp.num_samples[1],1.0)-cp.num_samples[1]/2,
-                                      numpyNumeric.ones((1,cp.num_samples[0])))
-            dist_from_center = numpyNumeric.sqrt(xx**2 + yy**2)
-            sigma = cp.radius_parameter
-            data = numpyNumeric.exp( -dist_from_center**2.0 / (2.0*sigma**2.0) )
-        elif cp.function == "circle":
-            data = numpyNumeric.zeros(cp.num_samples,numpyNumeric.Float)
-            # perform anti-aliasing in circle computation by computing
-            # at several slightly different locations and averaging
-            oversamples = 4
-            x_offsets = numpyNumeric.arange(0.0,1.0,1.0/oversamples)
-            x_offsets = x_offsets - MLab.mean(x_offsets)
-            y_offsets = x_offsets
-            for x_offset in x_offsets:
-                for y_offset in y_offsets:
-                    xx = numpyNumeric.outerproduct(numpyNumeric.ones((1,cp.num_samples[1])),
-                                              numpyNumeric.arange(0,cp.num_samples[0],1.0)-cp.num_samples[0]/2+0.5)+x_offset
-                    yy = numpyNumeric.outerproduct(numpyNumeric.arange(0,cp.num_samples[1],1.0)-cp.num_samples[1]/2+0.5,
-                                              numpyNumeric.ones((1,cp.num_samples[0])))+y_offset
-                    dist_from_center = numpyNumeric.sqrt(xx**2 + yy**2)
-                    data += dist_from_center <= cp.radius_parameter
-            data = data / float( len(x_offsets)*len(y_offsets) )
+        if cp.function == 'raised_cosine':
+            edge_fraction = float(cp.edge_fraction)
         else:
-            raise RuntimeError("Don't know about window function %s"%self.constant_parameters.function)
+            edge_fraction = None # not used
+        key = (cp.function, float(cp.radius_parameter),
+               (int(width),int(height)), edge_fraction)
 
-        self.texture_object.put_new_image(data,
-                                          data_format=gl.GL_ALPHA,
-                                          internal_format=gl.GL_ALPHA)
-        self.texture_object.set_min_filter(gl.GL_LINEAR) # turn off mipmaps for mask
-        self.texture_object.set_wrap_mode_s(gl.GL_CLAMP_TO_EDGE)
-        self.texture_object.set_wrap_mode_t(gl.GL_CLAMP_TO_EDGE)
+        gl.glActiveTextureARB(gl.GL_TEXTURE1_ARB) # Need PyOpenGL >= 2.0
+        self.texture_object = _mask_texture_objects.get(key)
+        if self.texture_object is None:
+            self.texture_object = TextureObject(dimensions=2)
+            data = make_mask_texels(cp.function, cp.radius_parameter,
+                                    cp.num_samples, cp.edge_fraction)
+            self.texture_object.put_new_image(data,
+                                              data_format=gl.GL_ALPHA,
+                                              internal_format=gl.GL_ALPHA)
+            self.texture_object.set_min_filter(gl.GL_LINEAR) # turn off mipmaps for mask
+            self.texture_object.set_wrap_mode_s(gl.GL_CLAMP_TO_EDGE)
+            self.texture_object.set_wrap_mode_t(gl.GL_CLAMP_TO_EDGE)
+            _mask_texture_objects[key] = self.texture_object
         gl.glTexEnvi(gl.GL_TEXTURE_ENV, gl.GL_TEXTURE_ENV_MODE, gl.GL_MODULATE)
 
         # reset active texture unit to 0
@@ -1371,10 +3110,15 @@ class TextureStimulus(TextureStimulusBaseClass):
     Constant Parameters
     ===================
     internal_format   -- format with which OpenGL uses texture data (OpenGL data type enum) (Integer)
+                         Inherited from TextureStimulusBaseClass
                          Default: GL_RGB (6407)
     mipmaps_enabled   -- Are mipmaps enabled? (Boolean)
+                         Inherited from TextureStimulusBaseClass
                          Default: True
+    num_pixel_buffers -- number of pixel buffer objects to stream texture updates through (0: update directly) (UnsignedInteger)
+                         Default: 0
     shrink_texture_ok -- Allow automatic shrinking of texture if too big? (Boolean)
+                         Inherited from TextureStimulusBaseClass
                          Default: False
     """
 
@@ -1415,10 +3159,15 @@ class TextureStimulus(TextureStimulusBaseClass):
                       "perform depth test?"),
         }
 
+    constant_parameters_and_defaults = {
+        'num_pixel_buffers':(0,
+                             ve_types.UnsignedInteger,
+                             "number of pixel buffer objects to stream texture updates through (0: update directly)"),
+        }
+
     def draw(self):
         p = self.parameters
-        if p.texture != self._using_texture: # self._using_texture is from TextureStimulusBaseClass
-            self._reload_texture()
+        self._use_texture() # from TextureStimulusBaseClass
         if p.lowerleft != None:
             if not hasattr(VisionEgg.config,"_GAVE_LOWERLEFT_DEPRECATION"):
                 logger = logging.getLogger('VisionEgg.Textures')
@@ -1508,6 +3257,178 @@ class TextureStimulus(TextureStimulusBaseClass):
             finally:
                 gl.glPopMatrix()
 
+class ImageSequenceStimulus(TextureStimulus):
+    """A sequence of images, all loaded to OpenGL in advance.
+
+    Each texture in the textures constant parameter is loaded into
+    its own OpenGL texture object when the stimulus is created.  The
+    frame_index parameter selects the one drawn, so changing the
+    image only binds another texture object and sends no texel data
+    to OpenGL.  This is meant for rapid serial visual presentation,
+    where the image may change on every frame.
+
+    All textures must have the same size.  Their texture objects are
+    pinned in the texture manager, so they are never evicted.  If a
+    texture memory budget is set (see TextureManager) and the
+    sequence does not fit in what the other pinned textures leave of
+    it, TextureTooLargeError is raised.  The texture parameter is set
+    to the Texture of the current image.
+
+    Parameters
+    ==========
+    anchor             -- specifies how position parameter is interpreted (String)
+                          Inherited from TextureStimulus
+                          Default: lowerleft
+    angle              -- units: degrees, 0=right, 90=up (Real)
+                          Inherited from TextureStimulus
+                          Default: 0.0
+    color              -- texture environment color. alpha ignored (if given) for max_alpha parameter (AnyOf(Sequence3 of Real or Sequence4 of Real))
+                          Inherited from TextureStimulus
+                          Default: (1.0, 1.0, 1.0)
+    depth_test         -- perform depth test? (Boolean)
+                          Inherited from TextureStimulus
+                          Default: False
+    frame_index        -- index into textures of the image drawn (UnsignedInteger)
+                          Default: 0
+    mask               -- optional masking function (Instance of <class 'VisionEgg.Textures.Mask2D'>)
+                          Inherited from TextureStimulus
+                          Default: (determined at runtime)
+    max_alpha          -- controls opacity. 1.0=copletely opaque, 0.0=completely transparent (Real)
+                          Inherited from TextureStimulus
+                          Default: 1.0
+    on                 -- draw stimulus? (Boolean)
+                          Inherited from TextureStimulus
+                          Default: True
+    position           -- units: eye coordinates (AnyOf(Sequence2 of Real or Sequence3 of Real or Sequence4 of Real))
+                          Inherited from TextureStimulus
+                          Default: (0.0, 0.0)
+    size               -- defaults to texture data size (units: eye coordinates) (Sequence2 of Real)
+                          Inherited from TextureStimulus
+                          Default: (determined at runtime)
+    texture            -- source of texture data (Instance of <class 'VisionEgg.Textures.Texture'>)
+                          Inherited from TextureStimulusBaseClass
+                          Default: (determined at runtime)
+    texture_mag_filter -- OpenGL filter enum (Integer)
+                          Inherited from TextureStimulusBaseClass
+                          Default: GL_LINEAR (9729)
+    texture_min_filter -- OpenGL filter enum (Integer)
+                          Inherited from TextureStimulusBaseClass
+                          Default: (GL enum determined at runtime)
+    texture_wrap_s     -- OpenGL texture wrap enum (Integer)
+                          Inherited from TextureStimulusBaseClass
+                          Default: (GL enum determined at runtime)
+    texture_wrap_t     -- OpenGL texture wrap enum (Integer)
+                          Inherited from TextureStimulusBaseClass
+                          Default: (GL enum determined at runtime)
+
+    Constant Parameters
+    ===================
+    internal_format   -- format with which OpenGL uses texture data (OpenGL data type enum) (Integer)
+                         Inherited from TextureStimulusBaseClass
+                         Default: GL_RGB (6407)
+    mipmaps_enabled   -- Are mipmaps enabled? (Boolean)
+                         Inherited from TextureStimulusBaseClass
+                         Default: True
+    num_pixel_buffers -- number of pixel buffer objects to stream texture updates through (0: update directly) (UnsignedInteger)
+                         Inherited from TextureStimulus
+                         Default: 0
+    shrink_texture_ok -- Allow automatic shrinking of texture if too big? (Boolean)
+                         Inherited from TextureStimulusBaseClass
+                         Default: False
+    textures          -- images of the sequence (Sequence of Instance of <class 'VisionEgg.Textures.Texture'>)
+                         Default: (determined at runtime)
+    """
+
+    parameters_and_defaults = {
+        'frame_index':(0,
+                       ve_types.UnsignedInteger,
+                       "index into textures of the image drawn"),
+        }
+
+    constant_parameters_and_defaults = {
+        'textures':(None,
+                    ve_types.Sequence(ve_types.Instance(Texture)),
+                    "images of the sequence"),
+        }
+
+    __slots__ = (
+        '_texture_entries',
+        '_frame_index',
+        )
+
+    def __init__(self,**kw):
+        self._texture_entries = None
+        self._frame_index = None
+        TextureStimulus.__init__(self,**kw)
+
+    def _reload_texture(self):
+        """Load all textures to OpenGL"""
+        cp = self.constant_parameters
+        textures = cp.textures
+        if not textures:
+            raise ValueError("ImageSequenceStimulus needs at least one texture.")
+        size = tuple(textures[0].size)
+        for texture in textures:
+            if tuple(texture.size) != size:
+                raise ValueError("All textures of an ImageSequenceStimulus "
+                                 "must have the same size.")
+        num_distinct = len(dict([(id(texture),None) for texture in textures]))
+
+        entries = []
+        try:
+            for texture in textures:
+                entry = texture_manager.acquire(
+                    texture,
+                    internal_format = cp.internal_format,
+                    build_mipmaps = cp.mipmaps_enabled,
+                    shrink_texture_ok = cp.shrink_texture_ok,
+                    pinned = True,
+                    num_pixel_buffers = cp.num_pixel_buffers)
+                entries.append(entry)
+                if len(entries) == 1 and texture_manager.budget_bytes is not None:
+                    # All images have the same size, so the first
+                    # tells how much memory the sequence needs.
+                    needed = entry.num_bytes*num_distinct
+                    available = (texture_manager.budget_bytes -
+                                 texture_manager.get_pinned_bytes() +
+                                 entry.num_bytes)
+                    if needed > available:
+                        raise TextureTooLargeError(
+                            "Image sequence needs %d bytes of texture memory, "
+                            "only %d bytes of the budget are available."%(
+                            needed,available))
+        except:
+            for entry in entries:
+                texture_manager.release(entry)
+            raise
+        self._held_entries.extend(entries)
+        if self._texture_entries is not None:
+            for entry in self._texture_entries:
+                self._held_entries.remove(entry)
+                texture_manager.release(entry)
+        self._texture_entries = entries
+        self._frame_index = None
+        self._use_texture()
+
+    def _use_texture(self):
+        """Bind the texture object of the image selected by frame_index.
+
+        Returns True if the image was changed."""
+        index = self.parameters.frame_index
+        changed = index != self._frame_index
+        if changed:
+            if not (0 <= index < len(self._texture_entries)):
+                raise IndexError("frame_index %d out of range, sequence "
+                                 "has %d images."%(index,len(self._texture_entries)))
+            entry = self._texture_entries[index]
+            self._texture_entry = entry
+            self.texture_object = entry.texture_object
+            self.parameters.texture = entry.texture
+            self._using_texture = entry.texture
+            self._frame_index = index
+        texture_manager.use(self._texture_entry)
+        return changed
+
 class TextureStimulus3D(TextureStimulusBaseClass):
     """A textured rectangle placed arbitrarily in 3 space.
 
@@ -1576,8 +3497,7 @@ class TextureStimulus3D(TextureStimulusBaseClass):
 
     def draw(self):
         p = self.parameters
-        if p.texture != self._using_texture: # self._using_texture is from TextureStimulusBaseClass
-            self._reload_texture()
+        self._use_texture() # from TextureStimulusBaseClass
         if p.on:
             if p.depth_test:
                 gl.glEnable(gl.GL_DEPTH_TEST)
@@ -1741,16 +3661,18 @@ class SpinningDrum(TextureStimulusBaseClass):
 
     def __init__(self,**kw):
         TextureStimulusBaseClass.__init__(self,**kw)
-        self.cached_display_list_normal = gl.glGenLists(1) # Allocate a new display list
-        self.cached_display_list_mirror = gl.glGenLists(1) # Allocate a new display list
+        self.cached_display_list_normal = texture_manager.gen_display_lists(1) # Allocate a new display list
+        self.cached_display_list_mirror = texture_manager.gen_display_lists(1) # Allocate a new display list
+        texture_manager.delete_when_collected(self,
+                                              display_lists=(self.cached_display_list_normal,
+                                                             self.cached_display_list_mirror))
         self.rebuild_display_list()
 
     def draw(self):
     	"""Redraw the stimulus on every frame.
         """
         p = self.parameters
-        if p.texture != self._using_texture: # self._using_texture is from TextureStimulusBaseClass
-            self._reload_texture()
+        if self._use_texture(): # from TextureStimulusBaseClass
             self.rebuild_display_list()
         if p.on:
             # Set OpenGL state variables
@@ -66,6 +66,12 @@ if not hasattr(sys,'frozen'):
 ############# Get config defaults #############
 config = VisionEgg.Configuration.Config()
 
+# PyOpenGL chooses its platform (GLX, EGL, OSMesa...) when first
+# imported, so this must happen before VisionEgg.GL is imported.
+if config.VISIONEGG_OFFSCREEN_BACKEND.lower() != 'none':
+    os.environ.setdefault('PYOPENGL_PLATFORM',
+                          config.VISIONEGG_OFFSCREEN_BACKEND.lower())
+
 ############# Logging #############
 
 logger = logging.getLogger('VisionEgg')
@@ -201,26 +207,119 @@ def recursive_base_class_finder(klass):
 
 ############# Setup timing functions #############
 
-if sys.platform == "win32":
-    # on win32, time.clock() theoretically has better resolution than time.time()
-    true_time_func = time.clock
+def _make_monotonic_time_func():
+    """Return a high resolution clock that never runs backwards.
+
+    Unlike time.time(), the returned function is not slewed or stepped
+    when the system clock is adjusted (e.g. by NTP), so differences
+    between two readings are true elapsed durations.  The origin is
+    arbitrary.  Returns None if no such clock could be found."""
+    if sys.platform == "win32":
+        # on win32, time.clock() uses QueryPerformanceCounter()
+        return time.clock
+    import ctypes, ctypes.util
+    if sys.platform == "darwin":
+        libc = ctypes.PyDLL(ctypes.util.find_library('c'))
+        class _mach_timebase_info(ctypes.Structure):
+            _fields_ = [('numer', ctypes.c_uint32),
+                        ('denom', ctypes.c_uint32)]
+        timebase = _mach_timebase_info()
+        libc.mach_timebase_info(ctypes.byref(timebase))
+        mach_absolute_time = libc.mach_absolute_time
+        mach_absolute_time.restype = ctypes.c_uint64
+        scale = timebase.numer / float(timebase.denom) * 1e-9
+        def monotonic_time_func():
+            return mach_absolute_time()*scale
+        return monotonic_time_func
+    if not sys.platform.startswith('linux'):
+        # The value of CLOCK_MONOTONIC differs between the BSDs and
+        # other systems, so only use the Linux value on Linux.
+        return None
+    class _timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long),
+                    ('tv_nsec', ctypes.c_long)]
+    for libname in ('rt','c'):
+        path = ctypes.util.find_library(libname)
+        if path is None:
+            continue
+        # PyDLL keeps the GIL during the call, so the single timespec
+        # below cannot be overwritten by another thread.
+        lib = ctypes.PyDLL(path)
+        if hasattr(lib,'clock_gettime'):
+            break
+    else:
+        return None
+    clock_gettime = lib.clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+    CLOCK_MONOTONIC = 1 # from Linux <time.h>
+    timespec = _timespec()
+    timespec_ref = ctypes.byref(timespec)
+    if clock_gettime(CLOCK_MONOTONIC,timespec_ref) != 0:
+        return None
+    def monotonic_time_func():
+        clock_gettime(CLOCK_MONOTONIC,timespec_ref)
+        return timespec.tv_sec + timespec.tv_nsec*1e-9
+    return monotonic_time_func
+
+wall_time_func = time.time # follows the system clock, including adjustments
+
+def _offset_to_epoch(clock):
+    """Return clock shifted to read seconds since the epoch at startup.
+
+    The offset is measured once, so the returned clock keeps running
+    at the rate of clock, but its readings are comparable with
+    time.time() (and with times saved by earlier versions)."""
+    offset = time.time() - clock()
+    def epoch_clock():
+        return clock() + offset
+    return epoch_clock
+
+try:
+    monotonic_time_func = _make_monotonic_time_func()
+except (OSError, AttributeError):
+    monotonic_time_func = None
+if monotonic_time_func is None:
+    monotonic_time_func = wall_time_func
+else:
+    monotonic_time_func = _offset_to_epoch(monotonic_time_func)
+
+if config.VISIONEGG_TIME_SOURCE.lower() == 'wall':
+    true_time_func = wall_time_func
+elif config.VISIONEGG_TIME_SOURCE.lower() == 'monotonic':
+    true_time_func = monotonic_time_func
 else:
-    true_time_func = time.time
-    # XXX Possible To-Do:
-    #  On MacOSX use AudioGetCurrentHostTime() and
-    #  AudioConvertHostTimeToNanos() #
+    raise ValueError("VISIONEGG_TIME_SOURCE must be 'monotonic' or 'wall', "
+                     "not '%s'"%config.VISIONEGG_TIME_SOURCE)
 
 config._FRAMECOUNT_ABSOLUTE = 0 # initialize global variable
 def time_func_locked_to_frames():
     return config._FRAMECOUNT_ABSOLUTE / float(config.VISIONEGG_MONITOR_REFRESH_HZ)
 
 time_func = true_time_func # name of time function Vision Egg programs should use
+_time_func_locked = False
+
+def set_true_time_func(func):
+    """Use func (no arguments, returns seconds) as the source of true time.
+
+    Any zero-argument function returning a float number of seconds
+    may be used, for example monotonic_time_func (the default),
+    wall_time_func or a hardware clock shared with data acquisition.
+    Only differences between two readings are used by the Vision Egg."""
+    global true_time_func, time_func
+    true_time_func = func
+    if not _time_func_locked:
+        time_func = true_time_func
 
 def set_time_func_to_true_time():
+    global time_func, _time_func_locked
     time_func = true_time_func
+    _time_func_locked = False
 
 def set_time_func_to_frame_locked():
+    """Make time_func advance exactly one refresh period per swap_buffers()"""
+    global time_func, _time_func_locked
     time_func = time_func_locked_to_frames
+    _time_func_locked = True
 
 def timing_func():
     """DEPRECATED.  Use time_func instead"""
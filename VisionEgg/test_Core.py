@@ -1,4 +1,5 @@
-from VisionEgg.Core import FrameTimer
+from VisionEgg.Core import FrameTimer, FrameTelemetry, StimulusProfiler, \
+     RefreshEstimator
 
 def test_FrameTimer():
     ft = FrameTimer()
@@ -6,3 +7,78 @@ def test_FrameTimer():
     ft.tick()
     result = ft.get_longest_frame_duration_sec()
 
+def test_FrameTelemetry_ring_buffer():
+    telemetry = FrameTelemetry(num_viewports=2, capacity=4)
+    for frame in range(6):
+        i = frame % telemetry.capacity
+        telemetry.frame[i] = frame
+        telemetry.start[i] = frame
+        telemetry.clear[i] = frame + 0.1
+        telemetry.controllers[i] = frame + 0.2
+        telemetry.viewports[i] = (frame + 0.3, frame + 0.5)
+        telemetry.swap[i] = frame + 0.8
+        telemetry.events[i] = frame + 0.9
+        telemetry.num_frames = frame + 1
+    assert len(telemetry) == 4
+    assert list(telemetry.get_records()['frame']) == [2,3,4,5]
+    durations = telemetry.get_durations()
+    assert abs(durations['viewports'][0,1] - 0.2) < 1e-9
+    assert abs(durations['swap'][0] - 0.3) < 1e-9
+    assert abs(durations['total'][0] - 0.9) < 1e-9
+
+def test_StimulusProfiler():
+    class FakeStimulus:
+        def draw(self):
+            pass
+    stimuli = [FakeStimulus(), FakeStimulus()]
+    profiler = StimulusProfiler()
+    for frame in range(5):
+        profiler.draw_stimuli(stimuli)
+    profiler.add_draw_time(stimuli[0], 0.002)
+    class_stats = profiler.get_class_stats()[FakeStimulus]
+    assert class_stats['count'] == 11
+    assert class_stats['max_sec'] == 0.002
+    assert class_stats['p99_sec'] <= class_stats['max_sec']
+    instance_counts = [s['count'] for s in profiler.get_instance_stats().values()]
+    instance_counts.sort()
+    assert instance_counts == [5,6]
+
+def test_RefreshEstimator():
+    estimator = RefreshEstimator(window=50)
+    period = 1/60.0
+    assert estimator.predict_swap_time(1.0) == 1.0 # nothing known yet
+    t0 = 1234.5678
+    count = 0
+    for i in range(200):
+        count += 1
+        if i in (20,120):
+            count += 2 # dropped frames
+        jitter = ((i*7919) % 11 - 5)*1e-5
+        estimator.add_swap_time(t0 + count*period*1.001 + jitter)
+    assert abs(estimator.period_sec - period*1.001) < 1e-6
+    assert estimator.num_missed_refreshes == 4
+    last = t0 + count*period*1.001
+    assert abs(estimator.phase_sec - last) < 1e-4
+    predicted = estimator.predict_swap_time(last + 0.3*period)
+    assert abs(predicted - (last + period*1.001)) < 1e-4
+    # a long pause keeps the period but restarts the fit
+    estimator.add_swap_time(last + 100.0)
+    assert abs(estimator.period_sec - period*1.001) < 1e-6
+    assert estimator.phase_sec == last + 100.0
+
+def test_set_time_func_to_frame_locked():
+    import VisionEgg
+    try:
+        VisionEgg.set_time_func_to_frame_locked()
+        assert VisionEgg.time_func is VisionEgg.time_func_locked_to_frames
+    finally:
+        VisionEgg.set_time_func_to_true_time()
+    assert VisionEgg.time_func is VisionEgg.true_time_func
+    start = VisionEgg.monotonic_time_func()
+    assert VisionEgg.monotonic_time_func() >= start
+
+def test_monotonic_time_func_epoch():
+    import time
+    import VisionEgg
+    # seconds since the epoch, like time.time(), in saved data
+    assert abs(VisionEgg.monotonic_time_func() - time.time()) < 1.0
@@ -0,0 +1,119 @@
+import numpy
+import VisionEgg
+import VisionEgg.Core
+import VisionEgg.ParameterTypes as ve_types
+from VisionEgg.FlowControl import KeyframeController, ExecStringController, \
+     FunctionController, BatchController, ControllerSchedule, FRAMES_SINCE_GO, \
+     TIME_SEC_SINCE_GO, TIME_SEC_ABSOLUTE, TIME_INDEPENDENT, Presentation
+
+def test_KeyframeController_linear():
+    kc = KeyframeController(keyframes=[(0.0,(0.0,0.0)),
+                                       (1.0,(10.0,5.0)),
+                                       (3.0,(10.0,-5.0))])
+    times = [-1.0,0.0,0.5,1.0,2.0,3.0,4.0]
+    values = []
+    for t in times:
+        kc.time_sec_since_go = t
+        values.append(kc.during_go_eval())
+    assert values[2] == (5.0,2.5)
+    assert values[4] == (10.0,0.0)
+    assert values[0] == (0.0,0.0) and values[-1] == (10.0,-5.0)
+    assert numpy.allclose(kc.evaluate_times(times),values)
+
+def test_KeyframeController_spline():
+    kc = KeyframeController(keyframes=[(0,0.0),(1,1.0),(2,0.0),(4,2.0)],
+                            interpolation='spline',
+                            temporal_variables=FRAMES_SINCE_GO)
+    frames = numpy.linspace(-1.0,5.0,25)
+    values = []
+    for f in frames[::-1]: # also exercise moving backwards
+        kc.frames_since_go = f
+        values.append(kc.during_go_eval())
+    values.reverse()
+    assert numpy.allclose(kc.evaluate_times(frames),values)
+    assert numpy.allclose(kc.evaluate_times([0,1,2,4]),[0.0,1.0,0.0,2.0])
+
+def test_ExecStringController_namespaces():
+    for restricted_namespace in (1,0):
+        ec = ExecStringController(during_go_exec_string="y = math.sin(t)\nx = y*2.0 + f",
+                                  between_go_exec_string="if t_abs > 1.0:\n    x = 1.0\nelse:\n    x = -1.0",
+                                  restricted_namespace=restricted_namespace,
+                                  temporal_variables=TIME_SEC_SINCE_GO|FRAMES_SINCE_GO|TIME_SEC_ABSOLUTE)
+        ec.time_sec_since_go = 0.0
+        ec.frames_since_go = 3
+        ec.time_sec_absolute = 2.0
+        assert ec.during_go_eval() == 3.0
+        assert ec.between_go_eval() == 1.0
+        ec.set_between_go_exec_string("x = t_abs")
+        assert ec.between_go_eval() == 2.0
+
+def test_ControllerSchedule_frame_divisor():
+    every_third = FunctionController(during_go_func=lambda f: f,
+                                     temporal_variables=FRAMES_SINCE_GO,
+                                     return_type=ve_types.Integer,
+                                     eval_frame_divisor=3,
+                                     eval_frame_phase=1)
+    every_frame = FunctionController(during_go_func=lambda f: f,
+                                     temporal_variables=FRAMES_SINCE_GO,
+                                     return_type=ve_types.Integer)
+    schedule = ControllerSchedule([(None,None,every_third),(None,None,every_frame)],
+                                  go_started=1,
+                                  doing_transition=0)
+    assert schedule.period == 3
+    due = [len(schedule.get_evaluate(frame)) for frame in range(7)]
+    assert due == [1,2,1,1,2,1,1]
+
+def test_BatchController():
+    spots = [VisionEgg.Core.FixationSpot() for i in range(3)]
+    bc = BatchController(targets=[(spot,'position') for spot in spots],
+                         during_go_func=lambda t: numpy.array([[0.0,t],[1.0,t],[2.0,t]]))
+    bc.time_sec_since_go = 5.0
+    assert bc.during_go_eval() is None
+    assert [spot.parameters.position for spot in spots] == [(0.0,5.0),(1.0,5.0),(2.0,5.0)]
+    try:
+        BatchController(targets=[(spot,'on') for spot in spots],
+                        during_go_func=lambda t: numpy.zeros((3,2)))
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("BatchController did not check parameter type")
+
+def test_Presentation_find_hidden_state():
+    spot = VisionEgg.Core.FixationSpot()
+    p = Presentation(go_duration=(10,'frames'))
+    p.add_controller(spot,'position',
+                     FunctionController(during_go_func=lambda t: (t,0.0)))
+    assert p.get_export_num_frames(12.0) == 10
+    assert p.find_hidden_state() == []
+    calls = []
+    def counter():
+        calls.append(None)
+        return len(calls) > 1
+    p.add_controller(spot,'on',
+                     FunctionController(during_go_func=counter,
+                                        temporal_variables=TIME_INDEPENDENT,
+                                        return_type=ve_types.Boolean))
+    problems = p.find_hidden_state()
+    assert len(problems) == 1
+    assert problems[0].startswith('FunctionController controlling on')
+
+def test_Presentation_replay_go():
+    spot = VisionEgg.Core.FixationSpot()
+    p = Presentation(override_t_abs_sec=1000.0)
+    seen = []
+    def record(t_abs, t, f):
+        seen.append((t_abs, t, f, VisionEgg.time_func()))
+        return (t, 0.0)
+    p.add_controller(spot,'position',
+                     FunctionController(during_go_func=lambda t_abs, t, f: record(t_abs, t, f),
+                                        temporal_variables=TIME_SEC_ABSOLUTE|TIME_SEC_SINCE_GO|FRAMES_SINCE_GO))
+    del seen[:] # add_controller() evaluates the controller
+    frame_times = [1000.0, 1000.5, 1001.5]
+    p.replay_go(frame_times, frame_numbers=[0, 1, 3])
+    # transition at go start, then one call per frame
+    assert seen[0] == (1000.0, 0.0, 0, 1000.0)
+    assert seen[1:] == [(1000.0, 0.0, 0, 1000.0),
+                        (1000.5, 0.5, 1, 1000.5),
+                        (1001.5, 1.5, 3, 1001.5)]
+    assert spot.parameters.position == (1.5, 0.0)
+    assert VisionEgg.time_func is VisionEgg.true_time_func
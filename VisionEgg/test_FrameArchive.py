@@ -0,0 +1,51 @@
+import os, tempfile
+import numpy
+from VisionEgg.FrameArchive import FrameArchiveWriter, FrameArchiveReader
+
+def make_frame(value):
+    return numpy.zeros((4,6,3),dtype=numpy.uint8) + value
+
+def test_FrameArchive_roundtrip_and_append():
+    fd, filename = tempfile.mkstemp(suffix='.vefa')
+    os.close(fd)
+    try:
+        writer = FrameArchiveWriter(filename, chunk_bytes=3*4*6*3)
+        for i in range(7):
+            writer.append(make_frame(i), {'time_sec':i*0.25,
+                                          'parameters':{'0.on':True}})
+        writer.close()
+
+        writer = FrameArchiveWriter(filename, mode='a')
+        for i in [2,0,1]: # out of order, as from several threads
+            writer.encode_frame(i, make_frame(10+i))
+        writer.close()
+
+        reader = FrameArchiveReader(filename)
+        assert len(reader) == 10
+        assert reader.shape == (4,6,3)
+        assert [int(frame[0,0,0]) for frame in reader] == [0,1,2,3,4,5,6,10,11,12]
+        assert reader[5][3,5,2] == 5
+        assert reader.get_timestamps()[6] == 1.5
+        assert numpy.isnan(reader.get_timestamps()[7])
+        assert reader.get_frame_info(3)['parameters'] == {'0.on':True}
+        assert reader.get_frame_info(8) is None
+        reader.close()
+    finally:
+        os.unlink(filename)
+
+def test_FrameArchive_rebuild_index():
+    fd, filename = tempfile.mkstemp(suffix='.vefa')
+    os.close(fd)
+    try:
+        writer = FrameArchiveWriter(filename)
+        for i in range(3):
+            writer.append(make_frame(i), {'time_sec':float(i)})
+        writer.flush()
+        writer.file.close() # as if the program crashed before close()
+        reader = FrameArchiveReader(filename)
+        assert len(reader) == 3
+        assert reader[2][0,0,0] == 2
+        assert list(reader.get_timestamps()) == [0.0,1.0,2.0]
+        reader.close()
+    finally:
+        os.unlink(filename)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""Display a sequence of images loaded into OpenGL in advance.
+
+All images are sent to OpenGL once, when the ImageSequenceStimulus is
+created.  Switching the image merely consists of setting the
+frame_index parameter, which selects the OpenGL texture object to
+draw.  This is faster than the methods demonstrated in the
+image_sequence_fast.py and image_sequence_slow.py demos, and fast
+enough to change the image every frame.
+
+All images must be the same size.
+"""
+
+from VisionEgg import *
+start_default_logging(); watch_exceptions()
+
+from VisionEgg.Core import *
+from VisionEgg.FlowControl import Presentation, FunctionController
+from VisionEgg.Textures import *
+
+import Image, ImageDraw
+
+import OpenGL.GL as gl
+
+num_images = 20
+duration_per_image = 0.1 # seconds
+
+image_size = (256,256)
+
+# Generate some images
+image_list = []
+for i in range(num_images):
+    image = Image.new("RGB",image_size,(0,0,255)) # Blue background
+    draw = ImageDraw.Draw(image)
+    line_x = image_size[0]/float(num_images) * i
+    draw.line((line_x, 0, line_x, image_size[1]), fill=(255,255,255))
+    image_list.append(image)
+
+screen = get_default_screen()
+
+# load all images into OpenGL
+stimulus = ImageSequenceStimulus(mipmaps_enabled=0,
+                                 textures=[Texture(image) for image in image_list],
+                                 size=image_size,
+                                 texture_min_filter=gl.GL_LINEAR,
+                                 position=(screen.size[0]/2.0,screen.size[1]/2.0),
+                                 anchor='center')
+
+viewport = Viewport(screen=screen,
+                    stimuli=[stimulus])
+
+p = Presentation(go_duration=(num_images*duration_per_image,'seconds'),viewports=[viewport])
+
+def get_frame_index(t):
+    return min(int(t/duration_per_image),num_images-1) # choose image
+p.add_controller(stimulus,'frame_index',FunctionController(during_go_func=get_frame_index))
+
+p.go()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""Measure the per-frame cost of capturing frames.
+
+Compares reading each frame with Screen.get_framebuffer_as_array()
+and encoding it before drawing the next frame, as export_movie_go()
+used to, with VisionEgg.Core.FramebufferCapture, which reads through
+pixel buffer objects and encodes in worker threads.  Uses an
+OffscreenScreen, so set VISIONEGG_OFFSCREEN_BACKEND (for example, to
+'egl') before running.
+"""
+
+import VisionEgg
+import VisionEgg.Core
+import VisionEgg.GL as gl
+import zlib
+
+def encode(frame_number, fb_array):
+    # stand-in for image file encoding (zlib releases the GIL)
+    zlib.compress(fb_array.tostring(),1)
+
+def draw_frames(screen, viewport, num_frames, capture_func):
+    start = VisionEgg.true_time_func()
+    for frame in xrange(num_frames):
+        screen.clear()
+        viewport.draw()
+        capture_func(frame)
+        VisionEgg.Core.swap_buffers()
+    return start
+
+def main():
+    size = (1280,720)
+    num_frames = 100
+    screen = VisionEgg.Core.OffscreenScreen(size=size)
+    spot = VisionEgg.Core.FixationSpot(position=(640,360),size=(100,100))
+    viewport = VisionEgg.Core.Viewport(screen=screen,stimuli=[spot])
+
+    def synchronous(frame):
+        encode(frame,screen.get_framebuffer_as_array(buffer='back',format=gl.GL_RGB))
+    start = draw_frames(screen,viewport,num_frames,synchronous)
+    synchronous_sec = (VisionEgg.true_time_func()-start)/num_frames
+
+    print "%d x %d pixels, %d frames"%(size[0],size[1],num_frames)
+    print "%30s %12s %12s"%("","msec/frame","waited msec")
+    print "%30s %12.2f %12s"%("get_framebuffer_as_array",synchronous_sec*1000.0,"")
+    for num_pixel_buffers in [0,2,3]:
+        capture = VisionEgg.Core.FramebufferCapture(screen,encode,
+                                                    num_pixel_buffers=num_pixel_buffers,
+                                                    num_workers=4)
+        start = draw_frames(screen,viewport,num_frames,capture.capture)
+        capture.close()
+        capture_sec = (VisionEgg.true_time_func()-start)/num_frames
+        print "%30s %12.2f %12.1f"%("FramebufferCapture (%d PBOs)"%num_pixel_buffers,
+                                    capture_sec*1000.0,capture.wait_sec*1000.0)
+    screen.close()
+
+if __name__ == '__main__':
+    main()
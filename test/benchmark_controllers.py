@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""Measure per-frame overhead of calling controllers.
+
+Compares the compiled controller schedule used by
+VisionEgg.FlowControl.Presentation with the previous dispatcher,
+which re-tested the eval_frequency and temporal_variables flags of
+every controller on every frame, and one FunctionController per
+stimulus with a single BatchController.  No OpenGL window is opened.
+"""
+
+import VisionEgg
+import VisionEgg.Core
+import VisionEgg.FlowControl
+import numpy
+from VisionEgg.FlowControl import Presentation, FunctionController, \
+     BatchController, ConstantController, EVERY_FRAME, TRANSITIONS, ONCE, NOT_DURING_GO, \
+     NOT_BETWEEN_GO, TIME_SEC_ABSOLUTE, TIME_SEC_SINCE_GO, FRAMES_ABSOLUTE, \
+     FRAMES_SINCE_GO
+
+def legacy_call_controllers(self, go_started=None, doing_transition=None):
+    """The dispatcher used by Presentation before controller schedules."""
+    done_once = []
+    for (parameters_instance, parameter_name, controller) in self.controllers:
+        evaluate = 0
+        if controller.eval_frequency & ONCE:
+            evaluate = 1
+            done_once.append(controller)
+        elif doing_transition and (controller.eval_frequency & TRANSITIONS):
+            evaluate = 1
+        elif controller.eval_frequency & EVERY_FRAME:
+            evaluate = 1
+
+        if evaluate:
+            if controller.temporal_variables & TIME_SEC_ABSOLUTE:
+                controller.time_sec_absolute = self.time_sec_absolute
+            if controller.temporal_variables & FRAMES_ABSOLUTE:
+                controller.frames_absolute = self.frames_absolute
+
+            if go_started:
+                if not (controller.eval_frequency & NOT_DURING_GO):
+                    if controller.temporal_variables & TIME_SEC_SINCE_GO:
+                        controller.time_sec_since_go = self.time_sec_since_go
+                    if controller.temporal_variables & FRAMES_SINCE_GO:
+                        controller.frames_since_go = self.frames_since_go
+                    result = controller.during_go_eval()
+                    if parameter_name is not None:
+                        setattr(parameters_instance, parameter_name, result)
+            else:
+                if not (controller.eval_frequency & NOT_BETWEEN_GO):
+                    if controller.temporal_variables & TIME_SEC_SINCE_GO:
+                        controller.time_sec_since_go = None
+                    if controller.temporal_variables & FRAMES_SINCE_GO:
+                        controller.frames_since_go = None
+                    result = controller.between_go_eval()
+                    if parameter_name is not None:
+                        setattr(parameters_instance, parameter_name, result)
+
+    for controller in done_once:
+        controller.eval_frequency = controller.eval_frequency & ~ONCE
+
+def make_presentation(num_controllers):
+    """Mix of per-frame, transition-only and constant controllers."""
+    p = Presentation(go_duration=('forever',))
+    p.time_sec_absolute = 0.0
+    p.time_sec_since_go = 0.0
+    p.frames_since_go = 0
+    for i in range(num_controllers):
+        stimulus = VisionEgg.Core.FixationSpot()
+        kind = i % 4
+        if kind == 0:
+            controller = FunctionController(
+                during_go_func = lambda t: (t, t),
+                return_type = VisionEgg.ParameterTypes.Sequence2(VisionEgg.ParameterTypes.Real))
+            p.add_controller(stimulus,'position',controller)
+        elif kind == 1:
+            controller = FunctionController(
+                during_go_func = lambda f: f % 2 == 0,
+                temporal_variables = FRAMES_SINCE_GO,
+                return_type = VisionEgg.ParameterTypes.Boolean)
+            p.add_controller(stimulus,'on',controller)
+        elif kind == 2:
+            controller = FunctionController(
+                during_go_func = lambda t_abs: (t_abs, 1.0, 1.0),
+                temporal_variables = TIME_SEC_ABSOLUTE,
+                eval_frequency = TRANSITIONS,
+                return_type = VisionEgg.ParameterTypes.Sequence3(VisionEgg.ParameterTypes.Real))
+            p.add_controller(stimulus,'color',controller)
+        else:
+            controller = ConstantController(during_go_value=(4.0,4.0))
+            p.add_controller(stimulus,'size',controller)
+    return p
+
+def time_frames(call, p, num_frames):
+    start = VisionEgg.true_time_func()
+    for frame in xrange(num_frames):
+        p.time_sec_absolute = p.time_sec_since_go = frame/60.0
+        p.frames_absolute = p.frames_since_go = frame
+        call(p, go_started=1, doing_transition=0)
+    stop = VisionEgg.true_time_func()
+    return (stop-start)/num_frames
+
+def make_batch_presentations(num_stimuli):
+    """One controller per stimulus vs. one BatchController."""
+    stimuli = [VisionEgg.Core.FixationSpot() for i in range(num_stimuli)]
+    offsets = numpy.arange(num_stimuli)*10.0
+    single = Presentation(go_duration=('forever',))
+    for i in range(num_stimuli):
+        controller = FunctionController(
+            during_go_func = lambda t, x=offsets[i]: (x+t, 100.0),
+            return_type = VisionEgg.ParameterTypes.Sequence2(VisionEgg.ParameterTypes.Real))
+        single.add_controller(stimuli[i],'position',controller)
+    batch = Presentation(go_duration=('forever',))
+    positions = numpy.empty((num_stimuli,2))
+    positions[:,1] = 100.0
+    def batch_func(t):
+        positions[:,0] = offsets+t
+        return positions
+    controller = BatchController(
+        targets = [(stimulus,'position') for stimulus in stimuli],
+        during_go_func = batch_func)
+    batch.add_controller(None,None,controller)
+    for p in (single,batch):
+        p.time_sec_absolute = 0.0
+    return single, batch
+
+def main():
+    scheduled_call = Presentation._Presentation__call_controllers
+    print "%12s %18s %18s %8s"%("controllers","legacy (usec/frame)",
+                                "schedule (usec/frame)","speedup")
+    for num_controllers in [10, 100, 1000]:
+        num_frames = max(100, 100000//num_controllers)
+        p = make_presentation(num_controllers)
+        # warm up both paths (this also builds the schedule once)
+        time_frames(legacy_call_controllers, p, 10)
+        time_frames(scheduled_call, p, 10)
+        legacy = time_frames(legacy_call_controllers, p, num_frames)
+        scheduled = time_frames(scheduled_call, p, num_frames)
+        print "%12d %18.1f %18.1f %7.2fx"%(num_controllers,
+                                           legacy*1e6,
+                                           scheduled*1e6,
+                                           legacy/scheduled)
+    print
+    print "%12s %18s %18s %8s"%("stimuli","single (usec/frame)",
+                                "batch (usec/frame)","speedup")
+    for num_stimuli in [16, 64, 256]:
+        num_frames = max(100, 100000//num_stimuli)
+        single, batch = make_batch_presentations(num_stimuli)
+        time_frames(scheduled_call, single, 10)
+        time_frames(scheduled_call, batch, 10)
+        single_time = time_frames(scheduled_call, single, num_frames)
+        batch_time = time_frames(scheduled_call, batch, num_frames)
+        print "%12d %18.1f %18.1f %7.2fx"%(num_stimuli,
+                                           single_time*1e6,
+                                           batch_time*1e6,
+                                           single_time/batch_time)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""Measure the time to decode a set of image files for textures.
+
+Compares decoding the files one after the other with PIL, as
+Texture(filename) does when loaded, with load_texture_files() in
+threads, in processes, and from its texel cache.  The image files
+and the cache are written to a temporary directory.  Does not open
+an OpenGL window.
+"""
+
+import VisionEgg
+import VisionEgg.Textures
+import Image, ImageDraw
+import numpy
+import os, shutil, tempfile
+
+num_images = 500
+image_size = (512,512)
+
+def make_images(directory):
+    filenames = []
+    for i in range(num_images):
+        texels = numpy.random.randint(0,256,(image_size[1]//8,image_size[0]//8,3))
+        image = Image.fromstring('RGB',(image_size[0]//8,image_size[1]//8),
+                                 texels.astype(numpy.uint8).tostring())
+        image = image.resize(image_size,Image.BILINEAR)
+        filenames.append(os.path.join(directory,'image%04d.jpg'%i))
+        image.save(filenames[-1],quality=90)
+    return filenames
+
+def serial_decode(filenames):
+    for filename in filenames:
+        VisionEgg.Textures.Texture(filename).get_texels_as_array()
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = make_images(directory)
+        cache_dir = os.path.join(directory,'cache')
+        runs = [
+            ('serial PIL decode', lambda: serial_decode(filenames)),
+            ('threads', lambda: VisionEgg.Textures.load_texture_files(filenames)),
+            ('processes', lambda: VisionEgg.Textures.load_texture_files(
+                filenames,use_processes=True)),
+            ('threads, filling cache', lambda: VisionEgg.Textures.load_texture_files(
+                filenames,cache_dir=cache_dir)),
+            ('from cache', lambda: VisionEgg.Textures.load_texture_files(
+                filenames,cache_dir=cache_dir)),
+            ]
+        print "%d %dx%d JPEG files"%(num_images,image_size[0],image_size[1])
+        serial_time = None
+        for name, func in runs:
+            start = VisionEgg.true_time_func()
+            func()
+            seconds = VisionEgg.true_time_func()-start
+            if serial_time is None:
+                serial_time = seconds
+            print "%24s %8.2f sec %7.1fx"%(name,seconds,serial_time/seconds)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""Measure the time to send 1920x1080 RGBA texel data to OpenGL.
+
+Compares the previous upload code, which converted texel data to a
+Python string (and padded it to a power of 2 size for
+Texture.load()), with passing the memory of arrays and pygame
+surfaces to OpenGL in place.  Opens an OpenGL window.
+"""
+
+import VisionEgg
+import VisionEgg.Core
+import VisionEgg.Textures
+import VisionEgg.GL as gl
+import numpy
+import pygame
+
+width, height = 1920, 1080
+width_pow2, height_pow2 = 2048, 2048
+
+def legacy_put_sub_image(texture_object, texels):
+    """put_sub_image() before texel data was read in place."""
+    raw_data = texels.astype(numpy.uint8).tostring()
+    gl.glBindTexture(gl.GL_TEXTURE_2D, texture_object.gl_id)
+    gl.glTexSubImage2D(gl.GL_TEXTURE_2D,0,0,0,width,height,
+                       gl.GL_RGBA,gl.GL_UNSIGNED_BYTE,raw_data)
+
+def legacy_load(texture_object, texels):
+    """Texture.load() of an array before texel data was read in place."""
+    buffer = numpy.zeros((height_pow2,width_pow2,4),dtype=texels.dtype)
+    buffer[0:height,0:width,:] = texels
+    raw_data = buffer.astype(numpy.uint8).tostring()
+    gl.glBindTexture(gl.GL_TEXTURE_2D, texture_object.gl_id)
+    gl.glTexImage2D(gl.GL_TEXTURE_2D,0,gl.GL_RGBA,width_pow2,height_pow2,0,
+                    gl.GL_RGBA,gl.GL_UNSIGNED_BYTE,raw_data)
+
+def legacy_load_surface(texture_object, surface):
+    """Texture.load() of a pygame surface before it was read in place."""
+    buffer = pygame.surface.Surface((width_pow2,height_pow2),
+                                    surface.get_flags(),
+                                    surface.get_bitsize())
+    buffer.blit(surface,(0,height_pow2-height))
+    raw_data = pygame.image.tostring(buffer,'RGBA',1)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, texture_object.gl_id)
+    gl.glTexImage2D(gl.GL_TEXTURE_2D,0,gl.GL_RGBA,width_pow2,height_pow2,0,
+                    gl.GL_RGBA,gl.GL_UNSIGNED_BYTE,raw_data)
+
+def time_uploads(func, num_uploads):
+    func() # warm up
+    gl.glFinish()
+    start = VisionEgg.true_time_func()
+    for i in xrange(num_uploads):
+        func()
+    gl.glFinish()
+    stop = VisionEgg.true_time_func()
+    return (stop-start)/num_uploads
+
+def main():
+    screen = VisionEgg.Core.get_default_screen()
+    texels = numpy.random.randint(0,256,(height,width,4)).astype(numpy.uint8)
+    surface = pygame.surface.Surface((width,height),pygame.SRCALPHA,32)
+    texture_object = VisionEgg.Textures.TextureObject(dimensions=2)
+    texture_object.put_new_image(numpy.zeros((height_pow2,width_pow2,4),numpy.uint8),
+                                 internal_format=gl.GL_RGBA)
+    texture = VisionEgg.Textures.Texture(texels)
+    surface_texture = VisionEgg.Textures.Texture(surface)
+
+    def in_place_put_sub_image():
+        texture_object.put_sub_image(texels)
+    def in_place_load():
+        texture.load(texture_object,build_mipmaps=False,internal_format=gl.GL_RGBA)
+    def in_place_load_surface():
+        surface_texture.load(texture_object,build_mipmaps=False,internal_format=gl.GL_RGBA)
+
+    num_uploads = 50
+    print "%28s %14s %14s %8s"%("1920x1080 RGBA upload","legacy (msec)",
+                                "in place (msec)","speedup")
+    for name, legacy, in_place in [
+        ('put_sub_image(array)',
+         lambda: legacy_put_sub_image(texture_object,texels),
+         in_place_put_sub_image),
+        ('Texture(array).load()',
+         lambda: legacy_load(texture_object,texels),
+         in_place_load),
+        ('Texture(surface).load()',
+         lambda: legacy_load_surface(texture_object,surface),
+         in_place_load_surface),
+        ]:
+        legacy_time = time_uploads(legacy,num_uploads)
+        in_place_time = time_uploads(in_place,num_uploads)
+        print "%28s %14.2f %14.2f %7.2fx"%(name,
+                                            legacy_time*1e3,
+                                            in_place_time*1e3,
+                                            legacy_time/in_place_time)
+
+if __name__ == '__main__':
+    main()
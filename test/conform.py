@@ -60,21 +60,28 @@ class VETestCase(unittest.TestCase):
                      'bgcolor'       : (0.0, 0.0, 1.0),
                      'sync_swap'     : True,
                      }
-        try:
-            self.screen = VisionEgg.Core.Screen( **kw_params )
-        except Exception, x:
+        if VisionEgg.config.VISIONEGG_OFFSCREEN_BACKEND.lower() != 'none':
+            # no display (e.g. VISIONEGG_OFFSCREEN_BACKEND=egl)
+            self.screen = VisionEgg.Core.OffscreenScreen(size=kw_params['size'],
+                                                         bgcolor=kw_params['bgcolor'])
+        else:
             try:
-                kw_params['preferred_bpp'] = 24
                 self.screen = VisionEgg.Core.Screen( **kw_params )
             except Exception, x:
-                kw_params['preferred_bpp'] = 0
-                self.screen = VisionEgg.Core.Screen( **kw_params )
+                try:
+                    kw_params['preferred_bpp'] = 24
+                    self.screen = VisionEgg.Core.Screen( **kw_params )
+                except Exception, x:
+                    kw_params['preferred_bpp'] = 0
+                    self.screen = VisionEgg.Core.Screen( **kw_params )
         self.screen.clear()
         VisionEgg.Core.swap_buffers()
         self.ortho_viewport = VisionEgg.Core.Viewport( screen = self.screen )
         
     def tearDown(self):
         VisionEgg.Core.swap_buffers() # just for a brief flash...
+        if isinstance(self.screen, VisionEgg.Core.OffscreenScreen):
+            self.screen.close()
         del self.screen
 
     def pickle_test(self, pickleable):
@@ -386,6 +393,103 @@ class VETestCase(unittest.TestCase):
         p.parameters.warn_longest_frame_threshold = orig_threshold
         self.failUnless(p.were_frames_dropped_in_last_go_loop(),'missed simulated dropped frame')
 
+    def test_presentation_controller_schedule(self):
+        p = VisionEgg.FlowControl.Presentation(go_duration=(3,'frames'))
+        calls = []
+        every_frame = VisionEgg.FlowControl.FunctionController(
+            during_go_func = lambda f: calls.append(('every',f)),
+            temporal_variables = VisionEgg.FlowControl.FRAMES_SINCE_GO,
+            eval_frequency = VisionEgg.FlowControl.EVERY_FRAME,
+            return_type = VisionEgg.ParameterTypes.get_type(None))
+        once = VisionEgg.FlowControl.FunctionController(
+            during_go_func = lambda t: calls.append(('once',t)),
+            eval_frequency = VisionEgg.FlowControl.ONCE,
+            return_type = VisionEgg.ParameterTypes.get_type(None))
+        p.add_controller(None,None,every_frame)
+        p.add_controller(None,None,once)
+        p.go()
+        self.failUnless(calls.count(('once',0.0)) == 1,'ONCE controller not evaluated exactly once')
+        self.failUnless([c for c in calls if c[0]=='every'] ==
+                        [('every',0),('every',0),('every',1),('every',2)],
+                        'EVERY_FRAME controller not evaluated with frame numbers')
+        del calls[:]
+        once.evaluate_now()
+        p.go()
+        self.failUnless(len([c for c in calls if c[0]=='once']) == 1,'evaluate_now() ignored by controller schedule')
+        p.remove_controller(None,None,once)
+        p.remove_controller(None,None,every_frame)
+        del calls[:]
+        p.go()
+        self.failUnless(calls == [],'removed controllers still evaluated')
+
+    def test_presentation_precompute_timelines(self):
+        p = VisionEgg.FlowControl.Presentation(go_duration=(5,'frames'),
+                                               precompute_timelines=True)
+        spot = VisionEgg.Core.FixationSpot()
+        position = VisionEgg.FlowControl.FunctionController(
+            during_go_func = lambda f: (f*2.0, 1.0),
+            temporal_variables = VisionEgg.FlowControl.FRAMES_SINCE_GO)
+        on = VisionEgg.FlowControl.EvalStringController(
+            during_go_eval_string = "f < 2",
+            temporal_variables = VisionEgg.FlowControl.FRAMES_SINCE_GO)
+        size = VisionEgg.FlowControl.FunctionController(
+            during_go_func = lambda t_abs: (4.0, 4.0),
+            temporal_variables = VisionEgg.FlowControl.TIME_SEC_ABSOLUTE)
+        p.add_controller(spot,'position',position)
+        p.add_controller(spot,'on',on)
+        p.add_controller(spot,'size',size)
+        p.compute_timelines()
+        timeline = p.get_timeline(position)
+        self.failUnless(timeline.vectorized,'FunctionController not vectorized')
+        self.failUnless(timeline.values.shape == (5,2),'wrong timeline shape')
+        self.failUnless(tuple(timeline.values[3]) == (6.0,1.0),'wrong timeline value')
+        self.failUnless(p.get_timeline(size) is None,'controller using t_abs sampled')
+        p.go()
+        self.failUnless(spot.parameters.position == (8.0,1.0),'timeline not used in go loop')
+        self.failUnless(spot.parameters.on is False,'timeline not used in go loop')
+
+    def test_presentation_render_movie_frames_divided(self):
+        spot = VisionEgg.Core.FixationSpot()
+        viewport = VisionEgg.Core.Viewport(screen=self.screen,
+                                           stimuli=[spot])
+        p = VisionEgg.FlowControl.Presentation(viewports=[viewport],
+                                               go_duration=(9,'frames'))
+        p.add_controller(spot,'position',VisionEgg.FlowControl.FunctionController(
+            during_go_func = lambda f: (f*10.0, 20.0),
+            temporal_variables = VisionEgg.FlowControl.FRAMES_SINCE_GO,
+            eval_frame_divisor = 3,
+            eval_frame_phase = 1))
+        p.render_movie_frames(range(3)) # last evaluated at frame 1
+        # a chunk starting off-phase, as in export_movie_parallel()
+        p.render_movie_frames([6])
+        self.failUnless(tuple(spot.parameters.position) == (40.0, 20.0),
+                        'divided controller not evaluated at its last due frame')
+        p.render_movie_frames([7,8])
+        self.failUnless(tuple(spot.parameters.position) == (70.0, 20.0),
+                        'divided controller not evaluated on its frame')
+
+    def test_presentation_frame_telemetry_no_viewports(self):
+        import numpy
+        p = VisionEgg.FlowControl.Presentation(go_duration=(3,'frames'),
+                                               record_frame_telemetry=True)
+        p.go()
+        durations = p.get_frame_telemetry().get_durations()
+        self.failUnless(len(durations) == 3,'wrong number of frames recorded')
+        self.failIf(numpy.any(numpy.isnan(durations['swap'])),
+                    'swap duration unknown without viewports')
+
+    def test_presentation_frame_info_copies(self):
+        p = VisionEgg.FlowControl.Presentation(go_duration=(1,'frames'))
+        spot = VisionEgg.Core.FixationSpot()
+        position = [1.0, 2.0]
+        p.add_controller(spot,'position',
+                         VisionEgg.FlowControl.ConstantController(during_go_value=position))
+        p.go()
+        info = p.get_frame_info()
+        position[0] = 5.0 # changed in place, as by a controller
+        self.failUnless(info['parameters']['0.position'] == [1.0, 2.0],
+                        'frame info not copied')
+
     def test_core_screen_query_refresh_rate(self):
         fps = self.screen.query_refresh_rate()
 
@@ -605,7 +709,491 @@ class VETestCase(unittest.TestCase):
         abs_diff = sum(abs(Numeric.ravel(orig_test) - Numeric.ravel(result_test)))
         
         self.failUnless(abs_diff == 0,'exact texture reproduction with Numeric RGBA textures failed')
-        
+
+    def test_textures_texture_manager(self):
+        manager = VisionEgg.Textures.texture_manager
+        old_budget = manager.budget_bytes
+        textures = []
+        for i in range(4):
+            orig = Numeric.zeros((64,64,3),Numeric.UnsignedInt8)
+            orig[:,:,i%3] = 255
+            textures.append(VisionEgg.Textures.Texture(orig))
+        stimuli = []
+        for texture in textures + textures[:1]:
+            stimuli.append(VisionEgg.Textures.TextureStimulus(
+                texture = texture,
+                position = (0,0),
+                anchor = 'lowerleft',
+                mipmaps_enabled = False,
+                texture_min_filter = gl.GL_LINEAR))
+        try:
+            self.failUnless(stimuli[0].texture_object is stimuli[4].texture_object,
+                            'same texture not shared')
+            num_bytes = manager.get_resident_bytes()
+            manager.set_budget_bytes(num_bytes - 1)
+            self.failUnless(manager.get_resident_bytes() < num_bytes,
+                            'nothing evicted')
+            for stimulus in stimuli:
+                self.ortho_viewport.parameters.stimuli = [ stimulus ]
+                self.ortho_viewport.draw()
+                VisionEgg.Core.swap_buffers()
+            self.ortho_viewport.parameters.stimuli = [ stimuli[1] ]
+            self.ortho_viewport.draw()
+            result = self.screen.get_framebuffer_as_array(format=gl.GL_RGB)
+            self.failUnless(result[32,32,1] == 255 and result[32,32,0] == 0,
+                            'evicted texture not reloaded')
+        finally:
+            manager.set_budget_bytes(old_budget)
+
+    def test_textures_display_list_cleanup(self):
+        manager = VisionEgg.Textures.texture_manager
+        num_display_lists = manager.num_display_lists
+        grid = VisionEgg.SphereMap.AzElGrid()
+        self.failUnless(manager.num_display_lists == num_display_lists + 2,
+                        'display lists not counted')
+        del grid
+        manager.delete_display_lists(None) # as if __init__ failed
+        self.failUnless(manager.num_display_lists == num_display_lists,
+                        'display lists not freed')
+
+    def test_textures_stimulus_in_cycle_released(self):
+        import gc
+        manager = VisionEgg.Textures.texture_manager
+        orig = Numeric.zeros((16,16,3),Numeric.UnsignedInt8)
+        stimulus = VisionEgg.Textures.TextureStimulus(
+            texture = VisionEgg.Textures.Texture(orig),
+            mipmaps_enabled = False,
+            texture_min_filter = gl.GL_LINEAR)
+        num_textures = manager.get_stats()['num_in_use']
+        stimulus.self_reference = stimulus # a reference cycle
+        del stimulus
+        gc.collect()
+        self.failUnless(gc.garbage == [],'stimulus in a cycle not collectable')
+        self.failUnless(manager.get_stats()['num_in_use'] == num_textures-1,
+                        'texture of collected stimulus not released')
+
+    def test_textures_pixel_buffers_not_shared(self):
+        texture = VisionEgg.Textures.Texture(Numeric.zeros((16,16,3),Numeric.UnsignedInt8))
+        stimuli = [VisionEgg.Textures.TextureStimulus(
+            texture = texture,
+            mipmaps_enabled = False,
+            texture_min_filter = gl.GL_LINEAR,
+            num_pixel_buffers = num_pixel_buffers) for num_pixel_buffers in (0,2,2)]
+        self.failUnless(stimuli[0].texture_object is not stimuli[1].texture_object,
+                        'texture object shared despite different pixel buffers')
+        self.failUnless(stimuli[1].texture_object is stimuli[2].texture_object,
+                        'texture object not shared')
+        self.failUnless(stimuli[0].texture_object.get_num_pixel_buffers() == 0,
+                        'pixel buffers set on shared texture object')
+
+    def test_textures_pixel_buffer_streaming(self):
+        orig = Numeric.zeros((64,64,3),Numeric.UnsignedInt8)
+        texture = VisionEgg.Textures.Texture(orig)
+        stimulus = VisionEgg.Textures.TextureStimulus(
+            texture = texture,
+            position = (0,0),
+            anchor = 'lowerleft',
+            mipmaps_enabled = False,
+            texture_min_filter = gl.GL_LINEAR,
+            num_pixel_buffers = 2)
+        self.ortho_viewport.parameters.stimuli = [ stimulus ]
+        texture_object = stimulus.texture_object
+        for i in range(3):
+            new = Numeric.zeros((64,64,3),Numeric.UnsignedInt8)
+            new[:,:,i] = 255
+            texture_object.put_sub_image(new)
+            self.ortho_viewport.draw()
+            result = self.screen.get_framebuffer_as_array(format=gl.GL_RGB)
+            self.failUnless(result[32,32,i] == 255 and result[32,32,(i+1)%3] == 0,
+                            'streamed texel data not drawn')
+            VisionEgg.Core.swap_buffers()
+        mapped = texture_object.map_sub_image_buffer(32,32,gl.GL_RGB)
+        mapped[:] = 255
+        texture_object.put_mapped_sub_image(offset_tuple=(16,16))
+        self.ortho_viewport.draw()
+        result = self.screen.get_framebuffer_as_array(format=gl.GL_RGB)
+        self.failUnless(Numeric.alltrue(result[32,32,:] == 255),
+                        'mapped texel data not drawn')
+        self.failUnless(result[4,4,0] == 0 and result[4,4,2] == 255,
+                        'mapped texel data drawn at wrong offset')
+
+    def test_textures_image_sequence(self):
+        textures = []
+        for i in range(3):
+            orig = Numeric.zeros((64,64,3),Numeric.UnsignedInt8)
+            orig[:,:,i] = 255
+            textures.append(VisionEgg.Textures.Texture(orig))
+        stimulus = VisionEgg.Textures.ImageSequenceStimulus(
+            textures = textures,
+            position = (0,0),
+            anchor = 'lowerleft',
+            mipmaps_enabled = False,
+            texture_min_filter = gl.GL_LINEAR)
+        self.ortho_viewport.parameters.stimuli = [ stimulus ]
+        for i in [2,0,1]:
+            stimulus.parameters.frame_index = i
+            self.ortho_viewport.draw()
+            result = self.screen.get_framebuffer_as_array(format=gl.GL_RGB)
+            self.failUnless(result[32,32,i] == 255 and result[32,32,(i+1)%3] == 0,
+                            'wrong image drawn for frame_index')
+        del stimulus
+        self.ortho_viewport.parameters.stimuli = []
+
+        small = VisionEgg.Textures.Texture(Numeric.zeros((32,32,3),Numeric.UnsignedInt8))
+        self.failUnlessRaises(ValueError,
+                              VisionEgg.Textures.ImageSequenceStimulus,
+                              textures = textures + [small])
+
+        manager = VisionEgg.Textures.texture_manager
+        old_budget = manager.budget_bytes
+        manager.set_budget_bytes(64*64*3*2)
+        try:
+            self.failUnlessRaises(VisionEgg.Textures.TextureTooLargeError,
+                                  VisionEgg.Textures.ImageSequenceStimulus,
+                                  textures = textures,
+                                  mipmaps_enabled = False,
+                                  texture_min_filter = gl.GL_LINEAR)
+            self.failUnless(manager.get_pinned_bytes() == 0,
+                            'textures still pinned')
+        finally:
+            manager.set_budget_bytes(old_budget)
+
+    def test_textures_in_place_loading(self):
+        import numpy
+        import pygame
+        orig = numpy.zeros((50,70,3),numpy.uint8)
+        orig[:25,:,0] = 255 # bottom half red
+        orig[25:,:,1] = 255 # top half green
+        padded = numpy.zeros((50,72,3),numpy.uint8)
+        padded[:,:70,:] = orig
+        top_row_first = orig[::-1].copy()
+        surface = pygame.surface.Surface((70,50),0,24)
+        surface.fill((0,255,0),(0,0,70,25))
+        surface.fill((255,0,0),(0,25,70,25))
+        for texels in [orig,
+                       padded[:,:70,:],
+                       top_row_first[::-1],
+                       VisionEgg.Textures.texels_from_buffer(top_row_first.tostring(),
+                                                             (70,50),
+                                                             top_row_first=True),
+                       surface]:
+            stimulus = VisionEgg.Textures.TextureStimulus(
+                texture = VisionEgg.Textures.Texture(texels),
+                position = (0,0),
+                anchor = 'lowerleft',
+                mipmaps_enabled = False,
+                texture_min_filter = gl.GL_LINEAR)
+            self.ortho_viewport.parameters.stimuli = [ stimulus ]
+            self.ortho_viewport.draw()
+            result = self.screen.get_framebuffer_as_array(format=gl.GL_RGB)
+            self.failUnless(result[10,35,0] == 255 and result[10,35,1] == 0,
+                            'bottom of %s texels not drawn at bottom'%type(texels))
+            self.failUnless(result[40,35,0] == 0 and result[40,35,1] == 255,
+                            'top of %s texels not drawn at top'%type(texels))
+        self.ortho_viewport.parameters.stimuli = []
+
+    def test_textures_surface_put_sub_image(self):
+        import pygame
+        # as in demo/mpeg.py: load a surface, then update it in place
+        surface = pygame.surface.Surface((70,50),0,24)
+        surface.fill((0,255,0),(0,0,70,25))
+        surface.fill((255,0,0),(0,25,70,25))
+        texture = VisionEgg.Textures.Texture(surface)
+        stimulus = VisionEgg.Textures.TextureStimulus(
+            texture = texture,
+            position = (0,0),
+            anchor = 'lowerleft',
+            mipmaps_enabled = False,
+            texture_min_filter = gl.GL_LINEAR)
+        surface.fill((0,0,255),(0,0,70,25)) # top half blue
+        texture.get_texture_object().put_sub_image(surface)
+        self.ortho_viewport.parameters.stimuli = [ stimulus ]
+        self.ortho_viewport.draw()
+        result = self.screen.get_framebuffer_as_array(format=gl.GL_RGB)
+        self.failUnless(result[10,35,0] == 255 and result[10,35,2] == 0,
+                        'bottom of surface not drawn at bottom after put_sub_image')
+        self.failUnless(result[40,35,0] == 0 and result[40,35,2] == 255,
+                        'top of surface not drawn at top after put_sub_image')
+        self.ortho_viewport.parameters.stimuli = []
+
+    def test_textures_upload_format(self):
+        self.failUnless(VisionEgg.Textures.upload_format is not None,
+                        'texel upload format not chosen with the screen')
+        old_upload_format = VisionEgg.Textures.upload_format
+        bound = VisionEgg.Textures.TextureObject(dimensions=2)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, bound.gl_id)
+        results = VisionEgg.Textures.probe_upload_formats(size=(64,64),num_uploads=2,
+                                                          num_rounds=2)
+        self.failUnless(gl.glGetIntegerv(gl.GL_TEXTURE_BINDING_2D) == bound.gl_id,
+                        'texture binding not restored')
+        self.failUnless(VisionEgg.Textures.upload_format == results[0][1],
+                        'fastest texel upload format not used')
+        orig = Numeric.zeros((64,64,3),Numeric.UnsignedInt8)
+        orig[:,:,0] = 255
+        orig[:,:,2] = 128
+        try:
+            for seconds, name in results:
+                VisionEgg.Textures.upload_format = name
+                stimulus = VisionEgg.Textures.TextureStimulus(
+                    texture = VisionEgg.Textures.Texture(orig),
+                    position = (0,0),
+                    anchor = 'lowerleft',
+                    mipmaps_enabled = False,
+                    texture_min_filter = gl.GL_LINEAR)
+                self.ortho_viewport.parameters.stimuli = [ stimulus ]
+                self.ortho_viewport.draw()
+                result = self.screen.get_framebuffer_as_array(format=gl.GL_RGB)
+                self.failUnless(result[32,32,0] == 255 and result[32,32,1] == 0 and
+                                abs(int(result[32,32,2])-128) <= 1,
+                                'wrong color with upload format %s'%name)
+                # converted once, then put with put_sub_image()
+                texture = VisionEgg.Textures.SubImageTexture((64,64))
+                texels, data_format, data_type = \
+                        VisionEgg.Textures.convert_texels_to_upload_format(orig)
+                texture.set_sub_image(texels,data_format=data_format,data_type=data_type)
+                stimulus.parameters.texture = texture
+                self.ortho_viewport.draw()
+                result = self.screen.get_framebuffer_as_array(format=gl.GL_RGB)
+                self.failUnless(result[32,32,0] == 255 and result[32,32,1] == 0 and
+                                abs(int(result[32,32,2])-128) <= 1,
+                                'wrong color of sub image with upload format %s'%name)
+        finally:
+            VisionEgg.Textures.upload_format = old_upload_format
+            self.ortho_viewport.parameters.stimuli = []
+
+    def test_textures_non_power_of_2(self):
+        orig = Numeric.zeros((60,100,3),Numeric.UnsignedInt8)
+        orig[:,:50,0] = 255 # left half red
+        orig[:,50:,1] = 255 # right half green
+        old_supported = VisionEgg.Textures.non_power_of_2_supported
+        manager = VisionEgg.Textures.texture_manager
+        try:
+            for supported in (True,False):
+                if supported and not VisionEgg.Textures._check_non_power_of_2():
+                    continue
+                VisionEgg.Textures.non_power_of_2_supported = supported
+                texture = VisionEgg.Textures.Texture(orig)
+                stimulus = VisionEgg.Textures.TextureStimulus(
+                    texture = texture,
+                    position = (0,0),
+                    anchor = 'lowerleft',
+                    mipmaps_enabled = False,
+                    texture_min_filter = gl.GL_NEAREST,
+                    texture_mag_filter = gl.GL_NEAREST)
+                if supported:
+                    self.failUnless(texture.buf_rf == 1.0 and texture.buf_tf == 1.0,
+                                    'texture padded although not necessary')
+                    self.failUnless(manager.get_stats()['saved_bytes'] > 0,
+                                    'memory saved not reported')
+                else:
+                    self.failUnless(texture.buf_rf == 100/128.0 and
+                                    texture.buf_tf == 60/64.0,
+                                    'texture not padded to power of 2 size')
+                self.ortho_viewport.parameters.stimuli = [ stimulus ]
+                self.ortho_viewport.draw()
+                result = self.screen.get_framebuffer_as_array(format=gl.GL_RGB)
+                self.failUnless(tuple(result[30,10]) == (255,0,0) and
+                                tuple(result[30,90]) == (0,255,0),
+                                'wrong image (non power of 2 supported: %s)'%supported)
+                self.ortho_viewport.parameters.stimuli = []
+                del stimulus
+        finally:
+            VisionEgg.Textures.non_power_of_2_supported = old_supported
+            self.ortho_viewport.parameters.stimuli = []
+
+    def test_textures_numpy_mipmaps(self):
+        import numpy
+        orig = numpy.zeros((60,100,3),numpy.uint8)
+        orig[:,:,0] = 255
+        orig[:,:,2] = 128
+        orig[::2,::2,1] = 200 # average 50
+        levels = VisionEgg.Textures.make_mipmap_levels(orig)
+        self.failUnless([level.shape[:2] for level in levels] ==
+                        [(60,100),(30,50),(15,25),(7,12),(3,6),(1,3),(1,1)],
+                        'wrong mipmap level sizes')
+        self.failUnless(numpy.all(levels[1][:,:,1] == 50) and
+                        levels[1].dtype == numpy.uint8,
+                        'wrong mipmap level texels')
+        levels = VisionEgg.Textures.make_mipmap_levels(orig.astype(numpy.float32),
+                                                       filter='lanczos',
+                                                       round_up=True)
+        self.failUnless([level.shape[:2] for level in levels] ==
+                        [(60,100),(30,50),(15,25),(8,13),(4,7),(2,4),(1,2),(1,1)] and
+                        levels[-1].dtype == numpy.float32,
+                        'wrong rounded up mipmap levels')
+        texture = VisionEgg.Textures.Texture(orig.copy())
+        texture.make_half_size()
+        self.failUnless(texture.size == (50,30) and
+                        numpy.all(texture.texels[:,:,1] == 50),
+                        'wrong half size texture')
+
+        builders = ['box','lanczos']
+        if VisionEgg.Textures._get_generate_mipmap() is not None:
+            builders.append('opengl')
+        old_builder = VisionEgg.Textures.mipmap_builder
+        try:
+            for builder in builders:
+                VisionEgg.Textures.mipmap_builder = builder
+                stimulus = VisionEgg.Textures.TextureStimulus(
+                    texture = VisionEgg.Textures.Texture(orig),
+                    position = (0,0),
+                    anchor = 'lowerleft',
+                    size = (25,15), # drawn from mipmap level 2
+                    mipmaps_enabled = True,
+                    texture_min_filter = gl.GL_NEAREST_MIPMAP_NEAREST)
+                self.ortho_viewport.parameters.stimuli = [ stimulus ]
+                self.ortho_viewport.draw()
+                result = self.screen.get_framebuffer_as_array(format=gl.GL_RGB)
+                color = [int(c) for c in result[7,12]]
+                self.failUnless(color[0] == 255 and abs(color[1]-50) <= 2 and
+                                abs(color[2]-128) <= 1,
+                                'wrong mipmap color %s with builder %s'%(color,builder))
+                self.ortho_viewport.parameters.stimuli = []
+                del stimulus
+        finally:
+            VisionEgg.Textures.mipmap_builder = old_builder
+            self.ortho_viewport.parameters.stimuli = []
+
+    def test_textures_load_texture_files(self):
+        import numpy
+        import tempfile
+        import shutil
+        temp_dir = tempfile.mkdtemp()
+        try:
+            filenames = []
+            for i, mode in enumerate(('RGB','RGBA','L','RGB')):
+                image = Image.new(mode,(30+i,20))
+                draw = ImageDraw.Draw(image)
+                draw.rectangle((0,0,10,5),fill=255) # top left
+                filenames.append(os.path.join(temp_dir,'image%d.png'%i))
+                image.save(filenames[-1])
+            cache_dir = os.path.join(temp_dir,'cache')
+            cache_files = None
+            for i in range(2): # decode, then read the cache
+                textures = VisionEgg.Textures.load_texture_files(
+                    filenames, cache_dir=cache_dir, num_workers=2)
+                for filename, texture in zip(filenames,textures):
+                    expected = VisionEgg.Textures.Texture(filename).get_texels_as_array()
+                    self.failUnless(texture.texels.shape == expected.shape and
+                                    numpy.all(texture.texels == expected),
+                                    'wrong texels from %s'%filename)
+                    self.failUnless(isinstance(texture.texels,numpy.memmap),
+                                    'texel cache not used')
+                del textures, texture
+                files = [(name,os.stat(os.path.join(cache_dir,name)).st_mtime)
+                         for name in os.listdir(cache_dir)]
+                files.sort()
+                self.failUnless(len(files) == len(filenames),
+                                'wrong texel cache files')
+                self.failUnless(cache_files is None or files == cache_files,
+                                'texel cache files written again')
+                cache_files = files
+            textures = VisionEgg.Textures.load_texture_files(filenames, mode='RGBA')
+            self.failUnless([t.texels.shape[2] for t in textures] == [4]*len(filenames),
+                            'texels not converted to RGBA')
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_textures_dataset(self):
+        import numpy
+        import tempfile
+        import shutil
+        colors = [(255,0,0),(0,255,0),(0,0,255),(255,255,0)]
+        temp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(temp_dir,'images.npy')
+            image_dir = os.path.join(temp_dir,'images')
+            os.mkdir(image_dir)
+            images = numpy.lib.format.open_memmap(filename,mode='w+',dtype=numpy.uint8,
+                                                  shape=(len(colors),40,50,3))
+            for i, color in enumerate(colors):
+                images[i,:,:] = color
+                numpy.save(os.path.join(image_dir,'image%d.npy'%i),images[i])
+            del images
+            for source in (filename,image_dir):
+                dataset = VisionEgg.Textures.TextureDataset(source)
+                self.failUnless(len(dataset) == len(colors),'wrong number of images')
+                texture = dataset.get_texture(0)
+                stimulus = VisionEgg.Textures.TextureStimulus(
+                    texture = texture,
+                    position = (0,0),
+                    anchor = 'lowerleft',
+                    mipmaps_enabled = False,
+                    texture_min_filter = gl.GL_NEAREST)
+                self.ortho_viewport.parameters.stimuli = [ stimulus ]
+                for i in (0,2,1,3):
+                    texture.set_index(i,num_prefetch=2)
+                    self.ortho_viewport.draw()
+                    result = self.screen.get_framebuffer_as_array(format=gl.GL_RGB)
+                    self.failUnless(tuple(result[20,25]) == colors[i],
+                                    'wrong image %d from %s'%(i,source))
+                dataset.wait_prefetched()
+                self.failUnless(dataset.num_prefetched > 0,'images not prefetched')
+                dataset.close()
+                self.ortho_viewport.parameters.stimuli = []
+                del stimulus, texture, dataset
+        finally:
+            self.ortho_viewport.parameters.stimuli = []
+            shutil.rmtree(temp_dir)
+
+    def test_textures_mask2d_shared(self):
+        masks = [VisionEgg.Textures.Mask2D(function=function,
+                                           radius_parameter=20.0,
+                                           num_samples=(64,64))
+                 for function in ('circle','circle','hann','raised_cosine')]
+        self.failUnless(masks[0].texture_object is masks[1].texture_object,
+                        'identical masks do not share texture object')
+        self.failUnless(masks[1].texture_object is not masks[2].texture_object and
+                        masks[2].texture_object is not masks[3].texture_object,
+                        'different masks share texture object')
+        texels = VisionEgg.Textures.make_mask_texels('raised_cosine',20.0,(64,32),
+                                                     edge_fraction=0.5)
+        self.failUnless(texels.shape == (32,64) and texels[16,32] == 1.0 and
+                        texels[16,0] == 0.0 and 0.0 < texels[16,32+15] < 1.0,
+                        'wrong raised cosine mask')
+        orig = Numeric.zeros((64,64,3),Numeric.UnsignedInt8)
+        orig[:,:,0] = 255
+        try:
+            for mask in masks:
+                stimulus = VisionEgg.Textures.TextureStimulus(
+                    texture = VisionEgg.Textures.Texture(orig),
+                    mask = mask,
+                    position = (0,0),
+                    anchor = 'lowerleft',
+                    mipmaps_enabled = False,
+                    internal_format = gl.GL_RGBA)
+                self.ortho_viewport.parameters.stimuli = [ stimulus ]
+                self.ortho_viewport.draw()
+                result = self.screen.get_framebuffer_as_array(format=gl.GL_RGB)
+                self.failUnless(result[32,32,0] > 240 and result[2,2,0] == 0,
+                                'mask %s not applied'%mask.constant_parameters.function)
+        finally:
+            self.ortho_viewport.parameters.stimuli = []
+
+    def test_core_put_pixels(self):
+        import numpy
+        for num_pixel_buffers in (0,2):
+            stimulus = None
+            for color, size, position in [((255,0,0),(40,30),(0,0)),
+                                          ((0,255,0),(60,20),(10,10)),
+                                          ((0,0,255),(20,50),(5,0))]:
+                pixels = numpy.zeros((size[1],size[0],3),numpy.uint8)
+                pixels[:,:] = color
+                self.screen.clear()
+                self.screen.put_pixels(pixels,position=position,
+                                       num_pixel_buffers=num_pixel_buffers)
+                result = self.screen.get_framebuffer_as_array(format=gl.GL_RGB)
+                x, y = position
+                background = tuple(result[-1,-1])
+                self.failUnless(tuple(result[y+size[1]//2,x+size[0]//2]) == color and
+                                tuple(result[y+size[1]+2,x+size[0]//2]) == background and
+                                tuple(result[y+size[1]//2,x+size[0]+2]) == background,
+                                'wrong pixels %s at %s'%(color,position))
+                if stimulus is None:
+                    stimulus = self.screen._put_pixels_texture_stimulus
+                self.failUnless(self.screen._put_pixels_texture_stimulus is stimulus,
+                                'texture reallocated by put_pixels')
+
 def suite():
     ve_test_suite = unittest.TestSuite()
     ve_test_suite.addTest( VETestCase("test_feedback_mode") )
@@ -622,6 +1210,11 @@ def suite():
     ve_test_suite.addTest( VETestCase("test_presentation_go_duration") )
     ve_test_suite.addTest( VETestCase("test_presentation_go_not") )
     ve_test_suite.addTest( VETestCase("test_presentation_frame_drop_test") )
+    ve_test_suite.addTest( VETestCase("test_presentation_controller_schedule") )
+    ve_test_suite.addTest( VETestCase("test_presentation_precompute_timelines") )
+    ve_test_suite.addTest( VETestCase("test_presentation_render_movie_frames_divided") )
+    ve_test_suite.addTest( VETestCase("test_presentation_frame_telemetry_no_viewports") )
+    ve_test_suite.addTest( VETestCase("test_presentation_frame_info_copies") )
     ve_test_suite.addTest( VETestCase("test_core_refresh_rates_match") )
     ve_test_suite.addTest( VETestCase("test_core_screen_query_refresh_rate") )
     ve_test_suite.addTest( VETestCase("test_core_screen_measure_refresh_rate") )
@@ -642,6 +1235,21 @@ def suite():
     ve_test_suite.addTest( VETestCase("test_texture_stimulus_numpy_rgba") )
     ve_test_suite.addTest( VETestCase("test_texture_stimulus_pil_rgb") )
     ve_test_suite.addTest( VETestCase("test_texture_stimulus_pil_rgba") )
+    ve_test_suite.addTest( VETestCase("test_textures_texture_manager") )
+    ve_test_suite.addTest( VETestCase("test_textures_display_list_cleanup") )
+    ve_test_suite.addTest( VETestCase("test_textures_stimulus_in_cycle_released") )
+    ve_test_suite.addTest( VETestCase("test_textures_pixel_buffer_streaming") )
+    ve_test_suite.addTest( VETestCase("test_textures_pixel_buffers_not_shared") )
+    ve_test_suite.addTest( VETestCase("test_textures_image_sequence") )
+    ve_test_suite.addTest( VETestCase("test_textures_in_place_loading") )
+    ve_test_suite.addTest( VETestCase("test_textures_surface_put_sub_image") )
+    ve_test_suite.addTest( VETestCase("test_textures_upload_format") )
+    ve_test_suite.addTest( VETestCase("test_textures_non_power_of_2") )
+    ve_test_suite.addTest( VETestCase("test_textures_numpy_mipmaps") )
+    ve_test_suite.addTest( VETestCase("test_textures_load_texture_files") )
+    ve_test_suite.addTest( VETestCase("test_textures_dataset") )
+    ve_test_suite.addTest( VETestCase("test_textures_mask2d_shared") )
+    ve_test_suite.addTest( VETestCase("test_core_put_pixels") )
     
     return ve_test_suite
 